@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Per-target config overhead: the old re-read-and-literal_eval pattern
+    used inside the batch loop versus the cached Settings object.
+
+    Usage:  python benchmarks/bench_config.py [targets]
+"""
+
+import sys
+import ast
+import timeit
+import ConfigParser
+
+from ldap_target_ctl import settings as ltc_settings
+
+
+def legacy_lookup(config_file, pod, entity_number):
+    """ What add_batch_ldap_targets did for every line of the batch file:
+        two full config reads, each followed by a literal_eval.
+    """
+
+    config = ConfigParser.ConfigParser()
+    config.read(config_file)
+    beacons = ast.literal_eval(config.get('otes', 'beacons'))[pod]
+    config = ConfigParser.ConfigParser()
+    config.read(config_file)
+    entities = ast.literal_eval(config.get('otes', 'entities'))
+    return beacons, entities[entity_number]
+
+
+def cached_lookup(pod, entity_number):
+    """ The same lookup through the shared Settings object. """
+
+    settings = ltc_settings.get_settings()
+    return settings.beacons[pod], settings.entities[entity_number]
+
+
+def main(targets=5000):
+    settings = ltc_settings.get_settings()
+    pod = sorted(settings.beacons.keys())[0]
+    entity_number = sorted(settings.entities.keys())[0]
+
+    legacy = timeit.timeit(
+        lambda: legacy_lookup(settings.path, pod, entity_number),
+        number=targets)
+    cached = timeit.timeit(lambda: cached_lookup(pod, entity_number),
+                           number=targets)
+    # add_batch_ldap_targets fetches Settings once per run and indexes it
+    hoisted = timeit.timeit(
+        lambda: (settings.beacons[pod], settings.entities[entity_number]),
+        number=targets)
+
+    print 'config file: {}'.format(settings.path)
+    print 'targets:     {}'.format(targets)
+    print 'legacy:      {:10.3f} s total {:10.2f} us/target'.format(
+        legacy, legacy / targets * 1e6)
+    print 'cached:      {:10.3f} s total {:10.2f} us/target'.format(
+        cached, cached / targets * 1e6)
+    print 'hoisted:     {:10.3f} s total {:10.2f} us/target'.format(
+        hoisted, hoisted / targets * 1e6)
+    print 'speedup:     {:10.1f}x'.format(legacy / cached)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:2]]))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Batch throughput against the simulated OMS (--backend fake), for catching
+    performance regressions without a live OMS.  The fake OMS's latencies
+    are multiplied by scale (0 measures the tool's own overhead only).
+
+    Usage:  python benchmarks/bench_fake.py [targets] [jobs] [scale]
+"""
+
+import os
+import sys
+import shutil
+import timeit
+import tempfile
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import settings
+
+CONFIG = """[oem]
+url = https://localhost:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1', 'beacon_e2']}
+
+[inventory]
+path = inventory.db
+"""
+
+
+class Discard(object):
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def main(targets=10000, jobs=16, scale=0.01):
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        batch_file = os.path.join(directory, 'batch.txt')
+        with open(batch_file, 'w') as batch:
+            for number in range(targets):
+                batch.write('fake_ldap{}.example.com:3060:POD-E\n'.format(
+                    number))
+        os.chdir(directory)
+        settings.clear_settings()
+        oms = fake.FakeOMS(latency_scale=scale, seed=1)
+        fake.set_shared_oms(oms)
+
+        stdout, sys.stdout = sys.stdout, Discard()
+        try:
+            seconds = timeit.timeit(
+                lambda: ldap_target_ctl.add_batch_ldap_targets(
+                    batch_file, 'cn=otes_oem_auth', 'secret', 'cn=Users',
+                    'cn=otes_oem_auth', 'Taleo_Obiee_Auth', 'Production',
+                    11, 'OID', 'sysman', 'welcome1', jobs=jobs,
+                    backend='fake'), number=1)
+        finally:
+            sys.stdout = stdout
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    print 'targets:     {}'.format(targets)
+    print 'jobs:        {}'.format(jobs)
+    print 'scale:       {}'.format(scale)
+    print 'provisioned: {}'.format(len(oms.targets))
+    print 'emcli calls: {}'.format(sum(oms.calls.values()))
+    print 'elapsed:     {:10.2f} s'.format(seconds)
+    print 'throughput:  {:10.1f} targets/s'.format(targets / seconds)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[convert(arg) for convert, arg in
+                    zip((int, int, float), sys.argv[1:4])]))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Per-target cost of building the XML template with ElementTree versus
+    rendering the precompiled template.
+
+    Usage:  python benchmarks/bench_render.py [renders]
+"""
+
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+import ldap_target_ctl
+
+ARGS = ('cn=otes_oem_auth,cn=Users,dc=us,dc=oracle,dc=com', 'secret&pass',
+        'fake_ldap{}.example.com', '3060',
+        'cn=otes_oem_auth,cn=Users,dc=us,dc=oracle,dc=com',
+        'cn=otes_oem_auth', 'Taleo_Obiee_Auth')
+
+
+def main(renders=100000):
+    hosts = [ARGS[2].format(number) for number in range(renders)]
+
+    def per_target(render):
+        for host in hosts:
+            render(ARGS[0], ARGS[1], host, *ARGS[3:])
+
+    elementtree = timeit.timeit(
+        lambda: per_target(lambda *args: ET.tostring(
+            ldap_target_ctl.make_xml_template(*args))), number=1)
+    compiled = timeit.timeit(
+        lambda: per_target(ldap_target_ctl.render_xml_template), number=1)
+
+    print 'renders:     {}'.format(renders)
+    print 'elementtree: {:10.3f} s total {:10.2f} us/target'.format(
+        elementtree, elementtree / renders * 1e6)
+    print 'compiled:    {:10.3f} s total {:10.2f} us/target'.format(
+        compiled, compiled / renders * 1e6)
+    print 'speedup:     {:10.1f}x'.format(elementtree / compiled)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:2]]))
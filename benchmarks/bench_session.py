@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Per-verb latency of the spawn-per-call backend versus a persistent
+    emcli session, using the local stand-in emcli (fake_emcli.py).
+
+    Usage:  python benchmarks/bench_session.py [verbs]
+"""
+
+import os
+import sys
+import timeit
+
+from ldap_target_ctl import backends
+
+FAKE_EMCLI = '{} {}'.format(sys.executable,
+                            os.path.join(os.path.dirname(
+                                os.path.abspath(__file__)), 'fake_emcli.py'))
+
+
+def measure(emcli, verbs):
+    """ Returns seconds per create_group verb. """
+
+    seconds = timeit.timeit(lambda: emcli.run('create_group', name='OID'),
+                            number=verbs)
+    return seconds / verbs
+
+
+def main(verbs=20):
+    spawn = backends.SpawnEmcli('https://localhost:7799/em', 'sysman',
+                                'welcome1', FAKE_EMCLI)
+    session = backends.EmcliSession('https://localhost:7799/em', 'sysman',
+                                    'welcome1', FAKE_EMCLI)
+    spawn_latency = measure(spawn, verbs)
+    # The first session call pays the one-off process start
+    startup = timeit.timeit(session.login, number=1)
+    session_latency = measure(session, verbs)
+    session.logout()
+
+    print 'verbs:            {}'.format(verbs)
+    print 'spawn per verb:   {:10.2f} ms'.format(spawn_latency * 1e3)
+    print 'session start:    {:10.2f} ms (once)'.format(startup * 1e3)
+    print 'session per verb: {:10.2f} ms'.format(session_latency * 1e3)
+    print 'speedup:          {:10.1f}x'.format(spawn_latency /
+                                               session_latency)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:2]]))
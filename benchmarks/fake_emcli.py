@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Local stand-in for emcli, used by the benchmarks.  It simulates JVM
+    startup with a fixed delay per process and a small per-verb delay.
+
+        fake_emcli.py <verb> [-option=value ...]   one verb per process
+        fake_emcli.py @<script>                    script mode: runs script
+                                                   with verbs as globals
+
+    Environment:
+        FAKE_EMCLI_STARTUP - seconds per process start (default 0.5)
+        FAKE_EMCLI_VERB - seconds per verb (default 0.005)
+"""
+
+import os
+import sys
+import time
+
+STARTUP = float(os.environ.get('FAKE_EMCLI_STARTUP', '0.5'))
+VERB = float(os.environ.get('FAKE_EMCLI_VERB', '0.005'))
+
+
+class Response(object):
+
+    def __init__(self, out):
+        self._out = out
+
+    def out(self):
+        return self._out
+
+    def error(self):
+        return ''
+
+    def exit_code(self):
+        return 0
+
+
+def verb(name):
+    def call(*args, **options):
+        time.sleep(VERB)
+        return Response('{} completed successfully\n'.format(name))
+    return call
+
+
+def main(argv):
+    time.sleep(STARTUP)
+    if argv and argv[0].startswith('@'):
+        namespace = {'__name__': '__main__'}
+        for name in ('login', 'logout', 'sync', 'set_client_property',
+                     'create_service', 'set_target_property_value',
+                     'get_groups', 'create_group', 'modify_group',
+                     'delete_target'):
+            namespace[name] = verb(name)
+        execfile(argv[0][1:], namespace)
+        return 0
+    time.sleep(VERB)
+    sys.stdout.write('{} completed successfully\n'.format(argv[0]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -2,15 +2,40 @@
 """ ldap_target_ctl module used to add, delete, and update LDAP targets
 """
 
-import emclpy
 import xml.etree.ElementTree as ET
 import sys
-import os
-import tempfile
+import time
 import argparse
 import getpass
-import ConfigParser
-import ast
+import threading
+import collections
+import csv
+import functools
+import traceback
+from .settings import get_settings, CONFIG_FILE_NAME
+from . import engine
+from . import groups
+from . import backends
+from . import render
+from . import spool
+from . import reconcile
+from . import journal
+from . import batch
+from . import preflight
+from . import properties
+from . import retry
+from . import throttle
+from . import metrics
+from . import decommission
+from . import update
+from . import inventory
+from . import emcli_state
+from . import probe
+from . import synthetic
+from . import calibrate
+from . import placement
+from . import profiles
+from . import planner
 
 __author__ = 'Tom Lester'
 __email__ = 'tom.lester@oracle.com'
@@ -23,6 +48,9 @@ def get_config():
         is:  Current working directory -> User Home as .ldap_target_ctl.conf
              -> /etc/ldap_target_ctl -> the module directory (defaults)
 
+        The file is parsed once per process and re-read only when its mtime
+        changes.  See get_settings() for the typed view of the same file.
+
         Inputs:
             None
 
@@ -30,36 +58,13 @@ def get_config():
             config - configParser object.
     """
 
-    config_file_name = 'ldap_target_ctl.conf'
-    # Look in current working directory for config file.
-    if os.path.isfile(os.path.join(os.getcwd(), config_file_name)):
-        config_file = os.path.join(os.getcwd(), config_file_name)
-
-    # Look in user home dir
-    elif os.path.isfile(os.path.join(os.path.expanduser('~'),
-                                     '.{}'.format(config_file_name))):
-        config_file = os.path.join(os.path.expanduser('~'),
-                                   '.{}'.format(config_file_name))
-    # Look in /etc/ldap_target_ctl
-    elif os.path.isfile(os.path.join('/etc/ldap_target_ctl',
-                                     config_file_name)):
-        config_file = os.path.join('/etc/ldap_target_ctl', config_file_name)
-
-    # Last... look for the default config in the module
-    elif os.path.isfile(os.path.join(os.path.dirname(__file__),
-                        config_file_name)):
-        config_file = os.path.join(os.path.dirname(__file__), config_file_name)
-
-    # Or fail
-    else:
-        print 'ERROR:  No acceptable {} file found!'.format(config_file_name)
+    settings = get_settings()
+    if settings is None:
+        print 'ERROR:  No acceptable {} file found!'.format(CONFIG_FILE_NAME)
         return 1
 
-    config = ConfigParser.ConfigParser()
-    config.read(config_file)
-
     # Return config.get(section, name)
-    return config
+    return settings.parser
 
 
 def lifecycle_name():
@@ -83,7 +88,9 @@ def lifecycle_name():
 
 
 def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
-                      ldap_base, ldap_filter, ldap_search_attrib):
+                      ldap_base, ldap_filter, ldap_search_attrib,
+                      thresholds=None, beacon_thresholds=None,
+                      collection=None):
     """ Programatically builds the xml template used to build the
         generic service's tests and metric thresholds.
 
@@ -95,6 +102,16 @@ def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
             ldap_base - String, direcotry structure where search resides
             ldap_filter - String, a filter to limit results
             ldap_search_attribute - String, search attribute to search for
+            thresholds - dict, metric column -> (warning, critical) ms
+                         replacing the default thresholds, as calibrated
+                         by the calibrate module
+            beacon_thresholds - dict, beacon name -> thresholds dict for
+                                the beacons that need their own
+            collection - dict, LDAP_test property name -> number replacing
+                         the default Collection Interval, ldap_timeout,
+                         numretries or retryinterval, as the target's
+                         collection profile gives them (see the profiles
+                         module)
 
         Returns:
             The root ojbect of type xml.etree.ElementTree.Element.  Use the
@@ -159,6 +176,13 @@ def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
                       'prop_type': '1',
                       'encrypt': 'false'}]
 
+    # The collection profile replaces the schedule and retry values
+    if collection:
+        for element in tx_properties:
+            if element['name'] in collection:
+                element['num_value'] = '{:.1f}'.format(
+                    collection[element['name']])
+
     # Response properties for LDAP_Test thresholds
     ldap_response_properties = [['AddressingSearch',
                                 {'warning_threshold': '2000.0',
@@ -197,6 +221,19 @@ def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
                                  'critical_operator': '1',
                                  'num_occurrences': '1'}]]
 
+    def threshold_values(values, overrides):
+        """ Returns a copy of a threshold's attributes with the
+            (warning, critical) overrides applied.
+        """
+
+        values = dict(values)
+        if overrides:
+            values['warning_threshold'] = '{:.1f}'.format(overrides[0])
+            values['critical_threshold'] = '{:.1f}'.format(overrides[1])
+        return values
+
+    thresholds = thresholds or {}
+
     """ The section below builds the XML tree.
     """
     # Define root and basic structure
@@ -218,15 +255,34 @@ def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
     # Itterate through the tx_properties to build tx_properties elements
     for element in tx_properties:
         ET.SubElement(properties, 'property', attrib=element)
+
+    # Beacons with their own thresholds override them per beacon
+    if beacon_thresholds:
+        per_bcn_properties = ET.SubElement(mgmt_bcn_txn_with_props,
+                                           'per_bcn_properties')
+        for beacon in sorted(beacon_thresholds):
+            for element in ldap_response_properties:
+                overrides = beacon_thresholds[beacon].get(element[0])
+                if overrides is None:
+                    continue
+                attrib = threshold_values(element[1], overrides)
+                attrib['beacon_name'] = beacon
+                mgmt_bcn_threshold = ET.SubElement(per_bcn_properties,
+                                                   'mgmt_bcn_threshold',
+                                                   attrib=attrib)
+                ET.SubElement(mgmt_bcn_threshold,
+                              'mgmt_bcn_threshold_key',
+                              attrib={'netric_name': 'ldap_response',
+                                      'metric_column': element[0]})
     ET.SubElement(mgmt_bcn_transaction, 'steps_defn_with_props')
     ET.SubElement(mgmt_bcn_transaction, 'stepgroups_defn')
     txn_thresholds = ET.SubElement(mgmt_bcn_transaction, 'txn_thresholds')
 
     # Itterate through ldap_respons_properties to build tx_threshold elements
     for element in ldap_response_properties:
-        mgmt_bcn_threshold = ET.SubElement(txn_thresholds,
-                                           'mgmt_bcn_threshold',
-                                           attrib=element[1])
+        mgmt_bcn_threshold = ET.SubElement(
+            txn_thresholds, 'mgmt_bcn_threshold',
+            attrib=threshold_values(element[1], thresholds.get(element[0])))
         ET.SubElement(mgmt_bcn_threshold,
                       'mgmt_bcn_threshold_key',
                       attrib={'netric_name': 'ldap_response',
@@ -237,11 +293,130 @@ def make_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
     return root
 
 
+# make_xml_template compiled once per set of thresholds; see
+# render_xml_template()
+_xml_templates = render.RendererCache(
+    make_xml_template, ('ldap_user', 'ldap_password', 'ldap_host',
+                        'ldap_port', 'ldap_base', 'ldap_filter',
+                        'ldap_search_attrib'))
+
+
+def render_xml_template(ldap_user, ldap_password, ldap_host, ldap_port,
+                        ldap_base, ldap_filter, ldap_search_attrib,
+                        thresholds=None, beacon_thresholds=None,
+                        collection=None):
+    """ Renders the same XML as ET.tostring(make_xml_template(...)) from
+        a template compiled on first use of its thresholds, so only the
+        variable fields are escaped and spliced in per target.
+
+        Inputs:
+            Same as make_xml_template
+
+        Returns:
+            String, the serialized transaction-template XML
+    """
+
+    return _xml_templates.renderer(
+        thresholds=thresholds, beacon_thresholds=beacon_thresholds,
+        collection=collection).render(
+            ldap_user, ldap_password, ldap_host, ldap_port, ldap_base,
+            ldap_filter, ldap_search_attrib)
+
+
+def add_ldap_arguments(parser):
+    """ Adds the LDAP_test transaction options (-U, -w, -B, -f, -a) every
+        mode that renders or runs the transaction takes.
+
+        Inputs:
+            parser - argparse.ArgumentParser of the mode
+    """
+
+    parser.add_argument('-U', '--ldap_user', help='LDAP User',
+                        default=('cn=XXXXj,'
+                                 'cn=Users,dc=us,dc=oracle,dc=com'))
+    parser.add_argument('-w', '--ldap_password', help='LDAP User password',
+                        default='XXXXXX')
+    parser.add_argument('-B', '--ldap_base', help='LDAP Directory Base',
+                        default=('cn=XXXXn,'
+                                 'cn=Users,dc=us,dc=oracle,dc=com'))
+    parser.add_argument('-f', '--ldap_filter', help='LDAP filter',
+                        default='cn=XXXXXX')
+    parser.add_argument('-a', '--ldap_search_attrib',
+                        help='Search attribute for test',
+                        default='Taleo_Obiee_Auth')
+
+
+def add_emcli_arguments(parser, login_required=True):
+    """ Adds the options of the modes that run emcli: -L, --backend,
+        --retries and --force_sync.
+
+        Inputs:
+            parser - argparse.ArgumentParser of the mode
+            login_required - bool, whether -L must be given
+    """
+
+    parser.add_argument('-L', '--em_login', help=('The OEM ID to run the '
+                        'command as.'), required=login_required)
+    parser.add_argument('--backend', choices=backends.BACKENDS,
+                        default='spawn',
+                        help=('How to run emcli verbs: spawn one emcli '
+                              'per verb, keep long-lived emcli '
+                              'sessions (one per job), or use a '
+                              'simulated OMS.'))
+    parser.add_argument('--retries', type=int, default=3,
+                        help=('Times to retry an emcli call that failed '
+                              'with a transient OMS error.'))
+    parser.add_argument('--force_sync', action='store_true',
+                        help=('Log in and sync emcli even if the '
+                              'previous run\'s session is current.'))
+
+
+def add_batch_format_argument(parser):
+    """ Adds --batch_format to a mode that reads a batch file.
+
+        Inputs:
+            parser - argparse.ArgumentParser of the mode
+    """
+
+    parser.add_argument('--batch_format', choices=batch.FORMATS,
+                        help=('Batch file format.  Default: csv for '
+                              '.csv, jsonl for .jsonl/.json, otherwise '
+                              'ldap_host:ldap_port:pod lines.'))
+
+
+def add_thresholds_argument(parser, use='apply to the targets it lists'):
+    """ Adds --thresholds, the calibrated thresholds file, to a mode.
+
+        Inputs:
+            parser - argparse.ArgumentParser of the mode
+            use - String, what the mode does with the file, for the help
+    """
+
+    parser.add_argument('--thresholds',
+                        help=('Calibrated thresholds file (see calibrate '
+                              'mode) to {}.'.format(use)))
+
+
+def add_hash_property_argument(parser):
+    """ Adds --hash_property, the target property holding the deployed
+        template hash, to a mode.
+
+        Inputs:
+            parser - argparse.ArgumentParser of the mode
+    """
+
+    parser.add_argument('--hash_property', default=update.HASH_PROPERTY,
+                        help=('Target property holding the deployed '
+                              'template hash.  Default: '
+                              'ldap_target_ctl_hash'))
+
+
 def get_arguments(args):
-    """ Get arguments from input and checks if running in batch mode (-F)
-        or interactive mode.   If "-F" is present, then it runs the first
-        set of argument requirements.  If "-F" is not present, then it runs
-        the second set of argument requirements.
+    """ Get arguments from input and checks if running in delete, update,
+        sync-inventory, check or calibrate mode (named by the first
+        argument), batch mode (-F) or interactive mode, and parses the
+        arguments of that mode.  The mode is returned as args.mode: delete,
+        update, sync-inventory, check, calibrate, batch or single.
 
         Inputs:
             args - list, List of arguments.  Typically supplied as a subset
@@ -256,33 +431,188 @@ def get_arguments(args):
                                   >>> 11
     """
 
-    beacons = ast.literal_eval(get_config().get('otes', 'beacons'))
+    beacons = get_settings().beacons
     pod_help = ('The POD in which the URL check should originate.'
                 'Options are: ') + ', '.join(beacons.keys())
 
+    # Delete mode takes either a batch file or a target name pattern
+    if args and args[0] == 'delete':
+        description = ('Delete LDAP (OID) targets from OEM, given the batch '
+                       'file they were added from or a target name '
+                       'pattern (optionally limited to one pod).  Group '
+                       'membership is removed in bulk first.')
+        parser = argparse.ArgumentParser(prog='ldap_target_ctl delete',
+                                         description=description)
+        targets = parser.add_mutually_exclusive_group(required=True)
+        targets.add_argument('-F', '--batch_file',
+                             help='Batch file listing the targets')
+        targets.add_argument('--pattern',
+                             help=('Target name pattern, e.g. "*_ldap". '
+                                   'Quote it so the shell leaves it alone.'))
+        parser.add_argument('-p', '--pod',
+                            help='Only delete targets of this POD.')
+        parser.add_argument('-g', '--group',
+                            help='OEM group to remove the targets from',
+                            default='OID')
+        add_emcli_arguments(parser)
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Number of targets to delete concurrently.')
+        parser.add_argument('--journal',
+                            help=('File recording each completed step. '
+                                  'Default: <batch_file>.delete.journal or '
+                                  'delete_<pod>.journal'))
+        parser.add_argument('--resume', action='store_true',
+                            help=('Skip the steps the journal says a '
+                                  'previous run already completed.'))
+        add_batch_format_argument(parser)
+        parser.add_argument('--dry_run', action='store_true',
+                            help='List what would be deleted and stop.')
+        parser.add_argument('-y', '--yes', action='store_true',
+                            help='Delete without asking for confirmation.')
+        parser.set_defaults(mode='delete')
+        return parser.parse_args(args[1:])
+
+    # Update mode re-renders every target of a batch file and pushes the
+    # ones whose deployed template differs
+    elif args and args[0] == 'update':
+        description = ('Re-render the monitoring template of every target '
+                       'in a batch file (e.g. after a password rotation or '
+                       'a threshold change) and push it only to the '
+                       'targets whose deployed template hash differs.')
+        parser = argparse.ArgumentParser(prog='ldap_target_ctl update',
+                                         description=description)
+        parser.add_argument('-F', '--batch_file',
+                            help='Path to file with batch configuration file',
+                            required=True)
+        add_ldap_arguments(parser)
+        add_emcli_arguments(parser)
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help='Number of targets to update concurrently.')
+        add_batch_format_argument(parser)
+        add_hash_property_argument(parser)
+        add_thresholds_argument(parser)
+        parser.add_argument('--force', action='store_true',
+                            help='Push to every target, changed or not.')
+        parser.add_argument('--dry_run', action='store_true',
+                            help='List the targets that differ and stop.')
+        parser.set_defaults(mode='update')
+        return parser.parse_args(args[1:])
+
+    # Sync-inventory mode refreshes the local inventory from the OMS
+    elif args and args[0] == 'sync-inventory':
+        description = ('Refresh the local inventory of provisioned targets '
+                       'from OEM, running its queries in parallel.')
+        parser = argparse.ArgumentParser(prog='ldap_target_ctl '
+                                         'sync-inventory',
+                                         description=description)
+        parser.add_argument('-g', '--group', action='append',
+                            help=('OEM group whose membership is recorded. '
+                                  'Repeat for several groups.  Default: '
+                                  'OID'))
+        add_emcli_arguments(parser)
+        parser.add_argument('-j', '--jobs', type=int, default=4,
+                            help='Number of queries to run concurrently.')
+        add_hash_property_argument(parser)
+        parser.set_defaults(mode='sync-inventory')
+        return parser.parse_args(args[1:])
+
+    # Check mode runs the LDAP_test transaction locally, no OMS involved
+    elif args and args[0] == 'check':
+        description = ('Run the LDAP_test transaction the OEM beacons '
+                       'collect (connect and bind, base, addressing and '
+                       'messaging searches, compare) against every LDAP '
+                       'host in a batch file at once, and report its '
+                       'ldap_response metrics against the template\'s '
+                       'thresholds.')
+        parser = argparse.ArgumentParser(prog='ldap_target_ctl check',
+                                         description=description)
+        parser.add_argument('-F', '--batch_file',
+                            help='Path to file with batch configuration file',
+                            required=True)
+        add_ldap_arguments(parser)
+        add_batch_format_argument(parser)
+        parser.add_argument('--timeout', type=float,
+                            default=synthetic.DEFAULT_TIMEOUT,
+                            help=('Seconds each host\'s transaction may '
+                                  'take.  Default: 60, as ldap_timeout'))
+        parser.add_argument('--concurrency', type=int,
+                            default=probe.DEFAULT_CONCURRENCY,
+                            help='Most hosts tested at once.')
+        add_thresholds_argument(parser,
+                                use='check the targets it lists against')
+        parser.set_defaults(mode='check')
+        return parser.parse_args(args[1:])
+
+    # Calibrate mode computes per-target thresholds from measured latency
+    elif args and args[0] == 'calibrate':
+        description = ('Collect ldap_response latency samples from local '
+                       'LDAP_test checks of the hosts in a batch file '
+                       'and/or an OEM metric data export (CSV), keep them '
+                       'in quantile sketches and write per-target (and '
+                       'per-beacon) thresholds for add and update to '
+                       'apply with --thresholds.')
+        parser = argparse.ArgumentParser(prog='ldap_target_ctl calibrate',
+                                         description=description)
+        parser.add_argument('-o', '--output', required=True,
+                            help='Thresholds file to write')
+        parser.add_argument('-F', '--batch_file',
+                            help='Batch file of the hosts to check locally')
+        parser.add_argument('--metrics_csv',
+                            help=('CSV export of OEM ldap_response metric '
+                                  'data with TARGET_NAME, METRIC_COLUMN, '
+                                  'VALUE and optionally BEACON_NAME '
+                                  'columns.'))
+        add_ldap_arguments(parser)
+        add_batch_format_argument(parser)
+        parser.add_argument('--samples', type=int, default=20,
+                            help='Rounds of local checks.  Default: 20')
+        parser.add_argument('--interval', type=float, default=15.0,
+                            help='Seconds between rounds.  Default: 15')
+        parser.add_argument('--state',
+                            help=('File keeping the sketches, so samples '
+                                  'accumulate over calibration runs.'))
+        parser.add_argument('--quantile', type=float,
+                            default=calibrate.DEFAULT_QUANTILE,
+                            help='Latency quantile.  Default: 0.99')
+        parser.add_argument('--warning_factor', type=float,
+                            default=calibrate.DEFAULT_WARNING_FACTOR,
+                            help=('Warning threshold = quantile x this. '
+                                  'Default: 1.5'))
+        parser.add_argument('--critical_factor', type=float,
+                            default=calibrate.DEFAULT_CRITICAL_FACTOR,
+                            help=('Critical threshold = quantile x this. '
+                                  'Default: 3'))
+        parser.add_argument('--min_samples', type=int,
+                            default=calibrate.DEFAULT_MIN_SAMPLES,
+                            help=('Targets with fewer samples keep the '
+                                  'default thresholds.  Default: 20'))
+        parser.add_argument('--timeout', type=float,
+                            default=synthetic.DEFAULT_TIMEOUT,
+                            help='Seconds each host\'s check may take.')
+        parser.add_argument('--concurrency', type=int,
+                            default=probe.DEFAULT_CONCURRENCY,
+                            help='Most hosts checked at once.')
+        parser.set_defaults(mode='calibrate')
+        parsed = parser.parse_args(args[1:])
+        if not parsed.batch_file and not parsed.metrics_csv:
+            parser.error('one of -F/--batch_file and --metrics_csv is '
+                         'required')
+        return parsed
+
     # Check to see if user is running batch mode and set appropriate inputs
-    if '-F' in args:
+    elif '-F' in args:
         description = ('This program is used to provision LDAP (OID) targets '
                        'to be monitored by OEM.  Batch file is in the'
                        'following format (one line per target): '
-                       'ldap_host:ldap_port:pod')
+                       'ldap_host:ldap_port:pod, or CSV (with a header row) '
+                       'or JSON-lines with ldap_host, ldap_port and pod '
+                       'plus optional lifecycle, entity_number, group, '
+                       'ldap_base and ldap_filter overrides.')
         parser = argparse.ArgumentParser(description=description)
         parser.add_argument('-F', '--batch_file',
                             help='Path to file with batch configuration file',
                             required=True)
-        parser.add_argument('-U', '--ldap_user', help='LDAP User',
-                            default=('cn=XXXXj,'
-                                     'cn=Users,dc=us,dc=oracle,dc=com'))
-        parser.add_argument('-w', '--ldap_password', help='LDAP User password',
-                            default='XXXXXX')
-        parser.add_argument('-B', '--ldap_base', help='LDAP Directory Base',
-                            default=('cn=XXXXn,'
-                                     'cn=Users,dc=us,dc=oracle,dc=com'))
-        parser.add_argument('-f', '--ldap_filter', help='LDAP filter',
-                            default='cn=XXXXXX')
-        parser.add_argument('-a', '--ldap_search_attrib',
-                            help='Search attribute for test',
-                            default='Taleo_Obiee_Auth')
+        add_ldap_arguments(parser)
         parser.add_argument('-l', '--lifecycle',
                             help=('Lifecycle. Exmple: production, staging, '
                                   'test, development'), required=True)
@@ -292,8 +622,64 @@ def get_arguments(args):
         parser.add_argument('-g', '--group',
                             help='Which OEM group to add target to',
                             default='OID')
-        parser.add_argument('-L', '--em_login', help=('The OEM ID to run the '
-                            'command as.'), required=True)
+        add_emcli_arguments(parser)
+        parser.add_argument('-j', '--jobs', type=int, default=1,
+                            help=('Number of targets to provision '
+                                  'concurrently.'))
+        parser.add_argument('--reconcile', action='store_true',
+                            help=('Snapshot the existing generic services '
+                                  'first and only create or update what '
+                                  'differs.'))
+        parser.add_argument('--journal',
+                            help=('File recording each completed step. '
+                                  'Default: <batch_file>.journal'))
+        parser.add_argument('--resume', action='store_true',
+                            help=('Skip the steps the journal says a '
+                                  'previous run already completed.'))
+        add_batch_format_argument(parser)
+        parser.add_argument('--adaptive', action='store_true',
+                            help=('Start with --jobs targets in flight and '
+                                  'adjust that from observed OMS latency '
+                                  'and errors.'))
+        parser.add_argument('--max_jobs', type=int,
+                            help=('Most targets in flight with --adaptive. '
+                                  'Default: 4 x --jobs'))
+        parser.add_argument('--pod_jobs', type=int,
+                            help='Most targets in flight per pod.')
+        parser.add_argument('--probe', choices=('connect', 'bind'),
+                            help=('Before provisioning, check that every '
+                                  'LDAP host accepts connections (connect) '
+                                  'or also a bind as the LDAP user (bind). '
+                                  'Stops if any host is unreachable.'))
+        parser.add_argument('--probe_timeout', type=float, default=5.0,
+                            help='Seconds each LDAP host has to answer.')
+        parser.add_argument('--skip_unreachable', action='store_true',
+                            help=('With --probe, provision the reachable '
+                                  'hosts and skip the others.'))
+        add_thresholds_argument(parser)
+        add_hash_property_argument(parser)
+        parser.add_argument('--replicas', type=int,
+                            help=('Number of the pod\'s beacons each '
+                                  'target is tested from, picked by '
+                                  'consistent hashing of its name. '
+                                  'Default: [placement] replicas, or all.'))
+        parser.add_argument('--budget', type=float,
+                            help=('Most LDAP tests per minute any beacon '
+                                  'may run, counting the inventory\'s '
+                                  'targets.  A batch over it is refused. '
+                                  'Default: [placement] budget, or none.'))
+        parser.add_argument('--rebalance', action='store_true',
+                            default=None,
+                            help=('With --replicas, move targets off '
+                                  'beacons that would go over --budget '
+                                  'instead of refusing the batch.'))
+        parser.add_argument('--metrics_json',
+                            help=('Write per-target step timings to this '
+                                  'file as JSON lines.'))
+        parser.add_argument('--prom_file',
+                            help=('Write run timings to this Prometheus '
+                                  'textfile (e.g. for node_exporter).'))
+        parser.set_defaults(mode='batch')
         return parser.parse_args(args)
 
     # If not in batch mode, get appropriate interactive inputs
@@ -307,19 +693,12 @@ def get_arguments(args):
                             required=True)
         parser.add_argument('-P', '--ldap_port', help='The LDAP server port',
                             required=True)
-        parser.add_argument('-U', '--ldap_user', help='LDAP User',
-                            default=('cn=XXXXX,'
-                                     'cn=Users,dc=us,dc=oracle,dc=com'))
-        parser.add_argument('-w', '--ldap_password', help='LDAP User password',
-                            default='XXXXXX')
-        parser.add_argument('-B', '--ldap_base', help='LDAP Directory Base',
-                            default=('cn=XXXXXX,'
-                                     'cn=Users,dc=us,dc=oracle,dc=com'))
-        parser.add_argument('-f', '--ldap_filter', help='LDAP filter',
-                            default='cn=XXXXX')
-        parser.add_argument('-a', '--ldap_search_attrib',
-                            help='Search attribute for test',
-                            default='Taleo_Obiee_Auth')
+        add_ldap_arguments(parser)
+        parser.set_defaults(ldap_user=('cn=XXXXX,'
+                                       'cn=Users,dc=us,dc=oracle,dc=com'),
+                            ldap_base=('cn=XXXXXX,'
+                                       'cn=Users,dc=us,dc=oracle,dc=com'),
+                            ldap_filter='cn=XXXXX')
         parser.add_argument('-l', '--lifecycle',
                             help=('Lifecycle. Exmple: production, staging, '
                                   'test, development'), default='production')
@@ -330,119 +709,791 @@ def get_arguments(args):
         parser.add_argument('-g', '--group',
                             help='Which OEM group to add target to',
                             default='OID')
-        parser.add_argument('-L', '--em_login', help=('The OEM ID to run the '
-                            'command as.'))
+        add_emcli_arguments(parser, login_required=False)
+        add_thresholds_argument(parser)
+        add_hash_property_argument(parser)
+        parser.add_argument('--replicas', type=int,
+                            help=('Number of the pod\'s beacons the target '
+                                  'is tested from, picked by consistent '
+                                  'hashing of its name.  Default: '
+                                  '[placement] replicas, or all.'))
+        parser.add_argument('--metrics_json',
+                            help=('Write the step timings to this file as '
+                                  'a JSON line.'))
+        parser.add_argument('--prom_file',
+                            help=('Write run timings to this Prometheus '
+                                  'textfile (e.g. for node_exporter).'))
+        parser.set_defaults(mode='single')
         return parser.parse_args(args)
 
 
-def add_batch_ldap_targets(batch_file, ldap_user, ldap_password,
-                           ldap_base, ldap_filter, ldap_search_attrib,
-                           lifecycle, entity_number, group, em_user, em_pass):
-    """ Recive arguments and create OEM LDAP targets from a batch file.
+def read_batch_targets(batch_file, lifecycle, entity_number, group,
+                       ldap_base, ldap_filter, batch_format=None,
+                       settings=None, skip_lines=(), beacon_placement=None):
+    """ Streams a batch file as BatchTarget objects, filling in whatever a
+        row doesn't override from the run-wide values.
 
         Inputs:
-            batch_file - String, Absolute path to batch file.
-                         Batch file is formated as
-                         follows (one line per serivce):
-
-                                ldap_host:ldap_port:pod
-
-            ldap_user - string, LDAP user
-            ldap_password - string, ldap password
+            batch_file - String, path to the batch file
+            lifecycle - String, OEM lifecycle name (see lifecycle_name())
+            entity_number - int, OTES entity number
+            group - String, OEM group or None
             ldap_base - string, ldap base
             ldap_filter - string, ldap search filter
-            ldap_search_attrib - string, attribute to compare
-            em_user - string, an authorized OEM user
-            em_pass - string, oem password for said user
+            batch_format - String, one of batch.FORMATS or None to detect
+            settings - Settings object, defaults to get_settings()
+            skip_lines - container of line numbers to leave out, such as
+                         the duplicates found by preflight.check_batch()
+            beacon_placement - placement.BeaconPlacement picking each
+                               target's beacons, or None for every beacon
+                               of its pod
 
         Returns:
-            code - int, error code.
+            Generator of engine.BatchTarget objects
     """
 
-    url = get_config().get('oem', 'url')
+    settings = settings or get_settings()
+    for row in batch.read_batch(batch_file, batch_format):
+        if row.line in skip_lines:
+            continue
+        if row.lifecycle:
+            row_lifecycle = lifecycle_name()[row.lifecycle.lower()]
+        else:
+            row_lifecycle = lifecycle
+        if row.entity_number:
+            row_entity_number = int(row.entity_number)
+        else:
+            row_entity_number = entity_number
+        property_records = {
+            'Department': settings.entities[row_entity_number],
+            'Function': 'LDAP Service',
+            'Lifecycle Status': row_lifecycle,
+            'Pod': row.pod}
+        # Look up and define which beacons to use for this POD
+        target = engine.BatchTarget(row.ldap_host, row.ldap_port, row.pod,
+                                    settings.beacons[row.pod],
+                                    property_records,
+                                    group=row.group or group,
+                                    ldap_base=row.ldap_base or ldap_base,
+                                    ldap_filter=row.ldap_filter or ldap_filter)
+        if beacon_placement is not None:
+            target.beacons = beacon_placement.assign(target.pod, target.name)
+        yield target
 
-    # Create the emcli client instance
-    emcli = emclpy.Emclpy(url, em_user, em_pass)
 
-    # Login to emcli and sync
-    code, out, err = emcli.login()
-    if code > 0:
-        print err.strip()
-        return code
-    emcli.sync()
+def read_thresholds(thresholds_file):
+    """ Reads a file of calibrated per-target thresholds (see the
+        calibrate mode).
 
-    # Read in batch file.
-    batch = open(batch_file, 'r')
+        Inputs:
+            thresholds_file - String, path to the file, or None
 
-    # code_total keeps a running total of error codes while
-    # batch adding targets
-    code_total = 0
+        Returns:
+            dict, target name -> thresholds keyword arguments for
+            make_xml_template (empty without a file), or None if the file
+            can't be read, in which case the error has been printed
+    """
 
-    # Itterate through the lines in the batch file
-    for line in batch:
-        ldap_host, ldap_port, pod = line.strip().split(':')
+    if thresholds_file is None:
+        return {}
+    try:
+        return calibrate.load_thresholds(thresholds_file)
+    except (IOError, ValueError, KeyError), error:
+        print 'ERROR: cannot read thresholds from {}: {}'.format(
+            thresholds_file, error)
+        return None
+
+
+def print_notice(message):
+    """ Prints a batch-wide notice from any thread in one write. """
+
+    sys.stdout.write('WARNING: {}\n'.format(message))
+    sys.stdout.flush()
+
+
+class BatchRun(object):
+    """ What the steps of one add_batch_ldap_targets run share: its
+        arguments, the batch's targets, and the recorder, journal and
+        inventory every OMS shard writes to.
+
+        Attributes:
+            read - callable, read() -> generator of every BatchTarget of
+                   the batch file (read_batch_targets with the run's
+                   arguments bound)
+            unreachable - set of the (ldap_host, ldap_port) left out
+            moved - dict, target name -> beacons the load plan moved it to
+            recorder - metrics.Recorder timing every emcli call
+            steps_journal - journal.Journal of the completed steps
+            inventory_db - inventory.Inventory, or None
+            The others are the add_batch_ldap_targets arguments of the
+            same name.
+    """
 
-        # Look up and define which beacons to use for this POD
-        beacons = ast.literal_eval(get_config().get('otes', 'beacons'))[pod]
-        target_name = '{}_ldap'.format(ldap_host)
-        entity_code = ast.literal_eval(get_config().get('otes', 'entities'))
+    def __init__(self, read, ldap_user, ldap_password, ldap_search_attrib,
+                 em_user, em_pass, calibration, collection_profiles,
+                 backend='spawn', reconcile_mode=False, retries=3,
+                 adaptive=False, max_jobs=None, pod_jobs=None,
+                 force_sync=False, hash_property=update.HASH_PROPERTY):
+        self.read = read
+        self.ldap_user = ldap_user
+        self.ldap_password = ldap_password
+        self.ldap_search_attrib = ldap_search_attrib
+        self.em_user = em_user
+        self.em_pass = em_pass
+        self.calibration = calibration
+        self.collection_profiles = collection_profiles
+        self.backend = backend
+        self.reconcile_mode = reconcile_mode
+        self.retries = retries
+        self.adaptive = adaptive
+        self.max_jobs = max_jobs
+        self.pod_jobs = pod_jobs
+        self.force_sync = force_sync
+        self.hash_property = hash_property
+        self.unreachable = set()
+        self.moved = {}
+        self.recorder = metrics.Recorder()
+        self.steps_journal = None
+        self.inventory_db = None
+
+    def targets(self, pods=None):
+        """ Yields the BatchTargets to provision, only those of pods if
+            given.
+        """
+
+        for target in self.read():
+            if (target.ldap_host, str(target.ldap_port)) in self.unreachable:
+                continue
+            if pods is None or target.pod in pods:
+                target.beacons = self.moved.get(target.name, target.beacons)
+                yield target
+
+    def render(self, target, password):
+        """ Renders target's template with its calibrated thresholds and
+            its lifecycle's collection profile.
+        """
+
+        options = dict(self.calibration.get(target.name, {}))
+        options['collection'] = self.collection_profiles.collection(
+            target.properties['Lifecycle Status'])
+        return render_xml_template(
+            self.ldap_user, password, target.ldap_host, target.ldap_port,
+            target.ldap_base, target.ldap_filter, self.ldap_search_attrib,
+            **options)
+
+
+class OmsShard(object):
+    """ The targets of a batch run that one OMS provisions, and the state
+        of its emcli session.
 
-        property_records = {'Department': entity_code[entity_number],
-                            'Function': 'LDAP Service',
-                            'Lifecycle Status': lifecycle,
-                            'Pod': pod}
+        Inputs:
+            oms - settings.OMS object
+            pods - set of pod names, or None for every pod of the batch
+            jobs - int, targets in flight
+
+        Attributes:
+            digest - String, the password_digest() templates are hashed
+                     with
+            emcli - logged in client while the shard runs
+            limiter - throttle.AdaptiveLimiter, or None
+            snapshot - reconcile.Snapshot in reconcile mode, or None
+            templates - spool.TemplateSpool while targets are created
+            property_sets - properties.PropertyBatcher of the targets
+                            whose properties are still to be set
+            members - OrderedDict, group -> names of the targets still to
+                      add to it
+            provisioned - dict, target name -> BatchTarget of every
+                          target handled
+            failed_targets - set of the failed target names
+    """
 
-        root = make_xml_template(ldap_user, ldap_password, ldap_host,
-                                 ldap_port, ldap_base, ldap_filter,
-                                 ldap_search_attrib)
+    def __init__(self, oms, pods, jobs):
+        self.oms = oms
+        self.pods = pods
+        self.jobs = jobs
+        self.digest = None
+        self.emcli = None
+        self.limiter = None
+        self.snapshot = None
+        self.templates = None
+        self.property_sets = properties.PropertyBatcher('generic_service')
+        self.members = collections.OrderedDict()
+        self.provisioned = {}
+        self.failed_targets = set()
+
+
+def provision_target(run, shard, target):
+    """ Batch worker: runs the create step for one target, within the
+        shard's limiter, and marks it for the bulk properties and group
+        steps.
 
-        xmlstr = ET.tostring(root)
+        Returns:
+            engine.TargetResult object
+    """
 
-        # Create temp file
-        temp = tempfile.NamedTemporaryFile('w', 0)
-        temp.write(xmlstr)  # Write XML temp file
+    if shard.limiter is None:
+        return create_target(run, shard, target)
+    with shard.limiter.slot(target.pod):
+        return create_target(run, shard, target)
+
+
+def create_target(run, shard, target):
+    """ Creates target unless the journal or the snapshot says it exists,
+        and lists the steps left for the bulk phases in result.pending.
+    """
+
+    recorder = run.recorder
+    result = engine.TargetResult(target)
+    recorder.target(target.name, pod=target.pod)
+    if shard.snapshot is None:
+        steps = reconcile.STEPS if target.group else reconcile.STEPS[:2]
+    else:
+        steps = shard.snapshot.plan(target.name, target.properties,
+                                    target.group)
+    done = run.steps_journal.completed(target.name)
+    steps = [step for step in steps if step not in done]
+    if not steps:
+        result.output.append('{} is already provisioned'.format(
+            target.name))
+        return result
+
+    if 'created' in steps:
+        with recorder.timer('render', target.name):
+            xmlstr = run.render(target, run.ldap_password)
+
+        # Write the XML to this worker's spool file
+        with recorder.timer('stage', target.name):
+            template = shard.templates.stage(xmlstr, shard.emcli)
 
         # Create LDAP Target
-        code, out, err = emcli.create_generic_service(target_name,
-                                                      temp.name,
-                                                      beacons)
-        if code > 0:
-            print err.strip()
-            code_total += code  # Add to error code count
-        else:
-            print out.strip()
+        with recorder.timer('create', target.name):
+            response = shard.emcli.create_generic_service(
+                target.name, template, target.beacons)
+        code = result.record(*response, step='created')
+        if code == 0:
+            run.steps_journal.record(target.name, 'created')
+
+    # Existing targets, and new ones that were created, get their
+    # properties set and are grouped in bulk once every worker is done.
+    # A target that couldn't be created is left at that.
+    if 'created' not in steps or 'created' in result.completed:
+        result.pending.extend(step for step in steps if step != 'created')
+    return result
+
+
+def record_result(run, shard, result):
+    """ Handles a worker's result in batch order: prints it, records the
+        created target and queues its bulk steps.
+    """
+
+    engine.print_result(result)
+    run.recorder.finish(result.target.name, result.code)
+    target = result.target
+    shard.provisioned[target.name] = target
+    if result.code:
+        shard.failed_targets.add(target.name)
+    # A created target's template hash is set with its properties, so
+    # the first update doesn't have to push it again
+    extra = None
+    if 'created' in result.completed:
+        template_hash = update.template_hash(run.render(target,
+                                                        shard.digest))
+        extra = {run.hash_property: template_hash}
+        if run.inventory_db is not None:
+            run.inventory_db.record(
+                target.name, host=target.ldap_host, port=target.ldap_port,
+                pod=target.pod, beacons=target.beacons,
+                template_hash=template_hash, provisioned_at=time.time())
+    if 'properties' in result.pending:
+        shard.property_sets.add(target.name, target.properties, extra)
+    if 'grouped' in result.pending:
+        shard.members.setdefault(target.group, []).append(target.name)
+
+
+def set_batch_properties(run, shard):
+    """ Sets the queued target properties, one emcli call per chunk of
+        targets that share the same values.  Created targets get their
+        template hash in the same call, in run.hash_property, which is
+        added to the generic_service properties first.
 
-        # Set target properties
-        code, out, err = emcli.set_target_property_value(target_name,
-                                                         'generic_service',
-                                                         property_records)
+        Returns:
+            code_total - int, sum of the failed calls' error codes
+    """
+
+    code_total = 0
+    lines = []
+    if shard.property_sets.extra:
+        code, out, err = update.define_hash_property(shard.emcli,
+                                                     run.hash_property)
         if code > 0:
-            print err.strip()
-            code_total += code  # Add to error code count
-        else:
-            print out.strip()
+            print_notice('cannot add the {} property: {}'.format(
+                run.hash_property, err.strip()))
+    responses, failed = shard.property_sets.apply(
+        shard.emcli, lambda names, seconds: run.recorder.add(
+            'properties', seconds, names))
+    for chunk, code, out, err in responses:
+        if code == 0:
+            lines.append(out.strip())
+            for name in chunk:
+                run.steps_journal.record(name, 'properties')
+                if run.inventory_db is not None:
+                    target_properties = shard.provisioned[name].properties
+                    run.inventory_db.record(
+                        name, pod=target_properties.get('Pod'),
+                        entity=target_properties.get('Department'),
+                        lifecycle=target_properties.get('Lifecycle Status'))
+    for name, (code, error) in failed.items():
+        lines.append('ERROR: {}: {}'.format(name, error))
+        run.recorder.finish(name, code)
+        shard.failed_targets.add(name)
+        code_total += code
+    engine.print_lines(lines)
+    return code_total
+
+
+def group_batch_targets(run, shard):
+    """ For every group in the shard, creates the group once if it doesn't
+        exist, then adds every target that isn't a member yet to it in as
+        few calls as the emcli argument limit allows.
 
-        # If the group variable is set, check to see if group exists.  If it
-        # does, then add target to group.  If it doesn't, first create group,
-        # then add to group.
-        if group:
-            if group in emcli.get_groups():
-                code, out, err = emcli.add_to_group(group, target_name,
-                                                    'generic_service')
-                print out.strip()
+        Returns:
+            code_total - int, sum of the failed calls' error codes
+    """
+
+    code_total = 0
+    lines = []
+    group_cache = groups.GroupCache(shard.emcli)
+    for target_group, names in shard.members.items():
+        response = group_cache.ensure(target_group)
+        if response is not None:
+            code, out, err = response
+            if code > 0:
+                # Without the group none of its targets can be added
+                lines.append(err.strip())
+                for name in names:
+                    run.recorder.finish(name, code)
+                shard.failed_targets.update(names)
+                code_total += code
+                continue
+            lines.append(out.strip())
+        for chunk, code, out, err in groups.add_targets_to_group(
+                shard.emcli, target_group, names, 'generic_service',
+                observe=lambda names, seconds: run.recorder.add(
+                    'grouped', seconds, names)):
+            if code > 0:
+                lines.append(err.strip())
+                for name in chunk:
+                    run.recorder.finish(name, code)
+                shard.failed_targets.update(chunk)
+                code_total += code
             else:
-                code, out, err = emcli.create_group(group)
-                print out.strip()
-                code, out, err = emcli.add_to_group(group, target_name,
-                                                    'generic_service')
-                print out.strip()
+                lines.append(out.strip())
+                for name in chunk:
+                    run.steps_journal.record(name, 'grouped')
+                    if run.inventory_db is not None:
+                        run.inventory_db.record(name,
+                                                target_group=target_group)
+    engine.print_lines(lines)
+    return code_total
+
+
+def provision_shard(run, shard):
+    """ Provisions a shard's targets through its OMS, with its own emcli
+        session pool, limiter and circuit breaker.
+
+        Returns:
+            (code, number of targets, set of failed target names)
+    """
+
+    recorder = run.recorder
+    # Templates are hashed with this in place of the password
+    shard.digest = update.password_digest(run.ldap_password, shard.oms.url)
+
+    # With --adaptive or --pod_jobs a limiter decides how many of the
+    # workers may provision at once, fed by every emcli call's latency
+    workers = shard.jobs
+    if run.adaptive or run.pod_jobs:
+        ceiling = ((run.max_jobs or shard.jobs * 4) if run.adaptive
+                   else shard.jobs)
+        shard.limiter = throttle.AdaptiveLimiter(shard.jobs, ceiling,
+                                                 run.pod_jobs, run.adaptive)
+        workers = shard.limiter.ceiling
+
+    # Create the emcli client instance.  Transient errors are retried
+    # and a run of them pauses every worker until the OMS recovers.
+    emcli = backends.make_emcli(run.backend, shard.oms.url, run.em_user,
+                                run.em_pass, shard.oms.emcli,
+                                sessions=workers)
+    emcli = throttle.MeteredEmcli(emcli, *[observer for observer in
+                                           (shard.limiter, recorder)
+                                           if observer])
+    breaker = retry.CircuitBreaker(notify=print_notice)
+    emcli = retry.RetryingEmcli(emcli, retry.RetryPolicy(run.retries),
+                                breaker)
+    shard.emcli = emcli
+
+    # Login to emcli and sync, unless the previous run's session is
+    # still current
+    login_state = emcli_state.LoginState(shard.oms.state_file,
+                                         shard.oms.url, run.em_user,
+                                         run.backend)
+    code, out, err = login_state.start(emcli, run.force_sync,
+                                       recorder.timer)
+    if code > 0:
+        engine.print_lines([err.strip()])
+        return code, 0, shard.failed_targets
+
+    # In reconcile mode every target is diffed against one snapshot
+    if run.reconcile_mode:
+        batch_groups = sorted(set(target.group for target
+                                  in run.targets(shard.pods)
+                                  if target.group))
+        with recorder.timer('snapshot'):
+            shard.snapshot, errors = reconcile.take_snapshot(
+                emcli, 'generic_service', batch_groups)
+        if errors:
+            engine.print_lines(errors)
+            login_state.end(emcli)
+            return 1, 0, shard.failed_targets
+
+    # code_total keeps a running total of error codes while
+    # batch adding targets
+    shard.templates = spool.TemplateSpool()
+    try:
+        with recorder.timer('provision'):
+            code_total = engine.run_batch(
+                run.targets(shard.pods),
+                functools.partial(provision_target, run, shard),
+                jobs=workers,
+                emit=functools.partial(record_result, run, shard))
+    finally:
+        shard.templates.close()
+
+    code_total += set_batch_properties(run, shard)
+    code_total += group_batch_targets(run, shard)
+
+    with recorder.timer('logout'):
+        login_state.end(emcli)  # Logout of EMCLI, or keep the session
+
+    lines = []
+    if shard.limiter is not None and run.adaptive:
+        lines.append(shard.limiter.summary())
+    if breaker.broken:
+        lines.append(('ERROR: OMS {} unavailable, rerun with --resume to '
+                      'continue from {}').format(shard.oms.url,
+                                                 run.steps_journal.path))
+    engine.print_lines(lines)
+    return code_total, len(shard.provisioned), shard.failed_targets
+
+
+def check_shards(shards, backend):
+    """ Returns why the shards can't be provisioned at the same time, or
+        None.  The spawn backend runs emclpy's verbs with the emcli
+        emclpy is set up with, not the OMS's, and an emcli install holds
+        one OMS setup at a time, so concurrent shards need the session
+        backend and an emcli install each.
+    """
+
+    if len(shards) < 2 or backend == 'fake':
+        return None
+    if backend == 'spawn':
+        return ('the batch spans {} OMSes ({}), which the spawn backend '
+                'can\'t provision at once; use --backend '
+                'session').format(len(shards), ', '.join(shards))
+    installs = collections.defaultdict(list)
+    for name, shard in shards.items():
+        installs[shard.oms.emcli].append(name)
+    for emcli, names in sorted(installs.items()):
+        if len(names) > 1:
+            return ('OMSes {} share the emcli command {}, give each its '
+                    'own [oem:<name>] emcli').format(', '.join(names), emcli)
+    return None
+
+
+def provision_in_thread(run, shard, outcomes, raised):
+    """ Thread body of provision_shards: an emcli that can't be run fails
+        the shard, any other exception is kept in raised.
+    """
 
-        temp.close()
+    try:
+        outcomes[shard.oms.name] = provision_shard(run, shard)
+    except EnvironmentError, error:
+        engine.print_lines(['ERROR: OMS {} failed: {}'.format(
+            shard.oms.name, error)])
+    except Exception:
+        raised.append(sys.exc_info())
 
-    emcli.logout()  # Logout of EMCLI
+
+def provision_shards(run, shards):
+    """ Provisions every shard in its own thread.  Once every shard is
+        done, the first exception a shard raised, other than an emcli
+        that couldn't be run, is raised again with its traceback; the
+        others are printed.
+
+        Returns:
+            OrderedDict, OMS name -> provision_shard() outcome
+    """
+
+    outcomes = collections.OrderedDict((name, (1, 0, set()))
+                                       for name in shards)
+    raised = []
+    threads = [threading.Thread(target=provision_in_thread,
+                                args=(run, shard, outcomes, raised),
+                                name='oms-{}'.format(name))
+               for name, shard in shards.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if raised:
+        for exc_info in raised[1:]:
+            engine.print_lines(
+                ''.join(traceback.format_exception(*exc_info)).splitlines())
+        exc_type, value, tb = raised[0]
+        raise exc_type, value, tb
+    return outcomes
+
+
+def add_batch_ldap_targets(batch_file, ldap_user, ldap_password,
+                           ldap_base, ldap_filter, ldap_search_attrib,
+                           lifecycle, entity_number, group, em_user, em_pass,
+                           jobs=1, backend='spawn', reconcile_mode=False,
+                           journal_file=None, resume=False,
+                           batch_format=None, retries=3, adaptive=False,
+                           max_jobs=None, pod_jobs=None, metrics_json=None,
+                           prom_file=None, force_sync=False,
+                           probe_mode=None, probe_timeout=5.0,
+                           skip_unreachable=False, thresholds_file=None,
+                           replicas=None, budget=None, rebalance=None,
+                           hash_property=update.HASH_PROPERTY):
+    """ Recive arguments and create OEM LDAP targets from a batch file.
+
+        Inputs:
+            batch_file - String, Absolute path to batch file.
+                         Batch file is formated as
+                         follows (one line per serivce):
+
+                                ldap_host:ldap_port:pod
+
+                         or as CSV / JSON-lines rows that may override
+                         lifecycle, entity_number, group, ldap_base and
+                         ldap_filter (see the batch module).
+
+            ldap_user - string, LDAP user
+            ldap_password - string, ldap password
+            ldap_base - string, ldap base
+            ldap_filter - string, ldap search filter
+            ldap_search_attrib - string, attribute to compare
+            em_user - string, an authorized OEM user
+            em_pass - string, oem password for said user
+            jobs - int, number of targets to provision concurrently.  Each
+                   target's steps still run in order and output is printed
+                   in batch file order.  Group membership is added in bulk
+                   once every target has been created.  When the batch's
+                   pods are mapped to several OMSes ([oem:<name>] pods)
+                   the OMSes are provisioned in parallel, each with its
+                   own session pool and jobs ([oem:<name>] jobs, or this)
+                   and one report is printed at the end.
+            backend - string, emcli backend name (see backends.BACKENDS).
+                      The session backend keeps one emcli process per job.
+            reconcile_mode - bool, take one bulk snapshot of the existing
+                             generic services and only run the steps each
+                             target is missing.
+            journal_file - string, file recording each completed step.
+                           Defaults to <batch_file>.journal
+            resume - bool, skip steps the journal already records instead of
+                     starting a new journal.
+            batch_format - string, one of batch.FORMATS, or None to pick
+                           from the file extension.
+            retries - int, retries of an emcli call that failed with a
+                      transient error.  If the OMS keeps failing the whole
+                      batch pauses, and after repeated pauses the remaining
+                      targets fail so the run can be resumed later.
+            adaptive - bool, treat jobs as the starting number of targets
+                       in flight and grow or shrink it from observed emcli
+                       latency and errors.
+            max_jobs - int, ceiling for adaptive.  Defaults to 4 x jobs.
+            pod_jobs - int, most targets of one pod in flight at once.
+            metrics_json - string, file to write each target's step
+                           timings to as JSON lines.  Bulk steps record the
+                           time of the emcli call that covered the target.
+            prom_file - string, Prometheus textfile to write step and emcli
+                        verb timings (p50/p95/p99) to.
+            force_sync - bool, log in and sync even if the previous run's
+                         emcli session is still current.
+            probe_mode - string, 'connect' to check every LDAP host
+                         accepts connections before provisioning, 'bind'
+                         to also bind as ldap_user, or None.
+            probe_timeout - float, seconds each host has to answer.
+            skip_unreachable - bool, provision the hosts that answered
+                               instead of stopping when any didn't.
+            thresholds_file - string, calibrated thresholds to apply to
+                              the targets it lists (see calibrate mode).
+            replicas - int, beacons each target's test runs from, picked
+                       from its pod's by consistent hashing.  Defaults to
+                       [placement] replicas, or every beacon of the pod.
+                       With a replication factor the tests each beacon
+                       runs are reported at the end.
+            budget - float, most LDAP tests per minute any beacon may run
+                     once the batch is added to the inventory's targets
+                     (each target's rate comes from the collection profile
+                     of its lifecycle).  Defaults to [placement] budget, or
+                     no limit.  A batch over budget is refused.
+            rebalance - bool, with a replication factor move the targets
+                        that would overload a beacon to the next beacons
+                        on their ring instead of refusing the batch.
+                        Defaults to [placement] rebalance.
+            hash_property - string, target property the template hash of
+                            each created target is stored in, with its
+                            other properties (see update_ldap_targets).
+
+        Returns:
+            code - int, error code.
+    """
+
+    settings = get_settings()
+    calibration = read_thresholds(thresholds_file)
+    if calibration is None:
+        return 1
+    try:
+        beacon_placement = placement.from_settings(settings, replicas,
+                                                   budget, rebalance)
+        collection_profiles = profiles.from_settings(settings,
+                                                     lifecycle_name())
+    except ValueError, error:
+        print 'ERROR: {}'.format(error)
+        return 1
+
+    # Check the whole batch before an OMS session is spent on it
+    report = preflight.check_batch(batch_file, settings.beacons,
+                                   settings.entities, lifecycle_name(),
+                                   entity_number, batch_format)
+    if report.problems:
+        for problem in report.problems:
+            print 'ERROR: {}'.format(problem)
+        print ('ERROR: {} problem(s) found in {}, nothing was '
+               'provisioned').format(len(report.problems), batch_file)
+        return 1
+    for line, first_line in sorted(report.duplicates.items()):
+        print 'Skipping line {}, it duplicates line {}'.format(
+            line, first_line)
+
+    run = BatchRun(
+        functools.partial(read_batch_targets, batch_file, lifecycle,
+                          entity_number, group, ldap_base, ldap_filter,
+                          batch_format, settings,
+                          skip_lines=report.duplicates,
+                          beacon_placement=beacon_placement),
+        ldap_user, ldap_password, ldap_search_attrib, em_user, em_pass,
+        calibration, collection_profiles, backend=backend,
+        reconcile_mode=reconcile_mode, retries=retries, adaptive=adaptive,
+        max_jobs=max_jobs, pod_jobs=pod_jobs, force_sync=force_sync,
+        hash_property=hash_property)
+
+    # Probe every LDAP host, all at once, before provisioning any of them
+    if probe_mode:
+        results = probe.probe_hosts(
+            [(target.ldap_host, target.ldap_port)
+             for target in run.targets()],
+            ldap_user if probe_mode == 'bind' else None, ldap_password,
+            probe_timeout)
+        for result in results:
+            if not result.ok:
+                print '{}:{} is unreachable, {}'.format(result.host,
+                                                        result.port,
+                                                        result.error)
+                run.unreachable.add((result.host, str(result.port)))
+        if run.unreachable and not skip_unreachable:
+            print ('ERROR: {} of {} LDAP host(s) unreachable, nothing was '
+                   'provisioned').format(len(run.unreachable), len(results))
+            return 1
+        if run.unreachable:
+            print 'Skipping {} unreachable LDAP host(s)'.format(
+                len(run.unreachable))
+
+    # Every completed step is recorded in the local inventory, with the
+    # hash of the template (see the update module)
+    run.inventory_db = inventory.open_inventory(settings)
+    try:
+        # Check the batch keeps every beacon within its test budget,
+        # counting the targets the inventory already has on them
+        if beacon_placement.budget is not None:
+            records = []
+            if run.inventory_db is not None:
+                records = run.inventory_db.targets()
+            load_plan = planner.plan_batch(list(run.targets()), records,
+                                           collection_profiles,
+                                           beacon_placement)
+            for line in load_plan.report():
+                print line
+            if not load_plan.ok:
+                print ('ERROR: {} beacon(s) would run more than {:g} tests '
+                       'per minute, nothing was provisioned').format(
+                           len(load_plan.overloaded), load_plan.budget)
+                return 1
+            run.moved.update(load_plan.moved)
+
+        # Each pod's targets are provisioned through the OMS it is mapped
+        # to; the OMSes are worked on in parallel
+        shards = collections.OrderedDict()
+        for pod in sorted(set(target.pod for target in run.targets())):
+            oms = settings.oms_for_pod(pod)
+            if oms.name not in shards:
+                shards[oms.name] = OmsShard(oms, set(), oms.jobs or jobs)
+            shards[oms.name].pods.add(pod)
+
+        problem = check_shards(shards, backend)
+        if problem:
+            print 'ERROR: {}'.format(problem)
+            return 1
+
+        run.steps_journal = journal.Journal(journal_file or
+                                            '{}.journal'.format(batch_file),
+                                            resume=resume)
+        try:
+            if len(shards) == 1:
+                shard = shards.values()[0]
+                shard.pods = None
+                outcomes = {shard.oms.name: provision_shard(run, shard)}
+            else:
+                outcomes = provision_shards(run, shards)
+        finally:
+            run.steps_journal.close()
+    finally:
+        if run.inventory_db is not None:
+            run.inventory_db.close()
+    run.recorder.write(metrics_json, prom_file)
+
+    # One report for the whole batch when it spanned several OMSes
+    if len(shards) > 1:
+        totals = [0, 0]
+        for name, shard in shards.items():
+            code, targets, failed_targets = outcomes[name]
+            print 'OMS {} ({}): {} target(s), {} ok, {} failed{}'.format(
+                name, shard.oms.url, targets, targets - len(failed_targets),
+                len(failed_targets), '' if code == 0 else ', errors')
+            totals[0] += targets
+            totals[1] += len(failed_targets)
+        print 'Total: {} target(s) on {} OMS, {} ok, {} failed'.format(
+            totals[0], len(shards), totals[0] - totals[1], totals[1])
+
+    # With a replication factor, show how the tests spread over beacons
+    if beacon_placement.replicas is not None:
+        failed_targets = set()
+        for outcome in outcomes.values():
+            failed_targets.update(outcome[2])
+        pods = set(target.pod for target in run.targets())
+        tests = placement.count_tests(
+            (target for target in run.targets()
+             if target.name not in failed_targets),
+            [settings.beacons[pod] for pod in sorted(pods)])
+        print 'Tests per beacon ({} per target):'.format(
+            beacon_placement.replicas)
+        for beacon, count in tests.items():
+            print '  {}: {}'.format(beacon, count)
 
     # Check error code totals and if greater than one, return error
-    if code_total > 0:
+    if any(outcome[0] > 0 for outcome in outcomes.values()):
         return 1
     else:
         return 0
@@ -451,7 +1502,10 @@ def add_batch_ldap_targets(batch_file, ldap_user, ldap_password,
 def add_single_ldap_target(ldap_host, ldap_port, ldap_user, ldap_password,
                            ldap_base, ldap_filter, ldap_search_attrib, beacons,
                            lifecycle, entity_number, pod, group,
-                           em_user, em_pass):
+                           em_user, em_pass, backend='spawn', retries=3,
+                           metrics_json=None, prom_file=None,
+                           force_sync=False, thresholds_file=None,
+                           hash_property=update.HASH_PROPERTY):
     """ Inputs:
             ldap_host - String, ldap hostname
             ldap_port - String, ldap port
@@ -463,78 +1517,876 @@ def add_single_ldap_target(ldap_host, ldap_port, ldap_user, ldap_password,
             beacons - list, a list of beacon names know by OEM
             em_user - string, an authorized OEM user
             em_pass - string, oem password for said user
+            backend - string, emcli backend name (see backends.BACKENDS)
+            retries - int, retries of an emcli call that failed with a
+                      transient error
+            metrics_json - string, file to write the step timings to as a
+                           JSON line
+            prom_file - string, Prometheus textfile to write step and emcli
+                        verb timings to
+            force_sync - bool, log in and sync even if the previous
+                         run's emcli session is still current
+            thresholds_file - string, calibrated thresholds to apply if
+                              they list the target (see calibrate mode)
+            hash_property - string, target property the template hash is
+                            stored in, with the other properties (see
+                            update_ldap_targets)
 
         Returns:
             code - int, error code.
     """
 
-    entity_code = ast.literal_eval(get_config().get('otes', 'entities'))
-    property_records = {'Department': entity_code[entity_number],
+    settings = get_settings()
+    calibration = read_thresholds(thresholds_file)
+    if calibration is None:
+        return 1
+    try:
+        collection_profiles = profiles.from_settings(settings,
+                                                     lifecycle_name())
+    except ValueError, error:
+        print 'ERROR: {}'.format(error)
+        return 1
+    property_records = {'Department': settings.entities[entity_number],
                         'Function': 'LDAP Service',
                         'Lifecycle Status': lifecycle,
                         'Pod': pod
                         }
 
     target_name = '{}_ldap'.format(ldap_host)
-    root = make_xml_template(ldap_user, ldap_password, ldap_host,
-                             ldap_port, ldap_base, ldap_filter,
-                             ldap_search_attrib)
-
-    # Build XML temp file
-    xmlstr = ET.tostring(root)
-
-    # Create temp file
-    temp = tempfile.NamedTemporaryFile('w', 0)
-    temp.write(xmlstr)  # Write xml to temp file.
-    temp.close
-
-    url = get_config().get('oem', 'url')
+    # Calibrated thresholds and the lifecycle's collection profile
+    template_options = dict(calibration.get(target_name, {}),
+                            collection=collection_profiles.collection(
+                                lifecycle))
+    recorder = metrics.Recorder()
+    recorder.target(target_name, pod=pod)
+    inventory_db = inventory.open_inventory(settings)
+
+    def finish(code):
+        recorder.finish(target_name, code)
+        recorder.write(metrics_json, prom_file)
+        if inventory_db is not None:
+            inventory_db.close()
+        return code
 
-    # Crete emcli client object
-    emcli = emclpy.Emclpy(url, em_user, em_pass)
-    code, out, err = emcli.login()  # login to emcli
+    # Build XML template
+    with recorder.timer('render', target_name):
+        xmlstr = render_xml_template(ldap_user, ldap_password, ldap_host,
+                                     ldap_port, ldap_base, ldap_filter,
+                                     ldap_search_attrib, **template_options)
+
+    # Crete emcli client object for the OMS the pod is mapped to
+    oms = settings.oms_for_pod(pod)
+    emcli = retry.RetryingEmcli(
+        throttle.MeteredEmcli(backends.make_emcli(backend, oms.url,
+                                                  em_user, em_pass,
+                                                  oms.emcli),
+                              recorder),
+        retry.RetryPolicy(retries))
+    # Login to emcli and sync, unless the previous run's session is
+    # still current
+    login_state = emcli_state.LoginState(oms.state_file, oms.url,
+                                         em_user, backend)
+    code, out, err = login_state.start(
+        emcli, force_sync, lambda step: recorder.timer(step, target_name))
     if code > 0:
         print err.strip()
-        return code
-    emcli.sync()   # Sync with emcli
-
-    # Create the LDAP target
-    code, out, err = emcli.create_generic_service(target_name,
-                                                  temp.name,
-                                                  beacons)
+        return finish(code)
+
+    # Create the LDAP target from a spooled copy of the template
+    with spool.TemplateSpool() as templates:
+        with recorder.timer('stage', target_name):
+            template = templates.stage(xmlstr, emcli)
+        with recorder.timer('create', target_name):
+            code, out, err = emcli.create_generic_service(
+                target_name, template, beacons)
     if code > 0:
         print err.strip()
-        return code
+        return finish(code)
     else:
         print out.strip()
+    # The template hash is set with the other properties, so the first
+    # update doesn't have to push the template again
+    template_hash = update.template_hash(render_xml_template(
+        ldap_user, update.password_digest(ldap_password, oms.url),
+        ldap_host, ldap_port, ldap_base, ldap_filter, ldap_search_attrib,
+        **template_options))
+    if inventory_db is not None:
+        inventory_db.record(
+            target_name, host=ldap_host, port=ldap_port, pod=pod,
+            beacons=beacons, template_hash=template_hash,
+            provisioned_at=time.time())
 
     # Set target properties
-    code, out, err = emcli.set_target_property_value(target_name,
-                                                     'generic_service',
-                                                     property_records)
+    with recorder.timer('properties', target_name):
+        code, out, err = update.define_hash_property(emcli, hash_property)
+        if code > 0:
+            print_notice('cannot add the {} property: {}'.format(
+                hash_property, err.strip()))
+        code, out, err = emcli.set_target_property_value(
+            target_name, 'generic_service',
+            dict(property_records, **{hash_property: template_hash}))
     if code > 0:
         print err.strip()
-        return code
+        return finish(code)
     else:
         print out.strip()
+    if inventory_db is not None:
+        inventory_db.record(target_name, pod=pod,
+                            entity=property_records['Department'],
+                            lifecycle=lifecycle)
 
     # If the group variable is set, check to see if group exists.  If it
     # does, then add target to group.  If it doesn't, first create group,
     # then add to group.
     if group:
-        if group in emcli.get_groups():
-            code, out, err = emcli.add_to_group(group, target_name,
-                                                'generic_service')
+        with recorder.timer('grouped', target_name):
+            if group in emcli.get_groups():
+                code, out, err = emcli.add_to_group(group, target_name,
+                                                    'generic_service')
+                print out.strip()
+            else:
+                code, out, err = emcli.create_group(group)
+                print out.strip()
+                code, out, err = emcli.add_to_group(group, target_name,
+                                                    'generic_service')
+                print out.strip()
+        if code == 0 and inventory_db is not None:
+            inventory_db.record(target_name, target_group=group)
+
+    with recorder.timer('logout', target_name):
+        login_state.end(emcli)  # Logout of emcli, or keep the session
+    return finish(code)
+
+
+class OmsSession(object):
+    """ An emcli session with one OMS, for the modes that work through
+        the OMSes one after another.
+
+        Inputs:
+            oms - settings.OMS object
+            em_user - string, an authorized OEM user
+            em_pass - string, oem password for said user
+            backend - string, emcli backend name (see backends.BACKENDS)
+            jobs - int, calls in flight, unless the OMS sets its own jobs
+            retries - int, retries of an emcli call that failed with a
+                      transient error
+
+        Attributes:
+            jobs - int, calls in flight with this OMS
+            breaker - retry.CircuitBreaker of the session
+            emcli - retry.RetryingEmcli client
+            started - bool, the session is logged in
+    """
+
+    def __init__(self, oms, em_user, em_pass, backend, jobs, retries):
+        self.oms = oms
+        self.jobs = oms.jobs or jobs
+        self.breaker = retry.CircuitBreaker(notify=print_notice)
+        self.emcli = retry.RetryingEmcli(
+            backends.make_emcli(backend, oms.url, em_user, em_pass,
+                                oms.emcli, sessions=self.jobs),
+            retry.RetryPolicy(retries), self.breaker)
+        self.login_state = emcli_state.LoginState(oms.state_file, oms.url,
+                                                  em_user, backend)
+        self.started = False
+
+    def start(self, force_sync):
+        """ Logs in and syncs, unless the session is started already or
+            the previous run's session is still current, printing the
+            error if that fails.
+
+            Returns:
+                code - int, error code
+        """
+
+        if self.started:
+            return 0
+        code, out, err = self.login_state.start(self.emcli, force_sync)
+        if code > 0:
+            print err.strip()
+            return code
+        self.started = True
+        return 0
+
+    def end(self):
+        """ Logs out, or keeps a reused session. """
+
+        if self.started:
+            self.login_state.end(self.emcli)
+            self.started = False
+
+
+def rows_by_oms(settings, rows):
+    """ Splits batch rows by the OMS their pod is mapped to.
+
+        Returns:
+            OrderedDict, OMS name -> list of its rows, in batch order
+    """
+
+    split = collections.OrderedDict()
+    for row in rows:
+        split.setdefault(settings.oms_for_pod(row.pod).name, []).append(row)
+    return split
+
+
+def remove_target(session, steps_journal, inventory_db, target):
+    """ Delete worker: deletes one target through session's OMS. """
+
+    result = engine.TargetResult(target)
+    code = result.record(*session.emcli.delete_target(target.name,
+                                                      'generic_service'),
+                         step='deleted')
+    if code == 0:
+        steps_journal.record(target.name, 'deleted')
+        if inventory_db is not None:
+            inventory_db.remove(target.name)
+    return result
+
+
+def delete_oms_targets(session, targets, steps_journal, inventory_db):
+    """ Takes targets out of their groups, one call per chunk, then
+        deletes them session.jobs at a time.
+
+        Returns:
+            code_total - int, sum of the error codes
+    """
+
+    code_total = 0
+    members = collections.OrderedDict()
+    remaining = {}
+    for target in targets:
+        if 'ungrouped' in steps_journal.completed(target.name):
+            continue
+        remaining[target.name] = len(target.groups)
+        for target_group in target.groups:
+            members.setdefault(target_group, []).append(target.name)
+    for target_group, group_names in members.items():
+        for chunk, code, out, err in groups.remove_targets_from_group(
+                session.emcli, target_group, group_names,
+                'generic_service'):
+            if code > 0:
+                print err.strip()
+                code_total += code
+                continue
             print out.strip()
+            for name in chunk:
+                remaining[name] -= 1
+                if remaining[name] == 0:
+                    steps_journal.record(name, 'ungrouped')
+
+    code_total += engine.run_batch(
+        targets, functools.partial(remove_target, session, steps_journal,
+                                   inventory_db),
+        jobs=session.jobs)
+    return code_total
+
+
+def delete_ldap_targets(em_user, em_pass, batch_file=None, pattern=None,
+                        pod=None, group='OID', jobs=1, backend='spawn',
+                        journal_file=None, resume=False, batch_format=None,
+                        retries=3, dry_run=False, confirm=None,
+                        force_sync=False):
+    """ Deletes generic service targets, picked from a batch file or by
+        name pattern, with one bulk snapshot per OMS to resolve them.
+        Group membership is removed in bulk first, then targets are
+        deleted jobs at a time.  A batch row's target is deleted through
+        the OMS its pod is mapped to, and a pattern's through the OMS of
+        pod, or through every OMS when there is no pod.
+
+        Inputs:
+            em_user - string, an authorized OEM user
+            em_pass - string, oem password for said user
+            batch_file - string, batch file of the targets to delete (any
+                         batch.FORMATS format; only hosts and groups are
+                         used)
+            pattern - string, shell style target name pattern, used when
+                      there is no batch_file
+            pod - string, only delete targets whose Pod property is pod
+            group - string, OEM group to remove the targets from, besides
+                    any group a batch row names
+            jobs - int, number of targets to delete concurrently
+            backend - string, emcli backend name (see backends.BACKENDS)
+            journal_file - string, file recording each completed step.
+                           Defaults to <batch_file>.delete.journal, or
+                           delete_<pod>.journal for a pattern.
+            resume - bool, skip steps the journal already records
+            batch_format - string, one of batch.FORMATS, or None to pick
+                           from the file extension
+            retries - int, retries of an emcli call that failed with a
+                      transient error
+            dry_run - bool, only print what would be deleted
+            confirm - callable, confirm(count) -> bool, asked before
+                      anything is deleted.  None deletes without asking.
+            force_sync - bool, log in and sync even if the previous
+                         run's emcli session is still current
+
+        Returns:
+            code - int, error code.
+    """
+
+    settings = get_settings()
+
+    # Targets are deleted through the OMS their pod is mapped to: a batch
+    # file's rows by their pods, a pattern through the OMS of pod, or
+    # through every OMS without one
+    names = collections.OrderedDict()
+    search_groups = set([group]) if group else set()
+    if batch_file:
+        errors = []
+        rows = list(batch.read_batch(batch_file, batch_format,
+                                     errors=errors))
+        if errors:
+            for error in errors:
+                print 'ERROR: {}'.format(error)
+            print ('ERROR: {} problem(s) found in {}, nothing was '
+                   'deleted').format(len(errors), batch_file)
+            return 1
+        for name, oms_rows in rows_by_oms(settings, rows).items():
+            names[name] = ['{}_ldap'.format(row.ldap_host)
+                           for row in oms_rows]
+        search_groups.update(row.group for row in rows if row.group)
+    elif pattern:
+        for name in ([settings.oms_for_pod(pod).name] if pod
+                     else settings.oms):
+            names[name] = None
+    else:
+        print 'ERROR: a batch file or a target name pattern is required'
+        return 1
+
+    sessions = [OmsSession(settings.oms[name], em_user, em_pass, backend,
+                           jobs, retries) for name in names]
+    # OMSes may share an emcli install, so with several of them only one
+    # is logged in at a time
+    keep = len(sessions) == 1
+    found = []
+    try:
+        # One bulk query per OMS for the targets and their properties,
+        # one per group
+        for session in sessions:
+            code = session.start(force_sync)
+            if code > 0:
+                return code
+            snapshot, errors = reconcile.take_snapshot(
+                session.emcli, 'generic_service', sorted(search_groups))
+            if errors:
+                for error in errors:
+                    print error
+                return 1
+            targets, missing = decommission.resolve_targets(
+                snapshot, names[session.oms.name], pattern, pod)
+            for name in missing:
+                print '{} does not exist, skipping'.format(name)
+            found.append((session, targets))
+            if not keep:
+                session.end()
+
+        targets = [target for _, oms_targets in found
+                   for target in oms_targets]
+        if not targets or dry_run:
+            for target in targets:
+                if target.groups:
+                    print 'Would delete {} (member of {})'.format(
+                        target.name, ', '.join(target.groups))
+                else:
+                    print 'Would delete {}'.format(target.name)
+            if not targets:
+                print 'No targets to delete'
+            return 0
+        if confirm is not None and not confirm(len(targets)):
+            print 'Nothing was deleted'
+            return 1
+
+        if not journal_file:
+            journal_file = ('{}.delete.journal'.format(batch_file)
+                            if batch_file
+                            else 'delete_{}.journal'.format(pod or 'all'))
+        steps_journal = journal.Journal(journal_file, resume=resume)
+        inventory_db = inventory.open_inventory(settings)
+        code_total = 0
+        try:
+            for session, oms_targets in found:
+                if not oms_targets:
+                    continue
+                code = session.start(force_sync)
+                if code > 0:
+                    code_total += code
+                    continue
+                code_total += delete_oms_targets(session, oms_targets,
+                                                 steps_journal, inventory_db)
+                if not keep:
+                    session.end()
+        finally:
+            steps_journal.close()
+            if inventory_db is not None:
+                inventory_db.close()
+    finally:
+        for session in sessions:
+            session.end()
+
+    for session in sessions:
+        if session.breaker.broken:
+            print ('ERROR: OMS {} unavailable, rerun with --resume to '
+                   'continue from {}').format(session.oms.url,
+                                              steps_journal.path)
+
+    if code_total > 0:
+        return 1
+    else:
+        return 0
+
+
+def update_ldap_targets(batch_file, ldap_user, ldap_password, ldap_base,
+                        ldap_filter, ldap_search_attrib, em_user, em_pass,
+                        jobs=1, backend='spawn', batch_format=None,
+                        retries=3, hash_property=update.HASH_PROPERTY,
+                        force=False,
+                        dry_run=False, force_sync=False,
+                        thresholds_file=None):
+    """ Re-renders the template of every target in a batch file and pushes
+        it (apply_template_tests) only to the targets whose deployed
+        template hash differs, jobs at a time.  The new hash is then stored
+        in the target's hash_property, so the next run skips it.  Each
+        row's target is updated through the OMS its pod is mapped to, one
+        OMS at a time.
+
+        Inputs:
+            batch_file - String, batch file of the targets (any
+                         batch.FORMATS format; ldap_base and ldap_filter
+                         overrides are honoured)
+            ldap_user - string, LDAP user
+            ldap_password - string, ldap password
+            ldap_base - string, ldap base
+            ldap_filter - string, ldap search filter
+            ldap_search_attrib - string, attribute to compare
+            em_user - string, an authorized OEM user
+            em_pass - string, oem password for said user
+            jobs - int, number of targets to update concurrently
+            backend - string, emcli backend name (see backends.BACKENDS)
+            batch_format - string, one of batch.FORMATS, or None to pick
+                           from the file extension
+            retries - int, retries of an emcli call that failed with a
+                      transient error
+            hash_property - string, target property holding the hash
+            force - bool, push to every target even if its hash matches
+            dry_run - bool, only print the targets that differ
+            force_sync - bool, log in and sync even if the previous
+                         run's emcli session is still current
+            thresholds_file - string, calibrated thresholds to apply to
+                              the targets it lists (see calibrate mode)
+
+        Each template gets the collection profile of the lifecycle its
+        batch row names, or else of the target's Lifecycle Status.
+
+        Returns:
+            code - int, error code.
+    """
+
+    settings = get_settings()
+    calibration = read_thresholds(thresholds_file)
+    if calibration is None:
+        return 1
+    try:
+        collection_profiles = profiles.from_settings(settings,
+                                                     lifecycle_name())
+    except ValueError, error:
+        print 'ERROR: {}'.format(error)
+        return 1
+
+    errors = []
+    rows = list(batch.read_batch(batch_file, batch_format, errors=errors))
+    if errors:
+        for error in errors:
+            print 'ERROR: {}'.format(error)
+        print ('ERROR: {} problem(s) found in {}, nothing was '
+               'updated').format(len(errors), batch_file)
+        return 1
+
+    counts = {'current': 0}
+    missing = []
+    # Target name -> render_xml_template keyword arguments
+    template_options = {}
+
+    def changed_targets(oms_rows, snapshot, digest):
+        """ Yields a BatchTarget, holding its new hash as its only
+            property, for every target that needs the new template.
+        """
+
+        for row in oms_rows:
+            name = '{}_ldap'.format(row.ldap_host)
+            row_base = row.ldap_base or ldap_base
+            row_filter = row.ldap_filter or ldap_filter
+            if row.lifecycle:
+                row_lifecycle = lifecycle_name().get(row.lifecycle.lower())
+            else:
+                row_lifecycle = snapshot.targets.get(name, {}).get(
+                    'Lifecycle Status')
+            options = template_options[name] = dict(
+                calibration.get(name, {}),
+                collection=collection_profiles.collection(row_lifecycle))
+            desired = update.template_hash(render_xml_template(
+                ldap_user, digest, row.ldap_host, row.ldap_port, row_base,
+                row_filter, ldap_search_attrib, **options))
+            state = update.differs(snapshot, name, desired, hash_property)
+            if state is None:
+                missing.append(name)
+            elif state or force:
+                yield engine.BatchTarget(row.ldap_host, row.ldap_port,
+                                         row.pod, (),
+                                         {hash_property: desired},
+                                         ldap_base=row_base,
+                                         ldap_filter=row_filter)
+            else:
+                counts['current'] += 1
+
+    def push(emcli, templates, target):
+        """ Applies the new template to one target, then records its
+            hash.
+        """
+
+        result = engine.TargetResult(target)
+        xmlstr = render_xml_template(ldap_user, ldap_password,
+                                     target.ldap_host, target.ldap_port,
+                                     target.ldap_base, target.ldap_filter,
+                                     ldap_search_attrib,
+                                     **template_options[target.name])
+        code = result.record(*emcli.run(
+            'apply_template_tests', targetName=target.name,
+            targetType='generic_service',
+            input_file='template:{}'.format(templates.stage(xmlstr, emcli)),
+            replaceExistingTests=True))
+        if code == 0:
+            code = result.record(*emcli.set_target_property_value(
+                target.name, 'generic_service', target.properties))
+        if code == 0 and inventory_db is not None:
+            inventory_db.record(
+                target.name, host=target.ldap_host, port=target.ldap_port,
+                template_hash=target.properties[hash_property])
+        return result
+
+    def update_oms(session, oms_rows):
+        """ Pushes the changed templates of oms_rows through session's
+            OMS.
+
+            Returns:
+                code_total - int, sum of the error codes
+        """
+
+        # One bulk query for every target's properties, deployed hash
+        # included
+        snapshot, errors = reconcile.take_snapshot(session.emcli,
+                                                   'generic_service')
+        if errors:
+            for error in errors:
+                print error
+            return 1
+
+        # Templates are hashed with this in place of the password
+        digest = update.password_digest(ldap_password, session.oms.url)
+        if dry_run:
+            for target in changed_targets(oms_rows, snapshot, digest):
+                print 'Would update {}'.format(target.name)
+            return 0
+
+        code, out, err = update.define_hash_property(session.emcli,
+                                                     hash_property)
+        if code > 0:
+            print_notice('cannot add the {} property: {}'.format(
+                hash_property, err.strip()))
+        with spool.TemplateSpool() as templates:
+            return engine.run_batch(
+                changed_targets(oms_rows, snapshot, digest),
+                functools.partial(push, session.emcli, templates),
+                jobs=session.jobs)
+
+    # Each row's target is updated through the OMS its pod is mapped to,
+    # one OMS at a time
+    sessions = []
+    code_total = 0
+    inventory_db = None if dry_run else inventory.open_inventory(settings)
+    try:
+        for name, oms_rows in rows_by_oms(settings, rows).items():
+            session = OmsSession(settings.oms[name], em_user, em_pass,
+                                 backend, jobs, retries)
+            sessions.append(session)
+            code = session.start(force_sync)
+            if code > 0:
+                code_total += code
+                continue
+            try:
+                code_total += update_oms(session, oms_rows)
+            finally:
+                session.end()
+    finally:
+        if inventory_db is not None:
+            inventory_db.close()
+
+    for name in missing:
+        print '{} does not exist, skipping'.format(name)
+    print '{} target(s) already up to date'.format(counts['current'])
+
+    for session in sessions:
+        if session.breaker.broken:
+            print ('ERROR: OMS {} unavailable, rerun to update the '
+                   'remaining targets').format(session.oms.url)
+
+    if code_total > 0:
+        return 1
+    else:
+        return 0
+
+
+def sync_inventory(em_user, em_pass, target_groups=('OID',), jobs=4,
+                   backend='spawn', retries=3,
+                   hash_property=update.HASH_PROPERTY, force_sync=False):
+    """ Refreshes the local inventory from every OMS of the config.  The
+        refresh is split into independent queries (see
+        inventory.sync_queries) that run jobs at a time against each OMS
+        in turn; the inventory is only replaced, in one transaction, if
+        every OMS answered every query.
+
+        Inputs:
+            em_user - string, an authorized OEM user
+            em_pass - string, oem password for said user
+            target_groups - iterable of OEM groups whose membership is
+                            recorded
+            jobs - int, number of queries to run concurrently
+            backend - string, emcli backend name (see backends.BACKENDS)
+            retries - int, retries of an emcli call that failed with a
+                      transient error
+            hash_property - string, target property holding the template
+                            hash
+            force_sync - bool, log in and sync even if the previous
+                         run's emcli session is still current
+
+        Returns:
+            code - int, error code.
+    """
+
+    settings = get_settings()
+    inventory_db = inventory.open_inventory(settings)
+    if inventory_db is None:
+        print 'ERROR: the inventory is turned off ([inventory] path)'
+        return 1
+
+    listing = inventory.Listing(hash_property, update.HASH_PREFIX)
+    failed = []
+
+    def query(emcli, item):
+        """ Runs one query of the refresh. """
+
+        result = engine.TargetResult(item)
+        result.record(*emcli.run(item.verb, **item.options))
+        return result
+
+    def collect(result):
+        if result.code == 0:
+            listing.add(result.target, result.output[0])
+        elif result.target.group is None:
+            # A group that doesn't exist yet simply has no members
+            engine.print_result(result)
+            failed.append(result.target.name)
+
+    try:
+        # Every OMS is queried, one at a time, into one listing; an OMS
+        # that can't be logged in to counts as a failed query
+        for oms in settings.oms.values():
+            session = OmsSession(oms, em_user, em_pass, backend, jobs,
+                                 retries)
+            if session.start(force_sync) > 0:
+                failed.append(oms.name)
+                continue
+            try:
+                engine.run_batch(
+                    inventory.sync_queries('generic_service', target_groups,
+                                           hash_property),
+                    functools.partial(query, session.emcli),
+                    jobs=session.jobs, emit=collect)
+            finally:
+                session.end()
+
+        if failed:
+            print ('ERROR: {} of the inventory queries failed, the inventory '
+                   'was left as it was').format(len(failed))
+            return 1
+        updated, removed = inventory_db.replace(listing.records())
+    finally:
+        inventory_db.close()
+    print 'Inventory {}: {} target(s) refreshed, {} removed'.format(
+        inventory_db.path, updated, removed)
+    return 0
+
+
+def check_ldap_targets(batch_file, ldap_user, ldap_password, ldap_base,
+                       ldap_filter, ldap_search_attrib, batch_format=None,
+                       timeout=synthetic.DEFAULT_TIMEOUT,
+                       concurrency=probe.DEFAULT_CONCURRENCY,
+                       thresholds_file=None):
+    """ Runs the LDAP_test transaction against every host in a batch file
+        and prints the ldap_response metrics each would report, with the
+        template thresholds they cross.
+
+        Inputs:
+            batch_file - String, path to the batch file
+            ldap_user - string, LDAP user
+            ldap_password - string, ldap password
+            ldap_base - string, ldap base (rows may override it)
+            ldap_filter - string, ldap search filter (rows may override it)
+            ldap_search_attrib - string, attribute value to compare
+            batch_format - string, one of batch.FORMATS, or None to pick
+                           from the file extension.
+            timeout - float, seconds each host's transaction may take
+            concurrency - int, most hosts tested at once
+            thresholds_file - string, calibrated thresholds to check the
+                              targets it lists against (see calibrate
+                              mode)
+
+        Returns:
+            code - int, 1 if any host crossed a critical threshold
+            (including a failed test), otherwise 0
+    """
+
+    calibration = read_thresholds(thresholds_file)
+    if calibration is None:
+        return 1
+    try:
+        targets = [(row.ldap_host, row.ldap_port, row.ldap_base or ldap_base,
+                    row.ldap_filter or ldap_filter)
+                   for row in batch.read_batch(batch_file, batch_format)]
+    except batch.BatchFileError, error:
+        print 'ERROR: {}'.format(error)
+        return 1
+
+    def template_thresholds(**options):
+        return synthetic.template_thresholds(make_xml_template(
+            ldap_user, ldap_password, '', '', ldap_base, ldap_filter,
+            ldap_search_attrib, **options))
+
+    default_thresholds = template_thresholds()
+
+    tests = synthetic.check_hosts(targets, ldap_user, ldap_password,
+                                  ldap_search_attrib, timeout=timeout,
+                                  concurrency=concurrency)
+    counts = collections.Counter()
+    for test in tests:
+        columns = ' '.join('{}={:g}'.format(column,
+                                            round(test.metrics[column], 1))
+                           for column in synthetic.COLUMNS
+                           if column in test.metrics)
+        print '{}:{} {}'.format(test.host, test.port, columns)
+        if test.error:
+            print '    {}'.format(test.error)
+        options = calibration.get('{}_ldap'.format(test.host))
+        thresholds = (template_thresholds(thresholds=options['thresholds'])
+                      if options else default_thresholds)
+        alerts = synthetic.evaluate(test.metrics, thresholds)
+        for column, severity, value, symbol, limit in alerts:
+            print '    {} {} {:g} {} {:g}'.format(severity.upper(), column,
+                                                  round(value, 1), symbol,
+                                                  limit)
+        severities = set(alert[1] for alert in alerts)
+        if synthetic.CRITICAL in severities:
+            counts[synthetic.CRITICAL] += 1
+        elif synthetic.WARNING in severities:
+            counts[synthetic.WARNING] += 1
         else:
-            code, out, err = emcli.create_group(group)
-            print out.strip()
-            code, out, err = emcli.add_to_group(group, target_name,
-                                                'generic_service')
-            print out.strip()
+            counts['ok'] += 1
+    print '{} host(s) checked: {} ok, {} warning, {} critical'.format(
+        len(tests), counts['ok'], counts[synthetic.WARNING],
+        counts[synthetic.CRITICAL])
+    return 1 if counts[synthetic.CRITICAL] else 0
+
+
+def calibrate_thresholds(output, batch_file=None, metrics_csv=None,
+                         ldap_user=None, ldap_password=None, ldap_base=None,
+                         ldap_filter=None, ldap_search_attrib=None,
+                         batch_format=None, samples=20, interval=15.0,
+                         state_file=None,
+                         quantile=calibrate.DEFAULT_QUANTILE,
+                         warning_factor=calibrate.DEFAULT_WARNING_FACTOR,
+                         critical_factor=calibrate.DEFAULT_CRITICAL_FACTOR,
+                         min_samples=calibrate.DEFAULT_MIN_SAMPLES,
+                         timeout=synthetic.DEFAULT_TIMEOUT,
+                         concurrency=probe.DEFAULT_CONCURRENCY,
+                         sleep=time.sleep):
+    """ Collects ldap_response latency samples, from rounds of local
+        synthetic checks of the hosts in a batch file and/or an OEM metric
+        data export, and writes per-target thresholds computed from them
+        for add and update runs to apply (--thresholds).
 
-    emcli.logout()  # Logout of emcli
-    return code
+        Inputs:
+            output - String, thresholds file to write
+            batch_file - String, batch file of hosts to check locally, or
+                         None
+            metrics_csv - String, CSV export of OEM ldap_response metric
+                          data (see calibrate.CSV_FIELDS), or None
+            ldap_user, ldap_password, ldap_base, ldap_filter,
+            ldap_search_attrib - the LDAP_test settings, as for add
+            batch_format - string, one of batch.FORMATS, or None to pick
+                           from the file extension
+            samples - int, rounds of local checks
+            interval - float, seconds between rounds
+            state_file - String, JSON file keeping the sketches between
+                         calibration runs, or None
+            quantile - float, latency quantile thresholds are based on
+            warning_factor - float, warning threshold = quantile x this
+            critical_factor - float, critical threshold = quantile x this
+            min_samples - int, targets (and beacons) with fewer samples
+                          keep the default thresholds
+            timeout - float, seconds each host's transaction may take
+            concurrency - int, most hosts checked at once
+            sleep - callable sleeping between rounds
+
+        Returns:
+            code - int, error code.
+    """
+
+    try:
+        store = calibrate.SketchStore(state_file)
+    except (ValueError, KeyError), error:
+        print 'ERROR: cannot read sketches from {}: {}'.format(state_file,
+                                                               error)
+        return 1
+
+    if metrics_csv:
+        try:
+            added, skipped = calibrate.read_metric_export(store, metrics_csv)
+        except (IOError, ValueError, csv.Error), error:
+            print 'ERROR: cannot read {}: {}'.format(metrics_csv, error)
+            return 1
+        print 'Read {} sample(s) from {} ({} row(s) skipped)'.format(
+            added, metrics_csv, skipped)
+
+    if batch_file:
+        try:
+            targets = [(row.ldap_host, row.ldap_port,
+                        row.ldap_base or ldap_base,
+                        row.ldap_filter or ldap_filter)
+                       for row in batch.read_batch(batch_file, batch_format)]
+        except batch.BatchFileError, error:
+            print 'ERROR: {}'.format(error)
+            return 1
+        for sample in range(samples):
+            if sample:
+                sleep(interval)
+            tests = synthetic.check_hosts(targets, ldap_user, ldap_password,
+                                          ldap_search_attrib,
+                                          timeout=timeout,
+                                          concurrency=concurrency)
+            print 'Round {}/{}: {} of {} host(s) answered'.format(
+                sample + 1, samples, calibrate.add_checks(store, tests),
+                len(tests))
+
+    store.save()
+    options = dict(quantile=quantile, warning_factor=warning_factor,
+                   critical_factor=critical_factor, min_samples=min_samples)
+    calibrated = calibrate.calibrate(store, **options)
+    calibrate.save_thresholds(output, calibrated, **options)
+    overridden = sum(1 for target in calibrated.values()
+                     if target['beacon_thresholds'])
+    print ('Calibrated {} of {} target(s) ({} with beacon overrides), '
+           'written to {}').format(len(calibrated), len(store.targets()),
+                                   overridden, output)
+    return 0
 
 
 def main():
@@ -542,7 +2394,82 @@ def main():
     """
 
     args = get_arguments(sys.argv[1:])
-    entity_code = ast.literal_eval(get_config().get('otes', 'entities'))
+    settings = get_settings()
+    entity_code = settings.entities
+
+    if args.mode == 'check':
+        return check_ldap_targets(args.batch_file, args.ldap_user,
+                                  args.ldap_password, args.ldap_base,
+                                  args.ldap_filter, args.ldap_search_attrib,
+                                  batch_format=args.batch_format,
+                                  timeout=args.timeout,
+                                  concurrency=args.concurrency,
+                                  thresholds_file=args.thresholds)
+
+    if args.mode == 'calibrate':
+        return calibrate_thresholds(
+            args.output, batch_file=args.batch_file,
+            metrics_csv=args.metrics_csv, ldap_user=args.ldap_user,
+            ldap_password=args.ldap_password, ldap_base=args.ldap_base,
+            ldap_filter=args.ldap_filter,
+            ldap_search_attrib=args.ldap_search_attrib,
+            batch_format=args.batch_format, samples=args.samples,
+            interval=args.interval, state_file=args.state,
+            quantile=args.quantile, warning_factor=args.warning_factor,
+            critical_factor=args.critical_factor,
+            min_samples=args.min_samples, timeout=args.timeout,
+            concurrency=args.concurrency)
+
+    if args.mode == 'update':
+        em_pass = getpass.getpass('OEM Password for {}: '.format(
+            args.em_login))
+        return update_ldap_targets(args.batch_file, args.ldap_user,
+                                   args.ldap_password, args.ldap_base,
+                                   args.ldap_filter, args.ldap_search_attrib,
+                                   args.em_login, em_pass, jobs=args.jobs,
+                                   backend=args.backend,
+                                   batch_format=args.batch_format,
+                                   retries=args.retries,
+                                   hash_property=args.hash_property,
+                                   force=args.force, dry_run=args.dry_run,
+                                   force_sync=args.force_sync,
+                                   thresholds_file=args.thresholds)
+
+    if args.mode == 'sync-inventory':
+        em_pass = getpass.getpass('OEM Password for {}: '.format(
+            args.em_login))
+        return sync_inventory(args.em_login, em_pass,
+                              target_groups=args.group or ['OID'],
+                              jobs=args.jobs, backend=args.backend,
+                              retries=args.retries,
+                              hash_property=args.hash_property,
+                              force_sync=args.force_sync)
+
+    if args.mode == 'delete':
+        em_pass = getpass.getpass('OEM Password for {}: '.format(
+            args.em_login))
+
+        def confirm(count):
+            answer = raw_input('Delete {} target(s)? [y/N] '.format(count))
+            return answer.strip().lower() in ('y', 'yes')
+
+        return delete_ldap_targets(args.em_login, em_pass,
+                                   batch_file=args.batch_file,
+                                   pattern=args.pattern, pod=args.pod,
+                                   group=args.group, jobs=args.jobs,
+                                   backend=args.backend,
+                                   journal_file=args.journal,
+                                   resume=args.resume,
+                                   batch_format=args.batch_format,
+                                   retries=args.retries,
+                                   dry_run=args.dry_run,
+                                   confirm=None if args.yes else confirm,
+                                   force_sync=args.force_sync)
+
+    # Validate the host, whose target name emcli has to be able to use
+    if args.mode == 'single' and preflight.host_problem(args.ldap_host):
+        print 'ERROR: {}'.format(preflight.host_problem(args.ldap_host))
+        return 1
 
     # Validate lifecycle
     if str(args.lifecycle).lower() in lifecycle_name().keys():
@@ -562,24 +2489,55 @@ def main():
     # Get user's OEM password
     em_pass = getpass.getpass('OEM Password for {}: '.format(args.em_login))
 
-    # Get beacons list from config file
-    beacons = ast.literal_eval(get_config().get('otes', 'beacons'))
-
     # If running in batch, drive in batch mode.
-    if '-F' in sys.argv:
+    if args.mode == 'batch':
         args_list = [args.batch_file, args.ldap_user,
                      args.ldap_password, args.ldap_base, args.ldap_filter,
                      args.ldap_search_attrib, lifecycle,
                      entity_number, args.group, args.em_login, em_pass]
-        return add_batch_ldap_targets(*args_list)
+        return add_batch_ldap_targets(*args_list, jobs=args.jobs,
+                                      backend=args.backend,
+                                      reconcile_mode=args.reconcile,
+                                      journal_file=args.journal,
+                                      resume=args.resume,
+                                      batch_format=args.batch_format,
+                                      retries=args.retries,
+                                      adaptive=args.adaptive,
+                                      max_jobs=args.max_jobs,
+                                      pod_jobs=args.pod_jobs,
+                                      metrics_json=args.metrics_json,
+                                      prom_file=args.prom_file,
+                                      force_sync=args.force_sync,
+                                      probe_mode=args.probe,
+                                      probe_timeout=args.probe_timeout,
+                                      skip_unreachable=args.skip_unreachable,
+                                      thresholds_file=args.thresholds,
+                                      replicas=args.replicas,
+                                      budget=args.budget,
+                                      rebalance=args.rebalance,
+                                      hash_property=args.hash_property)
     # If not running in batch, drive in interactive mode
     else:
+        try:
+            beacon_placement = placement.from_settings(settings,
+                                                       args.replicas)
+        except ValueError, error:
+            print 'ERROR: {}'.format(error)
+            return 1
         args_list = [args.ldap_host, args.ldap_port, args.ldap_user,
                      args.ldap_password, args.ldap_base, args.ldap_filter,
-                     args.ldap_search_attrib, beacons[args.pod],
+                     args.ldap_search_attrib,
+                     beacon_placement.assign(args.pod, '{}_ldap'.format(
+                         args.ldap_host)),
                      lifecycle, entity_number, args.pod, args.group,
                      args.em_login, em_pass]
-        return add_single_ldap_target(*args_list)
+        return add_single_ldap_target(*args_list, backend=args.backend,
+                                      retries=args.retries,
+                                      metrics_json=args.metrics_json,
+                                      prom_file=args.prom_file,
+                                      force_sync=args.force_sync,
+                                      thresholds_file=args.thresholds,
+                                      hash_property=args.hash_property)
 
 
 if __name__ == "__main__":
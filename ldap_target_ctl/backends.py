@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+""" emcli client backends.  Every backend offers the emclpy.Emclpy methods
+    the add paths use (login, sync, logout, create_generic_service,
+    set_target_property_value, get_groups, create_group, add_to_group,
+    delete_target) with the same (code, out, err) contract, plus a generic
+    run(verb, *args, **options) for verbs emclpy doesn't wrap, which uses
+    the configured emcli command.  The session backend runs every verb
+    through run().
+
+        spawn   - emclpy.Emclpy, one emcli (JVM) process per verb
+        session - one long-lived emcli script-mode process per session,
+                  verbs are piped into it (see emcli_driver.py)
+        fake    - an in-process simulated OMS (see fake.py), no emcli needed
+
+    emclpy is only needed by the spawn backend.
+"""
+
+import os
+import shlex
+import threading
+import subprocess
+import Queue
+
+from .properties import property_records
+
+try:
+    import emclpy
+except ImportError:
+    emclpy = None
+
+BACKENDS = ('spawn', 'session', 'fake')
+
+DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'emcli_driver.py')
+FRAME = '@@LTC'
+
+
+def verb_arguments(verb, options):
+    """ Renders verb options as emcli command line arguments.
+
+        Inputs:
+            verb - String, emcli verb name
+            options - dict, option name -> value.  True renders a bare flag
+                      (-noheader); None and False are left out; a list or
+                      tuple repeats the option once per value (-search).
+
+        Returns:
+            List of command line arguments, starting with the verb.
+    """
+
+    arguments = [verb]
+    for name in sorted(options):
+        value = options[name]
+        if value is True:
+            arguments.append('-{}'.format(name))
+        elif isinstance(value, (list, tuple)):
+            arguments.extend('-{}={}'.format(name, item) for item in value)
+        elif value is not None and value is not False:
+            arguments.append('-{}={}'.format(name, value))
+    return arguments
+
+
+class VerbMethods(object):
+    """ emclpy.Emclpy compatible methods written in terms of run().  Mixed
+        into the session backends, which drive emcli verbs directly and
+        provide run(verb, *args, **options) returning (code, out, err).
+    """
+
+    def sync(self):
+        return self.run('sync')
+
+    def create_generic_service(self, name, template, beacons):
+        return self.run('create_service', name=name, type='generic_service',
+                        availType='test', availOp='or',
+                        input_file='template:{}'.format(template),
+                        beacons=';'.join('{}:Y'.format(beacon)
+                                         for beacon in beacons))
+
+    def set_target_property_value(self, name, target_type, properties):
+        records, options = property_records(
+            [(name, prop, value)
+             for prop, value in sorted(properties.items())], target_type)
+        return self.run('set_target_property_value',
+                        property_records=records, **options)
+
+    def get_groups(self):
+        code, out, err = self.run('get_groups', script=True, noheader=True)
+        if code > 0:
+            return []
+        return [line.split('\t')[0].strip() for line in out.splitlines()
+                if line.strip()]
+
+    def create_group(self, name):
+        return self.run('create_group', name=name)
+
+    def add_to_group(self, group, target, target_type):
+        return self.run('modify_group', name=group,
+                        add_targets='{}:{}'.format(target, target_type))
+
+    def delete_target(self, name, target_type):
+        return self.run('delete_target', name=name, type=target_type)
+
+
+class SpawnEmcli(emclpy.Emclpy if emclpy is not None else object):
+    """ emclpy.Emclpy with run() added for the verbs emclpy doesn't wrap.
+        Each verb is a fresh emcli process: emclpy's own verbs run the
+        emcli emclpy is set up with, run() the configured emcli command.
+    """
+
+    def __init__(self, url, em_user, em_pass, emcli='emcli'):
+        if emclpy is None:
+            raise ImportError('the spawn backend needs the emclpy package')
+        emclpy.Emclpy.__init__(self, url, em_user, em_pass)
+        self.emcli_command = shlex.split(emcli)
+
+    def run(self, verb, *args, **options):
+        """ Runs one emcli verb in its own process.
+
+            Returns:
+                (code, out, err)
+        """
+
+        try:
+            process = subprocess.Popen(self.emcli_command +
+                                       verb_arguments(verb, options) +
+                                       list(args),
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        except OSError, error:
+            return 1, '', 'ERROR: cannot run {}: {}'.format(
+                ' '.join(self.emcli_command), error)
+        out, err = process.communicate()
+        return process.returncode, out, err
+
+
+class EmcliSession(VerbMethods):
+    """ One long-lived emcli script-mode process.  Verbs are written to the
+        process's stdin and framed responses read back, so the JVM starts
+        once per session instead of once per verb.  Calls are serialized;
+        use EmcliSessionPool for concurrent callers.  If the process dies it
+        is restarted (and logged back in) on the next call.
+    """
+
+    def __init__(self, url, em_user, em_pass, emcli='emcli'):
+        self.url = url
+        self.em_user = em_user
+        self.em_pass = em_pass
+        self.emcli_command = shlex.split(emcli)
+        self.logged_in = False
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            self.emcli_command + ['@{}'.format(DRIVER)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _request(self, verb, args, options):
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+            if self.logged_in and verb != 'login':
+                code, out, err = self._login()
+                if code > 0:
+                    return code, out, err
+        return self._exchange(verb, args, options)
+
+    def _exchange(self, verb, args, options):
+        try:
+            self._process.stdin.write(repr((verb, args, options)) + '\n')
+            self._process.stdin.flush()
+            header = self._process.stdout.readline()
+            # Skip anything emcli prints outside of a response frame
+            while header and not header.startswith(FRAME):
+                header = self._process.stdout.readline()
+            if not header:
+                raise IOError('emcli session ended')
+            code, out_len, err_len = [int(field)
+                                      for field in header.split()[1:4]]
+            out = self._process.stdout.read(out_len)
+            err = self._process.stdout.read(err_len)
+        except (IOError, OSError), error:
+            self.close()
+            return 1, '', 'ERROR: {}'.format(error)
+        return code, out, err
+
+    def _login(self):
+        self._exchange('set_client_property',
+                       ('EMCLI_OMS_URL', self.url), {})
+        return self._exchange('login', (), {'username': self.em_user,
+                                            'password': self.em_pass})
+
+    def run(self, verb, *args, **options):
+        """ Runs one verb in the session.
+
+            Returns:
+                (code, out, err)
+        """
+
+        with self._lock:
+            return self._request(verb, args, options)
+
+    def login(self):
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            code, out, err = self._login()
+            self.logged_in = code == 0
+            return code, out, err
+
+    def logout(self):
+        with self._lock:
+            if self._process is None:
+                return 0, '', ''
+            response = self._request('logout', (), {})
+            self.logged_in = False
+            self.close()
+            return response
+
+    def close(self):
+        """ Ends the emcli process. """
+
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write(repr(('quit', (), {})) + '\n')
+                process.stdin.close()
+        except (IOError, OSError):
+            pass
+        process.wait()
+
+
+class EmcliSessionPool(VerbMethods):
+    """ Up to size EmcliSession processes shared by concurrent callers.
+        Sessions are started (and logged in) as demand requires.
+    """
+
+    def __init__(self, url, em_user, em_pass, emcli='emcli', size=1):
+        self.url = url
+        self.em_user = em_user
+        self.em_pass = em_pass
+        self.emcli = emcli
+        self.size = max(1, size)
+        self.sessions = []
+        self._idle = Queue.Queue()
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+        with self._lock:
+            if len(self.sessions) < self.size:
+                session = EmcliSession(self.url, self.em_user, self.em_pass,
+                                       self.emcli)
+                self.sessions.append(session)
+                if self.sessions[0].logged_in:
+                    session.login()
+                return session
+        return self._idle.get()
+
+    def run(self, verb, *args, **options):
+        session = self._checkout()
+        try:
+            return session.run(verb, *args, **options)
+        finally:
+            self._idle.put(session)
+
+    def login(self):
+        session = self._checkout()
+        try:
+            return session.login()
+        finally:
+            self._idle.put(session)
+
+    def logout(self):
+        response = 0, '', ''
+        with self._lock:
+            for session in self.sessions:
+                response = session.logout()
+            del self.sessions[:]
+            self._idle = Queue.Queue()
+        return response
+
+
+def make_emcli(backend, url, em_user, em_pass, emcli='emcli', sessions=1):
+    """ Creates an emcli client for the named backend.
+
+        Inputs:
+            backend - String, one of BACKENDS
+            url - String, OEM url
+            em_user - String, an authorized OEM user
+            em_pass - String, oem password for said user
+            emcli - String, emcli command line
+            sessions - int, emcli processes to keep for the session backend
+
+        Returns:
+            emclpy.Emclpy compatible client
+    """
+
+    if backend == 'session':
+        if sessions > 1:
+            return EmcliSessionPool(url, em_user, em_pass, emcli, sessions)
+        return EmcliSession(url, em_user, em_pass, emcli)
+    if backend == 'spawn':
+        return SpawnEmcli(url, em_user, em_pass, emcli)
+    if backend == 'fake':
+        from . import fake
+        return fake.FakeEmcli(fake.shared_oms(url), em_user, em_pass)
+    raise ValueError('Unknown emcli backend: {}'.format(backend))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+""" Streaming batch file reader.  Supported formats:
+
+        colon - one ldap_host:ldap_port:pod per line (the original format).
+                IPv6 hosts may be bracketed ([::1]:3060:POD-A) or bare.
+        csv   - header row naming the columns, one target per row
+        jsonl - one JSON object per line
+
+    csv and jsonl rows need ldap_host, ldap_port and pod and may override
+    lifecycle, entity_number, group, ldap_base and ldap_filter.  Blank lines
+    and lines starting with '#' are skipped in every format.
+"""
+
+import os
+import csv
+import json
+
+FORMATS = ('colon', 'csv', 'jsonl')
+REQUIRED = ('ldap_host', 'ldap_port', 'pod')
+OVERRIDES = ('lifecycle', 'entity_number', 'group', 'ldap_base',
+             'ldap_filter')
+EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl',
+              '.ndjson': 'jsonl'}
+
+
+class BatchFileError(ValueError):
+    """ A batch file line that can't be parsed. """
+
+    def __init__(self, line, message):
+        ValueError.__init__(self, 'line {}: {}'.format(line, message))
+        self.line = line
+
+
+class BatchRow(object):
+    """ One target from a batch file.  Overrides that the row doesn't set
+        are None.
+
+        Attributes:
+            line - int, line number in the batch file
+            ldap_host, ldap_port, pod - Strings
+            lifecycle, entity_number, group, ldap_base, ldap_filter -
+                Strings or None
+    """
+
+    __slots__ = ('line',) + REQUIRED + OVERRIDES
+
+    def __init__(self, line, ldap_host, ldap_port, pod, lifecycle=None,
+                 entity_number=None, group=None, ldap_base=None,
+                 ldap_filter=None):
+        self.line = line
+        self.ldap_host = ldap_host
+        self.ldap_port = ldap_port
+        self.pod = pod
+        self.lifecycle = lifecycle
+        self.entity_number = entity_number
+        self.group = group
+        self.ldap_base = ldap_base
+        self.ldap_filter = ldap_filter
+
+
+def detect_format(batch_file):
+    """ Picks a format from the batch file's extension (colon otherwise). """
+
+    return EXTENSIONS.get(os.path.splitext(batch_file)[1].lower(), 'colon')
+
+
+def parse_colon_line(line):
+    """ Splits ldap_host:ldap_port:pod, allowing colons in the host.
+
+        Returns:
+            (ldap_host, ldap_port, pod)
+    """
+
+    fields = line.rsplit(':', 2)
+    if len(fields) != 3 or not all(field.strip() for field in fields):
+        raise ValueError('expected ldap_host:ldap_port:pod')
+    ldap_host, ldap_port, pod = [field.strip() for field in fields]
+    if ldap_host.startswith('[') and ldap_host.endswith(']'):
+        ldap_host = ldap_host[1:-1]
+    return ldap_host, ldap_port, pod
+
+
+def _row_from_mapping(line, mapping):
+    values = {}
+    for name, value in mapping.items():
+        if name not in REQUIRED + OVERRIDES:
+            raise ValueError('unknown column {}'.format(name))
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        if value and value.strip():
+            values[str(name)] = value.strip()
+    missing = [name for name in REQUIRED if name not in values]
+    if missing:
+        raise ValueError('missing {}'.format(', '.join(missing)))
+    return BatchRow(line, **values)
+
+
+def _lines(batch):
+    """ Yields (line number, stripped line), skipping blanks and comments. """
+
+    for number, line in enumerate(batch, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def _colon_rows(batch):
+    for number, line in _lines(batch):
+        try:
+            yield BatchRow(number, *parse_colon_line(line))
+        except ValueError, error:
+            yield BatchFileError(number, error)
+
+
+def _csv_rows(batch):
+    current = [0]
+
+    def text():
+        for number, line in _lines(batch):
+            current[0] = number
+            yield line
+
+    reader = csv.reader(text())
+    header = None
+    while True:
+        try:
+            fields = reader.next()
+        except StopIteration:
+            return
+        except csv.Error, error:
+            yield BatchFileError(current[0], error)
+            continue
+        if header is None:
+            header = [field.strip() for field in fields]
+            continue
+        try:
+            if len(fields) != len(header):
+                raise ValueError('expected {} columns, found {}'.format(
+                    len(header), len(fields)))
+            yield _row_from_mapping(current[0], dict(zip(header, fields)))
+        except ValueError, error:
+            yield BatchFileError(current[0], error)
+
+
+def _jsonl_rows(batch):
+    for number, line in _lines(batch):
+        try:
+            mapping = json.loads(line)
+            if not isinstance(mapping, dict):
+                raise ValueError('expected a JSON object')
+            yield _row_from_mapping(number, mapping)
+        except ValueError, error:
+            yield BatchFileError(number, error)
+
+
+def read_batch(batch_file, batch_format=None, errors=None):
+    """ Yields one BatchRow per target in batch_file without reading the
+        whole file into memory.
+
+        Inputs:
+            batch_file - String, path to the batch file
+            batch_format - String, one of FORMATS.  Detected from the file
+                           extension when None.
+            errors - list or None.  When a list, unparseable lines are
+                     appended to it as BatchFileError objects and skipped;
+                     otherwise the first one is raised.
+
+        Returns:
+            Generator of BatchRow objects
+    """
+
+    batch_format = batch_format or detect_format(batch_file)
+    rows = {'colon': _colon_rows, 'csv': _csv_rows,
+            'jsonl': _jsonl_rows}[batch_format]
+    with open(batch_file, 'r') as batch:
+        for row in rows(batch):
+            if isinstance(row, BatchFileError):
+                if errors is None:
+                    raise row
+                errors.append(row)
+                continue
+            yield row
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+""" Just enough BER (and LDAP v3, RFC 4511) to write the requests the probes
+    send and read the responses they get back.  Search filters are given as
+    RFC 4515 strings.
+"""
+
+# Universal tags
+BOOLEAN = 0x01
+INTEGER = 0x02
+OCTET_STRING = 0x04
+ENUMERATED = 0x0a
+SEQUENCE = 0x30
+
+# LDAP protocol operations (APPLICATION tags)
+BIND_REQUEST = 0x60
+BIND_RESPONSE = 0x61
+UNBIND_REQUEST = 0x42
+SEARCH_REQUEST = 0x63
+SEARCH_RESULT_ENTRY = 0x64
+SEARCH_RESULT_DONE = 0x65
+SEARCH_RESULT_REFERENCE = 0x73
+COMPARE_REQUEST = 0x6e
+COMPARE_RESPONSE = 0x6f
+# Context tag of simple authentication in a BindRequest
+SIMPLE_AUTH = 0x80
+
+# Search scopes
+SCOPE_BASE = 0
+SCOPE_ONE = 1
+SCOPE_SUBTREE = 2
+
+# LDAP result codes
+SUCCESS = 0
+COMPARE_FALSE = 5
+COMPARE_TRUE = 6
+NO_SUCH_OBJECT = 32
+INVALID_CREDENTIALS = 49
+
+# Filter choices (context tags)
+FILTER_AND = 0xa0
+FILTER_OR = 0xa1
+FILTER_NOT = 0xa2
+FILTER_EQUALITY = 0xa3
+FILTER_SUBSTRINGS = 0xa4
+FILTER_GREATER_OR_EQUAL = 0xa5
+FILTER_LESS_OR_EQUAL = 0xa6
+FILTER_PRESENT = 0x87
+FILTER_APPROX = 0xa8
+SUBSTRING_INITIAL = 0x80
+SUBSTRING_ANY = 0x81
+SUBSTRING_FINAL = 0x82
+
+
+class BERError(ValueError):
+    """ Raised for data that isn't the BER expected. """
+
+
+def encode_length(length):
+    """ Returns the BER definite length octets of length. """
+
+    if length < 0x80:
+        return chr(length)
+    octets = ''
+    while length:
+        octets = chr(length & 0xff) + octets
+        length >>= 8
+    return chr(0x80 | len(octets)) + octets
+
+
+def tlv(tag, payload):
+    """ Returns one tag-length-value element. """
+
+    return chr(tag) + encode_length(len(payload)) + payload
+
+
+def integer(value, tag=INTEGER):
+    """ Returns a two's complement INTEGER (or ENUMERATED) element. """
+
+    octets = ''
+    while True:
+        octets = chr(value & 0xff) + octets
+        value >>= 8
+        if (value == 0 and not ord(octets[0]) & 0x80) or \
+                (value == -1 and ord(octets[0]) & 0x80):
+            break
+    return tlv(tag, octets)
+
+
+def octet_string(value, tag=OCTET_STRING):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return tlv(tag, value)
+
+
+def sequence(*elements, **kwargs):
+    return tlv(kwargs.get('tag', SEQUENCE), ''.join(elements))
+
+
+def message_length(data):
+    """ Returns the size of the first element of data, or None if data
+        doesn't hold all of it yet.
+    """
+
+    if len(data) < 2:
+        return None
+    first = ord(data[1])
+    if first < 0x80:
+        header, length = 2, first
+    else:
+        count = first & 0x7f
+        if not count or count > 4:
+            raise BERError('unsupported length encoding')
+        if len(data) < 2 + count:
+            return None
+        header, length = 2 + count, 0
+        for octet in data[2:2 + count]:
+            length = length << 8 | ord(octet)
+    if len(data) < header + length:
+        return None
+    return header + length
+
+
+def read_tlv(data, offset=0):
+    """ Reads the element starting at offset.
+
+        Returns:
+            (tag, value, end) - tag number, value octets and the offset
+            just past the element
+    """
+
+    length = message_length(data[offset:])
+    if length is None:
+        raise BERError('truncated element')
+    first = ord(data[offset + 1])
+    header = 2 if first < 0x80 else 2 + (first & 0x7f)
+    end = offset + length
+    return ord(data[offset]), data[offset + header:end], end
+
+
+def elements(value):
+    """ Returns the (tag, value) elements of a constructed value. """
+
+    items = []
+    offset = 0
+    while offset < len(value):
+        tag, item, offset = read_tlv(value, offset)
+        items.append((tag, item))
+    return items
+
+
+def decode_integer(value):
+    if not value:
+        raise BERError('empty integer')
+    number = 0
+    for octet in value:
+        number = number << 8 | ord(octet)
+    if ord(value[0]) & 0x80:
+        number -= 1 << (8 * len(value))
+    return number
+
+
+def message(message_id, operation):
+    """ Wraps a protocol operation in an LDAPMessage. """
+
+    return sequence(integer(message_id), operation)
+
+
+def bind_request(message_id, dn, password):
+    """ Returns a simple BindRequest (an anonymous bind if dn is empty). """
+
+    return message(message_id, sequence(integer(3), octet_string(dn or ''),
+                                        octet_string(password or '',
+                                                     SIMPLE_AUTH),
+                                        tag=BIND_REQUEST))
+
+
+def unbind_request(message_id):
+    return message(message_id, tlv(UNBIND_REQUEST, ''))
+
+
+def search_request(message_id, base, scope, filter_string,
+                   attributes=(), size_limit=0, time_limit=0):
+    """ Returns a SearchRequest (aliases are never dereferenced). """
+
+    return message(message_id, sequence(
+        octet_string(base), integer(scope, ENUMERATED),
+        integer(0, ENUMERATED), integer(size_limit), integer(time_limit),
+        tlv(BOOLEAN, '\x00'), search_filter(filter_string),
+        sequence(*[octet_string(name) for name in attributes]),
+        tag=SEARCH_REQUEST))
+
+
+def compare_request(message_id, dn, attribute, value):
+    return message(message_id, sequence(
+        octet_string(dn), sequence(octet_string(attribute),
+                                   octet_string(value)),
+        tag=COMPARE_REQUEST))
+
+
+def escape_filter_value(value):
+    """ Escapes the characters RFC 4515 reserves in assertion values. """
+
+    for char in ('\\', '*', '(', ')', '\x00'):
+        value = value.replace(char, '\\{:02x}'.format(ord(char)))
+    return value
+
+
+def _unescape(value):
+    """ Decodes the \\XX escapes of an RFC 4515 assertion value. """
+
+    parts = value.split('\\')
+    octets = [parts[0]]
+    for part in parts[1:]:
+        if len(part) < 2:
+            raise BERError('bad escape in filter value')
+        try:
+            octets.append(chr(int(part[:2], 16)) + part[2:])
+        except ValueError:
+            raise BERError('bad escape in filter value')
+    return ''.join(octets)
+
+
+def _filter_item(item):
+    for operator, tag in (('~=', FILTER_APPROX),
+                          ('>=', FILTER_GREATER_OR_EQUAL),
+                          ('<=', FILTER_LESS_OR_EQUAL),
+                          ('=', FILTER_EQUALITY)):
+        attribute, found, value = item.partition(operator)
+        if found:
+            break
+    if not found or not attribute:
+        raise BERError('bad filter item ({})'.format(item))
+    if tag != FILTER_EQUALITY:
+        return sequence(octet_string(attribute),
+                        octet_string(_unescape(value)), tag=tag)
+    if value == '*':
+        return octet_string(attribute, FILTER_PRESENT)
+    if '*' not in value:
+        return sequence(octet_string(attribute),
+                        octet_string(_unescape(value)), tag=tag)
+    pieces = value.split('*')
+    substrings = []
+    for index, piece in enumerate(pieces):
+        if not piece:
+            continue
+        if index == 0:
+            piece_tag = SUBSTRING_INITIAL
+        elif index == len(pieces) - 1:
+            piece_tag = SUBSTRING_FINAL
+        else:
+            piece_tag = SUBSTRING_ANY
+        substrings.append(octet_string(_unescape(piece), piece_tag))
+    return sequence(octet_string(attribute), sequence(*substrings),
+                    tag=FILTER_SUBSTRINGS)
+
+
+def _parse_filter(text, offset):
+    """ Parses the parenthesized filter at offset.
+
+        Returns:
+            (encoded filter, offset just past it)
+    """
+
+    if text[offset:offset + 1] != '(':
+        raise BERError('filter must start with "(" at {}'.format(offset))
+    offset += 1
+    kind = text[offset:offset + 1]
+    if kind in ('&', '|', '!'):
+        offset += 1
+        children = []
+        while text[offset:offset + 1] == '(':
+            child, offset = _parse_filter(text, offset)
+            children.append(child)
+        if kind == '!' and len(children) != 1:
+            raise BERError('"!" takes exactly one filter')
+        encoded = sequence(*children, tag={'&': FILTER_AND, '|': FILTER_OR,
+                                           '!': FILTER_NOT}[kind])
+    else:
+        end = text.find(')', offset)
+        if end < 0:
+            raise BERError('unbalanced filter')
+        encoded = _filter_item(text[offset:end])
+        offset = end
+    if text[offset:offset + 1] != ')':
+        raise BERError('unbalanced filter')
+    return encoded, offset + 1
+
+
+def search_filter(text):
+    """ Encodes an RFC 4515 filter string.  A filter without the outer
+        parentheses (cn=x) is accepted, as OEM accepts it.
+    """
+
+    text = text.strip()
+    if not text.startswith('('):
+        text = '({})'.format(text)
+    encoded, offset = _parse_filter(text, 0)
+    if offset != len(text):
+        raise BERError('trailing text after filter')
+    return encoded
+
+
+def parse_message(data):
+    """ Splits an LDAPMessage.
+
+        Returns:
+            (message_id, operation tag, operation value)
+    """
+
+    tag, value, _ = read_tlv(data)
+    if tag != SEQUENCE:
+        raise BERError('not an LDAP message')
+    items = elements(value)
+    if len(items) < 2 or items[0][0] != INTEGER:
+        raise BERError('not an LDAP message')
+    return decode_integer(items[0][1]), items[1][0], items[1][1]
+
+
+def parse_result(value):
+    """ Reads an LDAPResult (the body of most responses).
+
+        Returns:
+            (result code, diagnostic message)
+    """
+
+    items = elements(value)
+    if len(items) < 3 or items[0][0] != ENUMERATED:
+        raise BERError('not an LDAP result')
+    return decode_integer(items[0][1]), items[2][1]
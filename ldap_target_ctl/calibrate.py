@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+""" Threshold calibration from measured ldap_response latencies.  Samples,
+    from local synthetic checks or exported OEM metric data, are kept per
+    target, beacon and metric column in mergeable quantile sketches, so
+    calibration runs can accumulate samples without keeping them.  Each
+    target then gets warning and critical thresholds from a high quantile
+    of its latency, and beacons whose latency calls for different values
+    (a cross-region beacon, say) get their own.
+"""
+
+import csv
+import json
+import math
+import time
+
+from .metrics import write_atomic
+
+# Latency columns that are calibrated; status keeps its fixed thresholds
+COLUMNS = ('ConnectionTime', 'BaseSearch', 'AddressingSearch',
+           'MessagingSearch', 'CompareOp')
+
+DEFAULT_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+DEFAULT_QUANTILE = 0.99
+DEFAULT_WARNING_FACTOR = 1.5
+DEFAULT_CRITICAL_FACTOR = 3.0
+DEFAULT_MIN_SAMPLES = 20
+# Thresholds are rounded up to a multiple of STEP ms, and never below
+# FLOOR ms, so noise doesn't change them and a very fast host doesn't
+# alert on every hiccup
+DEFAULT_STEP = 100.0
+DEFAULT_FLOOR = 500.0
+
+# Sample key of samples not taken by an OEM beacon
+LOCAL = ''
+
+# Header names accepted for each field of an OEM metric export
+CSV_FIELDS = {'target': ('target_name', 'target'),
+              'column': ('metric_column', 'column_label', 'column'),
+              'value': ('value', 'value_average', 'average'),
+              'beacon': ('beacon_name', 'beacon', 'key_value'),
+              'metric': ('metric_name', 'metric')}
+
+
+class QuantileSketch(object):
+    """ Streaming quantile sketch with relative accuracy (DDSketch): values
+        are counted in logarithmic buckets, so any quantile is returned
+        within accuracy of its true value, in memory bounded by
+        max_buckets, and sketches of the same accuracy merge exactly.
+        Values of zero or less are counted apart.  Once max_buckets is
+        reached the lowest buckets are folded together, losing accuracy
+        only at the low end that thresholds don't use.
+    """
+
+    def __init__(self, accuracy=DEFAULT_ACCURACY,
+                 max_buckets=DEFAULT_MAX_BUCKETS):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+
+    def _index(self, value):
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _collapse(self):
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        folded = sum(self.buckets.pop(index) for index in indexes[:excess])
+        self.buckets[indexes[excess]] += folded
+
+    def add(self, value, count=1):
+        value = float(value)
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = self._index(value)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+            if len(self.buckets) > self.max_buckets:
+                self._collapse()
+        self.count += count
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """ Adds the counts of other, a sketch of the same accuracy. """
+
+        if other.gamma != self.gamma:
+            raise ValueError('cannot merge sketches of different accuracy')
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                if self.minimum is None or value < self.minimum:
+                    self.minimum = value
+                if self.maximum is None or value > self.maximum:
+                    self.maximum = value
+
+    def quantile(self, q):
+        """ Returns the q quantile (0 <= q <= 1), or None if empty. """
+
+        if not self.count:
+            return None
+        if q >= 1:
+            return self.maximum
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.minimum, 0.0)
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def to_dict(self):
+        return {'accuracy': self.accuracy, 'max_buckets': self.max_buckets,
+                'buckets': dict((str(index), count) for index, count
+                                in self.buckets.items()),
+                'zero_count': self.zero_count, 'count': self.count,
+                'min': self.minimum, 'max': self.maximum}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['accuracy'], data['max_buckets'])
+        sketch.buckets = dict((int(index), count) for index, count
+                              in data['buckets'].items())
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.minimum = data['min']
+        sketch.maximum = data['max']
+        return sketch
+
+
+class SketchStore(object):
+    """ Quantile sketches keyed by (target, beacon, column).  Samples taken
+        locally have LOCAL as their beacon.
+
+        Inputs:
+            path - String, JSON file the sketches are loaded from (if it
+                   exists) and saved to, or None to keep them in memory
+            accuracy - float, relative accuracy of new sketches
+    """
+
+    def __init__(self, path=None, accuracy=DEFAULT_ACCURACY):
+        self.path = path
+        self.accuracy = accuracy
+        # target -> {(beacon, column): QuantileSketch}
+        self._targets = {}
+        if path is not None:
+            try:
+                with open(path) as state:
+                    records = json.load(state)
+            except IOError:
+                records = []
+            for record in records:
+                self._targets.setdefault(record['target'], {})[
+                    (record['beacon'], record['column'])] = \
+                    QuantileSketch.from_dict(record['sketch'])
+
+    def add(self, target, column, value, beacon=LOCAL):
+        sketches = self._targets.setdefault(target, {})
+        sketch = sketches.get((beacon, column))
+        if sketch is None:
+            sketch = sketches[(beacon, column)] = QuantileSketch(
+                self.accuracy)
+        sketch.add(value)
+
+    def targets(self):
+        return sorted(self._targets)
+
+    def beacons(self, target):
+        return sorted(set(beacon for beacon, _
+                          in self._targets.get(target, {})
+                          if beacon != LOCAL))
+
+    def sketch(self, target, column, beacon=None):
+        """ Returns the sketch of one beacon's samples, or with beacon None
+            the merge of all of the target's samples of column.
+        """
+
+        sketches = self._targets.get(target, {})
+        if beacon is not None:
+            return sketches.get((beacon, column))
+        merged = QuantileSketch(self.accuracy)
+        for (_, sketch_column), sketch in sketches.items():
+            if sketch_column == column:
+                merged.merge(sketch)
+        return merged
+
+    def save(self):
+        if self.path is None:
+            return
+        write_atomic(self.path, json.dumps(
+            [{'target': target, 'beacon': beacon, 'column': column,
+              'sketch': sketch.to_dict()}
+             for target, sketches in sorted(self._targets.items())
+             for (beacon, column), sketch in sorted(sketches.items())]))
+
+
+def add_checks(store, tests):
+    """ Adds the metrics of finished synthetic.LDAPTest objects to store.
+        Tests that failed add nothing: their partial timings aren't
+        latency samples.
+
+        Returns:
+            int, the number of tests added
+    """
+
+    added = 0
+    for test in tests:
+        if test.metrics.get('status') != 1:
+            continue
+        for column in COLUMNS:
+            store.add('{}_ldap'.format(test.host), column,
+                      test.metrics[column])
+        added += 1
+    return added
+
+
+def read_metric_export(store, csv_file):
+    """ Adds the ldap_response samples of an OEM metric data export (CSV
+        with a header row naming at least the target, metric column and
+        value; see CSV_FIELDS) to store.  A beacon or key value column
+        keys the samples by beacon.
+
+        Returns:
+            (int, int) - samples added, rows skipped
+    """
+
+    added = skipped = 0
+    with open(csv_file, 'rb') as export:
+        reader = csv.DictReader(export)
+        headers = dict((name.strip().lower(), name)
+                       for name in reader.fieldnames or ())
+        fields = {}
+        for field, names in CSV_FIELDS.items():
+            for name in names:
+                if name in headers:
+                    fields[field] = headers[name]
+                    break
+        missing = [field for field in ('target', 'column', 'value')
+                   if field not in fields]
+        if missing:
+            raise ValueError('{} has no {} column'.format(
+                csv_file, ' or '.join(CSV_FIELDS[missing[0]])))
+        for row in reader:
+            metric = row.get(fields.get('metric'))
+            column = (row.get(fields['column']) or '').strip()
+            if metric and metric.strip() != 'ldap_response' or \
+                    column not in COLUMNS:
+                skipped += 1
+                continue
+            try:
+                value = float(row[fields['value']])
+            except (TypeError, ValueError):
+                skipped += 1
+                continue
+            beacon = (row.get(fields.get('beacon')) or LOCAL).strip()
+            store.add(row[fields['target']].strip(), column, value, beacon)
+            added += 1
+    return added, skipped
+
+
+def _round_up(value, step):
+    return math.ceil(value / step) * step
+
+
+def thresholds(sketch, quantile=DEFAULT_QUANTILE,
+               warning_factor=DEFAULT_WARNING_FACTOR,
+               critical_factor=DEFAULT_CRITICAL_FACTOR,
+               min_samples=DEFAULT_MIN_SAMPLES, step=DEFAULT_STEP,
+               floor=DEFAULT_FLOOR):
+    """ Returns the (warning, critical) ms thresholds for one sketch, or
+        None if it has fewer than min_samples samples.
+    """
+
+    if sketch is None or not sketch.count or sketch.count < min_samples:
+        return None
+    latency = sketch.quantile(quantile)
+    warning = max(floor, _round_up(latency * warning_factor, step))
+    critical = max(warning + step,
+                   _round_up(latency * critical_factor, step))
+    return warning, critical
+
+
+def calibrate(store, **options):
+    """ Computes thresholds for every target in store.
+
+        Inputs:
+            store - SketchStore
+            options - keyword arguments of thresholds()
+
+        Returns:
+            dict, target name -> {'thresholds': {column: (warning,
+            critical)}, 'beacon_thresholds': {beacon: {column: (warning,
+            critical)}}}.  Beacons only get the columns whose thresholds
+            differ from the target's.
+    """
+
+    calibrated = {}
+    for target in store.targets():
+        target_thresholds = {}
+        beacon_thresholds = {}
+        for column in COLUMNS:
+            values = thresholds(store.sketch(target, column), **options)
+            if values is None:
+                continue
+            target_thresholds[column] = values
+            for beacon in store.beacons(target):
+                beacon_values = thresholds(
+                    store.sketch(target, column, beacon), **options)
+                if beacon_values is not None and beacon_values != values:
+                    beacon_thresholds.setdefault(beacon, {})[column] = \
+                        beacon_values
+        if target_thresholds:
+            calibrated[target] = {'thresholds': target_thresholds,
+                                  'beacon_thresholds': beacon_thresholds}
+    return calibrated
+
+
+def save_thresholds(path, calibrated, **details):
+    """ Writes calibrate()'s result, with details of how it was computed,
+        to a JSON thresholds file.
+    """
+
+    write_atomic(path, json.dumps(
+        dict(details, generated_at=time.time(), targets=calibrated),
+        indent=2, sort_keys=True))
+
+
+def load_thresholds(path):
+    """ Reads a thresholds file written by save_thresholds().
+
+        Returns:
+            dict, target name -> keyword arguments for make_xml_template
+            (thresholds and beacon_thresholds), values as tuples
+    """
+
+    with open(path) as thresholds_file:
+        targets = json.load(thresholds_file)['targets']
+    loaded = {}
+    for name, calibrated in targets.items():
+        loaded[name] = {
+            'thresholds': dict(
+                (column, tuple(values)) for column, values
+                in calibrated['thresholds'].items()),
+            'beacon_thresholds': dict(
+                (beacon, dict((column, tuple(values)) for column, values
+                              in columns.items()))
+                for beacon, columns
+                in calibrated.get('beacon_thresholds', {}).items())}
+    return loaded
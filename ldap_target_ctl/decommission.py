@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+""" Picks the targets a delete run removes, from a batch file's hosts or a
+    name pattern, out of one reconcile.Snapshot.
+"""
+
+import fnmatch
+
+# Steps of deleting a target, in order
+STEPS = ('ungrouped', 'deleted')
+
+
+class DeleteTarget(object):
+    """ One existing target to delete.
+
+        Attributes:
+            name - String, OEM target name
+            pod - String, the target's Pod property, or None
+            groups - tuple, the snapshotted groups it is a member of
+    """
+
+    __slots__ = ('name', 'pod', 'groups')
+
+    def __init__(self, name, pod=None, groups=()):
+        self.name = name
+        self.pod = pod
+        self.groups = groups
+
+
+def resolve_targets(snapshot, names=None, pattern=None, pod=None):
+    """ Matches the wanted targets against what exists.
+
+        Inputs:
+            snapshot - reconcile.Snapshot of the target type
+            names - iterable of target names (from a batch file), or None
+            pattern - String, shell style target name pattern, or None
+            pod - String, only targets whose Pod property is pod
+
+        Returns:
+            (targets, missing) - list of DeleteTarget objects, in batch
+            order (or sorted by name for a pattern), and the list of
+            wanted names that don't exist.
+    """
+
+    if names is not None:
+        wanted = []
+        seen = set()
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                wanted.append(name)
+    else:
+        wanted = sorted(snapshot.targets)
+
+    targets = []
+    missing = []
+    for name in wanted:
+        properties = snapshot.targets.get(name)
+        if properties is None:
+            missing.append(name)
+            continue
+        if pattern is not None and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        if pod is not None and properties.get('Pod') != pod:
+            continue
+        member_of = tuple(sorted(group for group, members in
+                                 snapshot.members.items()
+                                 if name in members))
+        targets.append(DeleteTarget(name, properties.get('Pod'),
+                                    member_of))
+    return targets, missing
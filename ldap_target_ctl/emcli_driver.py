@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+""" Request loop run inside a long-lived ``emcli @emcli_driver.py`` script
+    session (Jython).  Reads one request per line from stdin, calls the
+    matching verb function and writes a framed response to stdout:
+
+        request:   repr((verb, args, options))
+        response:  @@LTC <code> <len(out)> <len(err)>\\n<out><err>
+
+    Lengths are in bytes of the UTF-8 encoded text.  A request for the verb
+    'quit' ends the loop.  Kept compatible with Jython 2.5 (no json, no
+    ast.literal_eval, no str.format); requests only come from the parent
+    process.
+"""
+
+import sys
+
+FRAME = '@@LTC'
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if not isinstance(value, basestring):
+        value = str(value)
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return value
+
+
+def call_verb(namespace, verb, args, options):
+    """ Calls verb and returns (code, out, err). """
+
+    try:
+        response = namespace[verb](*args, **options)
+    except Exception, error:
+        code = getattr(error, 'exit_code', None)
+        message = getattr(error, 'error', None)
+        return (code and code() or 1, '',
+                _text(message and message() or error))
+    if response is None:
+        return 0, '', ''
+    return (response.exit_code(), _text(response.out()),
+            _text(response.error()))
+
+
+def serve(namespace, stdin, stdout):
+    """ Serves requests until 'quit' or end of input. """
+
+    while True:
+        line = stdin.readline()
+        if not line:
+            return
+        verb, args, options = eval(line)
+        if verb == 'quit':
+            return
+        code, out, err = call_verb(namespace, verb, args, options)
+        stdout.write('%s %d %d %d\n' % (FRAME, code, len(out), len(err)))
+        stdout.write(out)
+        stdout.write(err)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    serve(globals(), sys.stdin, sys.stdout)
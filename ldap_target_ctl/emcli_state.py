@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+""" emcli login and sync state kept between runs.  emcli keeps its login
+    session on disk, so a run started shortly after another one can skip
+    login and the (slow) sync of verb definitions.  Freshness is checked
+    with emcli status, which doesn't need the OMS: the session must belong
+    to the same user, and the OMS url and emcli version, which change when
+    the OMS is upgraded and emcli must sync again, must be the ones the
+    last sync saw.
+
+    A session that expires while it is in use is logged back in by
+    retry.RetryingEmcli.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import contextlib
+
+from .metrics import write_atomic
+
+# Backends whose login outlives the process; the session backend's script
+# mode processes log in every time
+REUSABLE_BACKENDS = ('spawn', 'fake')
+# emcli status fields that identify the OMS and its verb definitions
+FINGERPRINT_FIELDS = ('EM URL', 'EM CLI Version', 'EM CLI Home')
+# A session idle for longer is assumed to have expired on the OMS
+SESSION_MAX_AGE = 30 * 60
+# Sync at least this often even if nothing seems to have changed
+SYNC_MAX_AGE = 24 * 60 * 60
+
+# Runs against several OMSes in one process share the state file
+_save_lock = threading.Lock()
+
+
+def parse_status(out):
+    """ Returns the 'Name : value' lines of emcli status output as a dict.
+    """
+
+    status = {}
+    for line in out.splitlines():
+        name, separator, value = line.partition(':')
+        if separator and name.strip():
+            status[name.strip()] = value.strip()
+    return status
+
+
+def fingerprint(status):
+    """ Returns a hash of the FINGERPRINT_FIELDS of a parse_status() dict.
+    """
+
+    return hashlib.sha256('\n'.join(
+        '{}={}'.format(field, status.get(field, ''))
+        for field in FINGERPRINT_FIELDS)).hexdigest()
+
+
+@contextlib.contextmanager
+def _untimed(step):
+    yield
+
+
+class LoginState(object):
+    """ Decides whether a run has to log in and sync, and remembers when it
+        did for the next run.
+
+        Inputs:
+            path - String, state file (None turns reuse off)
+            url - String, OEM url
+            em_user - String, OEM user
+            backend - String, emcli backend name
+            clock - callable returning the time in seconds
+
+        Attributes:
+            logged_in - bool, start() logged in
+            synced - bool, start() ran sync
+    """
+
+    def __init__(self, path, url, em_user, backend, clock=time.time):
+        self.path = path
+        self.key = '{}@{}'.format(em_user, url)
+        self.em_user = em_user
+        self.reuse = bool(path) and backend in REUSABLE_BACKENDS
+        self.logged_in = False
+        self.synced = False
+        self._clock = clock
+
+    def _load(self):
+        try:
+            with open(self.path) as state_file:
+                state = json.load(state_file)
+        except (IOError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _save(self, **fields):
+        with _save_lock:
+            state = self._load()
+            state.setdefault(self.key, {}).update(fields)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0700)
+            write_atomic(self.path, json.dumps(state, indent=1,
+                                               sort_keys=True))
+
+    def _status(self, emcli):
+        code, out, err = emcli.run('status')
+        return parse_status(out) if code == 0 else {}
+
+    def start(self, emcli, force_sync=False, timer=_untimed):
+        """ Logs in and syncs, skipping whichever the saved state shows is
+            still current.
+
+            Inputs:
+                emcli - backend client
+                force_sync - bool, log in and sync regardless
+                timer - callable, timer(step) context manager timing the
+                        login and sync steps
+
+            Returns:
+                (code, out, err) of the login, or of a skipped login
+        """
+
+        response = 0, 'Reusing the emcli session of {}\n'.format(
+            self.em_user), ''
+        now = self._clock()
+        entry = self._load().get(self.key) if self.reuse else None
+        status = {}
+        if entry and not force_sync:
+            status = self._status(emcli)
+        session_ok = sync_ok = False
+        if entry is not None and status:
+            session_ok = (status.get('EM user') == self.em_user and
+                          now - entry.get('used_at', 0) < SESSION_MAX_AGE)
+            sync_ok = (entry.get('fingerprint') == fingerprint(status) and
+                       now - entry.get('synced_at', 0) < SYNC_MAX_AGE)
+
+        if not session_ok:
+            with timer('login'):
+                response = emcli.login()
+            if response[0] > 0:
+                return response
+            self.logged_in = True
+        if not sync_ok:
+            with timer('sync'):
+                emcli.sync()
+            self.synced = True
+
+        if self.reuse:
+            fields = {'used_at': now}
+            if self.synced:
+                fields['synced_at'] = now
+                fields['fingerprint'] = fingerprint(self._status(emcli))
+            self._save(**fields)
+        return response
+
+    def end(self, emcli):
+        """ Ends the run: a reusable session is left logged in for the next
+            run, any other is logged out.
+
+            Returns:
+                (code, out, err)
+        """
+
+        if not self.reuse:
+            return emcli.logout()
+        self._save(used_at=self._clock())
+        return 0, '', ''
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+""" Bounded worker pool used to provision batch targets concurrently.
+"""
+
+import sys
+import threading
+import traceback
+import Queue
+
+
+class BatchTarget(object):
+    """ One line of a batch file, resolved against the config.
+
+        Attributes:
+            name - String, OEM target name (<ldap_host>_ldap)
+            ldap_host - String, hostname of ldap host or vip
+            ldap_port - String, port ldap is listening on
+            pod - String, POD the target belongs to
+            beacons - tuple, beacon names the test should run from
+            properties - dict, target property records
+            group - String, OEM group to add the target to, or None
+            ldap_base - String, direcotry structure where search resides
+            ldap_filter - String, a filter to limit results
+    """
+
+    __slots__ = ('name', 'ldap_host', 'ldap_port', 'pod', 'beacons',
+                 'properties', 'group', 'ldap_base', 'ldap_filter')
+
+    def __init__(self, ldap_host, ldap_port, pod, beacons, properties,
+                 group=None, ldap_base=None, ldap_filter=None):
+        self.name = '{}_ldap'.format(ldap_host)
+        self.ldap_host = ldap_host
+        self.ldap_port = ldap_port
+        self.pod = pod
+        self.beacons = beacons
+        self.properties = properties
+        self.group = group
+        self.ldap_base = ldap_base
+        self.ldap_filter = ldap_filter
+
+
+class TargetResult(object):
+    """ Output and error code collected while provisioning one target.
+
+        Attributes:
+            target - BatchTarget the result belongs to
+            code - int, running total of emcli error codes for this target
+            output - list, lines to print for this target, in step order
+            completed - list, names of the steps that succeeded
+            pending - list, names of the steps left for the bulk phases
+                      that run after every worker has finished
+    """
+
+    __slots__ = ('target', 'code', 'output', 'completed', 'pending')
+
+    def __init__(self, target):
+        self.target = target
+        self.code = 0
+        self.output = []
+        self.completed = []
+        self.pending = []
+
+    def record(self, code, out, err, step=None):
+        """ Records one emcli (code, out, err) response the same way the
+            sequential batch loop printed it.
+
+            Inputs:
+                code, out, err - emcli response
+                step - String, step name added to completed on success
+
+            Returns:
+                code - int, the emcli error code passed in
+        """
+
+        if code > 0:
+            self.output.append(err.strip())
+            self.code += code
+        else:
+            self.output.append(out.strip())
+            if step:
+                self.completed.append(step)
+        return code
+
+
+def _run_worker(worker, target):
+    """ Calls worker(target), turning an unexpected exception into a failed
+        result so one bad target cannot take down the pool.
+    """
+
+    try:
+        return worker(target)
+    except Exception:
+        result = TargetResult(target)
+        result.record(1, '', 'ERROR: {}: {}'.format(
+            getattr(target, 'name', target),
+            traceback.format_exc().strip()))
+        return result
+
+
+def run_batch(targets, worker, jobs=1, emit=None):
+    """ Runs worker over targets with at most jobs targets in flight.  Each
+        worker call handles one target's steps in order; results are handed
+        to emit in the same order as targets, regardless of which worker
+        finished first.
+
+        Inputs:
+            targets - iterable of BatchTarget objects, consumed lazily
+            worker - callable, worker(target) -> TargetResult
+            jobs - int, number of concurrent workers
+            emit - callable, emit(result) called in batch order.  Defaults
+                   to printing the result's output lines.
+
+        Returns:
+            code_total - int, sum of every target's error code
+    """
+
+    if emit is None:
+        emit = print_result
+
+    code_total = 0
+
+    if jobs <= 1:
+        for target in targets:
+            result = _run_worker(worker, target)
+            code_total += result.code
+            emit(result)
+        return code_total
+
+    work = Queue.Queue(maxsize=jobs * 2)
+    # Limits how far workers may run ahead of the slowest unreported target
+    # so out-of-order results cannot pile up in memory.
+    window = threading.BoundedSemaphore(jobs * 4)
+    done = threading.Condition()
+    results = {}
+    state = {'count': None, 'error': None}
+
+    def feed():
+        count = 0
+        try:
+            for target in targets:
+                window.acquire()
+                work.put((count, target))
+                count += 1
+        except Exception:
+            state['error'] = sys.exc_info()
+        finally:
+            for _ in range(jobs):
+                work.put(None)
+            with done:
+                state['count'] = count
+                done.notify_all()
+
+    def consume():
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            index, target = item
+            result = _run_worker(worker, target)
+            with done:
+                results[index] = result
+                done.notify_all()
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend(threading.Thread(target=consume) for _ in range(jobs))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    index = 0
+    while True:
+        with done:
+            while index not in results and (state['count'] is None or
+                                            index < state['count']):
+                done.wait(1)
+            if index not in results:
+                break
+            result = results.pop(index)
+        window.release()
+        code_total += result.code
+        emit(result)
+        index += 1
+
+    for thread in threads:
+        thread.join()
+
+    if state['error'] is not None:
+        raise state['error'][0], state['error'][1], state['error'][2]
+    return code_total
+
+
+def print_lines(lines):
+    """ Prints lines in one write, so lines printed from several threads
+        don't interleave.
+    """
+
+    if lines:
+        sys.stdout.write(''.join(line + '\n' for line in lines))
+        sys.stdout.flush()
+
+
+def print_result(result):
+    """ Prints a TargetResult's output lines in one write. """
+
+    print_lines(result.output)
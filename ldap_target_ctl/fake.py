@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+""" In-process stand-in for an OMS and the emcli client, for load tests and
+    offline runs (--backend fake).  FakeOMS keeps target, property and group
+    state, sleeps a per-verb lognormal latency, injects transient errors and
+    turns calls away as busy above a concurrency limit.
+
+    Configured from an optional [fake] section of the config file:
+
+        [fake]
+        # multiplies every latency; 0 disables sleeping
+        latency_scale = 1.0
+        # verb -> (median seconds, sigma[, seconds per record/member])
+        latency = {'create_service': (0.8, 0.5)}
+        # fraction of calls of any verb failing with a transient error,
+        # and per-verb overrides
+        error_rate = 0.0
+        errors = {'create_service': 0.05}
+        # calls in flight before the OMS answers busy; 0 for no limit
+        concurrency = 0
+        seed = 1
+"""
+
+import ast
+import csv
+import math
+import time
+import random
+import re
+import threading
+import StringIO
+
+from .backends import VerbMethods
+from .settings import get_settings
+
+# verb -> (median seconds, sigma, seconds per record / group member)
+LATENCY = {'login': (1.5, 0.3, 0), 'logout': (0.3, 0.3, 0),
+           'sync': (2.0, 0.3, 0), 'create_service': (0.8, 0.5, 0),
+           'set_target_property_value': (0.3, 0.4, 0.002),
+           'get_groups': (0.4, 0.3, 0), 'create_group': (0.5, 0.3, 0),
+           'modify_group': (0.4, 0.3, 0.003),
+           'get_group_members': (0.4, 0.3, 0), 'list': (1.0, 0.4, 0),
+           'delete_target': (0.6, 0.4, 0),
+           'apply_template_tests': (0.8, 0.5, 0)}
+DEFAULT_LATENCY = (0.3, 0.3, 0)
+
+TRANSIENT_ERRORS = ('Error: Connection to the OMS timed out',
+                    'Error: The OMS is busy, try again later',
+                    'Error: Service temporarily unavailable')
+BUSY = 'Error: The OMS is busy, try again later'
+
+# A -search criterion of the list verb, COLUMN='value'
+SEARCH = re.compile(r"\s*(\w+)\s*=\s*'([^']*)'\s*$")
+
+# The default OMS, and the OMSes of other urls (see settings.OMS)
+_shared = {'oms': None, 'urls': {}}
+_shared_lock = threading.Lock()
+
+
+def _csv(rows):
+    out = StringIO.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for row in rows:
+        writer.writerow(row)
+    return out.getvalue()
+
+
+def _pairs(value, separator=';', subseparator=':'):
+    """ Splits name:type;name:type member lists. """
+
+    return [tuple(item.split(subseparator, 1)) for item in
+            value.split(separator) if item]
+
+
+def _separator(options, name, default):
+    value = options.get(name)
+    if value and value.startswith('property_records='):
+        return value.split('=', 1)[1]
+    return default
+
+
+class FakeOMS(object):
+    """ Target, property and group state shared by every FakeEmcli client.
+
+        Inputs:
+            latency - dict, verb -> (median, sigma[, per item]) overrides
+            latency_scale - float, multiplies every latency
+            error_rate - float, transient error fraction for every verb
+            errors - dict, verb -> transient error fraction
+            concurrency - int, calls in flight before answering busy
+            seed - random seed, for repeatable runs
+
+        Attributes:
+            session - String, the user emcli is logged in as, or None
+            version - String, the emcli version emcli status reports
+            calls - dict, verb -> number of calls
+            history - list the (verb, options) of every call is appended
+                      to, or None (the default) to keep none
+    """
+
+    def __init__(self, latency=None, latency_scale=1.0, error_rate=0.0,
+                 errors=None, concurrency=0, seed=None, sleep=time.sleep):
+        self.latency = dict(LATENCY)
+        self.latency.update(latency or {})
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self.errors = errors or {}
+        self.concurrency = concurrency
+        self.targets = {}
+        self.groups = {}
+        # target type -> user-defined property names
+        self.properties = {}
+        self.calls = {}
+        self.history = None
+        self.scripted = {}
+        self.in_flight = 0
+        self.peak = 0
+        self.session = None
+        self.version = '13.5.0.0.0'
+        self._random = random.Random(seed)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """ Forgets every target, group and property definition. """
+
+        with self._lock:
+            self.targets.clear()
+            self.groups.clear()
+            self.properties.clear()
+            self.calls.clear()
+            self.scripted.clear()
+            if self.history is not None:
+                del self.history[:]
+            self.peak = 0
+
+    def script(self, verb, *responses):
+        """ Makes the next calls of verb answer responses, one (code, out,
+            err) per call in order, instead of running it.  Scripted
+            answers skip the latency, busy and error simulation.
+        """
+
+        with self._lock:
+            self.scripted.setdefault(verb, []).extend(responses)
+
+    def delay(self, verb, items=0):
+        """ Seconds a call of verb touching items records should take. """
+
+        median, sigma = self.latency.get(verb, DEFAULT_LATENCY)[:2]
+        per_item = (self.latency.get(verb, DEFAULT_LATENCY) + (0,))[2]
+        with self._lock:
+            seconds = self._random.lognormvariate(math.log(median), sigma)
+            load = (float(self.in_flight) / self.concurrency
+                    if self.concurrency else 0)
+        # The OMS slows down as it fills up
+        return (seconds + per_item * items) * (1 + load) * \
+            self.latency_scale
+
+    def call(self, verb, args, options):
+        """ Runs one verb.
+
+            Returns:
+                (code, out, err)
+        """
+
+        with self._lock:
+            self.calls[verb] = self.calls.get(verb, 0) + 1
+            if self.history is not None:
+                self.history.append((verb, dict(options)))
+            if self.scripted.get(verb):
+                return self.scripted[verb].pop(0)
+            if self.concurrency and self.in_flight >= self.concurrency:
+                return 1, '', '{}\n'.format(BUSY)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            failing = self._random.random() < self.errors.get(
+                verb, self.error_rate)
+            error = self._random.choice(TRANSIENT_ERRORS)
+        try:
+            handler = getattr(self, 'verb_{}'.format(verb), None)
+            records = (options.get('property_records') or
+                       options.get('add_targets') or '')
+            items = len(records.split(_separator(options, 'separator',
+                                                 ';'))) if records else 0
+            seconds = self.delay(verb, items)
+            if seconds > 0:
+                self._sleep(seconds)
+            if failing:
+                return 1, '', '{}\n'.format(error)
+            if handler is None:
+                return 1, '', 'Error: "{}" is not a valid verb.\n'.format(
+                    verb)
+            with self._lock:
+                return handler(*args, **options)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    # Verbs, called with the state lock held
+
+    def verb_login(self, username=None, password=None, **options):
+        self.session = username
+        return 0, 'Login successful\n', ''
+
+    def verb_logout(self, **options):
+        self.session = None
+        return 0, 'Logout successful\n', ''
+
+    def verb_status(self, **options):
+        lines = ['EM CLI Version : {}'.format(self.version),
+                 'EM URL : fake']
+        if self.session is not None:
+            lines.append('EM user : {}'.format(self.session))
+        return 0, '\n'.join(lines) + '\n', ''
+
+    def verb_sync(self, **options):
+        return 0, 'Synchronized successfully\n', ''
+
+    def verb_set_client_property(self, *args, **options):
+        return 0, '', ''
+
+    def verb_create_service(self, name, type, input_file=None,
+                            beacons='', **options):
+        if name in self.targets:
+            return 1, '', 'Target "{}:{}" already exists\n'.format(
+                name, type)
+        self.targets[name] = {'type': type, 'properties': {},
+                              'beacons': [beacon.split(':')[0] for beacon in
+                                          beacons.split(';') if beacon],
+                              'template': input_file}
+        return 0, 'Create service "{}" succeeded\n'.format(name), ''
+
+    def verb_apply_template_tests(self, targetName, targetType,
+                                  input_file=None, **options):
+        if targetName not in self.targets:
+            return 1, '', 'Target "{}:{}" does not exist\n'.format(
+                targetName, targetType)
+        self.targets[targetName]['template'] = input_file
+        return 0, 'Template applied to "{}" successfully\n'.format(
+            targetName), ''
+
+    def verb_set_target_property_value(self, property_records, **options):
+        separator = _separator(options, 'separator', ';')
+        subseparator = _separator(options, 'subseparator', ':')
+        records = [record.split(subseparator, 3) for record in
+                   property_records.split(separator) if record]
+        missing = sorted(set(record[0] for record in records
+                             if record[0] not in self.targets))
+        if missing:
+            return 1, '', ''.join('Target "{}:generic_service" does not '
+                                  'exist\n'.format(name)
+                                  for name in missing)
+        for name, target_type, prop, value in records:
+            self.targets[name]['properties'][prop] = value
+        return 0, 'Properties updated successfully\n', ''
+
+    def verb_add_target_property(self, target_type, property, **options):
+        defined = self.properties.setdefault(target_type, set())
+        if property in defined:
+            return 1, '', 'Property "{}" already exists for {}\n'.format(
+                property, target_type)
+        defined.add(property)
+        return 0, 'Property "{}" added to {}\n'.format(property,
+                                                       target_type), ''
+
+    def verb_get_groups(self, **options):
+        return 0, ''.join('{}\tcomposite\n'.format(group)
+                          for group in sorted(self.groups)), ''
+
+    def verb_create_group(self, name, **options):
+        if name in self.groups:
+            return 1, '', 'Group "{}" already exists\n'.format(name)
+        self.groups[name] = set()
+        return 0, 'Group "{}" created successfully\n'.format(name), ''
+
+    def verb_modify_group(self, name, add_targets=None, delete_targets=None,
+                          **options):
+        if name not in self.groups:
+            return 1, '', 'Group "{}" does not exist\n'.format(name)
+        added = _pairs(add_targets or '')
+        missing = sorted(target for target, _ in added
+                         if target not in self.targets)
+        if missing:
+            return 1, '', ''.join('Target "{}:generic_service" does not '
+                                  'exist\n'.format(target)
+                                  for target in missing)
+        self.groups[name].update(target for target, _ in added)
+        self.groups[name].difference_update(
+            target for target, _ in _pairs(delete_targets or ''))
+        return 0, 'Group "{}" modified successfully\n'.format(name), ''
+
+    def verb_get_group_members(self, name, **options):
+        if name not in self.groups:
+            return 1, '', 'Group "{}" does not exist\n'.format(name)
+        types = dict((target, self.targets.get(target, {}).get(
+            'type', 'generic_service')) for target in self.groups[name])
+        return 0, ''.join('{}\t{}\n'.format(target, types[target])
+                          for target in sorted(types)), ''
+
+    def verb_delete_target(self, name, type, **options):
+        if name not in self.targets:
+            return 1, '', 'Target "{}:{}" does not exist\n'.format(
+                name, type)
+        del self.targets[name]
+        for members in self.groups.values():
+            members.discard(name)
+        return 0, 'Target "{}:{}" deleted successfully\n'.format(name,
+                                                                 type), ''
+
+    def verb_list(self, resource, search='', columns='', **options):
+        if not isinstance(search, (list, tuple)):
+            search = [search] if search else []
+        criteria = dict(match.groups() for match in
+                        (SEARCH.match(criterion) for criterion in search)
+                        if match)
+        wanted = criteria.get('TARGET_TYPE')
+        targets = sorted((name, target) for name, target in
+                         self.targets.items()
+                         if wanted is None or target['type'] == wanted)
+        if resource == 'Targets':
+            return 0, _csv([name] for name, _ in targets), ''
+        if resource == 'TargetProperties':
+            prop_name = criteria.get('PROPERTY_NAME')
+            rows = ((name, prop, value) for name, target in targets
+                    for prop, value in sorted(target['properties'].items())
+                    if prop_name is None or prop == prop_name)
+            if 'PROPERTY_NAME' not in columns.split(','):
+                rows = ((name, value) for name, _, value in rows)
+            return 0, _csv(rows), ''
+        return 1, '', 'Error: unknown resource {}\n'.format(resource)
+
+
+class FakeEmcli(VerbMethods):
+    """ emclpy.Emclpy compatible client of a FakeOMS.  Templates are passed
+        inline, so nothing is spooled to disk.
+    """
+
+    inline_templates = True
+
+    def __init__(self, oms, em_user=None, em_pass=None):
+        self.oms = oms
+        self.em_user = em_user
+        self.em_pass = em_pass
+
+    def run(self, verb, *args, **options):
+        return self.oms.call(verb, args, options)
+
+    def login(self):
+        return self.run('login', username=self.em_user,
+                        password=self.em_pass)
+
+    def logout(self):
+        return self.run('logout')
+
+
+def oms_from_config(parser):
+    """ Builds a FakeOMS from the [fake] section of a ConfigParser. """
+
+    options = {}
+    if parser is not None and parser.has_section('fake'):
+        for name, convert in (('latency', ast.literal_eval),
+                              ('errors', ast.literal_eval),
+                              ('latency_scale', float),
+                              ('error_rate', float),
+                              ('concurrency', int), ('seed', int)):
+            if parser.has_option('fake', name):
+                options[name] = convert(parser.get('fake', name))
+    return FakeOMS(**options)
+
+
+def shared_oms(url=None):
+    """ Returns the process-wide FakeOMS, built from the config file on
+        first use, so every run in a process sees the same state.  An url
+        other than the [oem] one gets an OMS of its own.
+    """
+
+    with _shared_lock:
+        settings = get_settings()
+        if url is not None and (settings is None or url != settings.url):
+            if url not in _shared['urls']:
+                _shared['urls'][url] = oms_from_config(settings and
+                                                       settings.parser)
+            return _shared['urls'][url]
+        if _shared['oms'] is None:
+            _shared['oms'] = oms_from_config(settings and settings.parser)
+        return _shared['oms']
+
+
+def set_shared_oms(oms):
+    """ Replaces the process-wide FakeOMS (None rebuilds it on next use)
+        and drops the OMSes of other urls.
+    """
+
+    with _shared_lock:
+        _shared['oms'] = oms
+        _shared['urls'] = {}
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+""" Run-scoped OEM group cache and bulk group membership helpers.
+"""
+
+import threading
+from timeit import default_timer
+
+# Longest -add_targets value handed to a single emcli call.  Linux caps a
+# single argument at 128KB; stay well below that so quoting and the rest of
+# the command line never push a chunk over.
+EMCLI_ARG_LIMIT = 30000
+
+
+class GroupCache(object):
+    """ Fetches the OEM group list once per run and remembers groups created
+        during the run, so every target doesn't cost a get_groups() round
+        trip and a missing group is created exactly once.
+    """
+
+    def __init__(self, emcli):
+        self.emcli = emcli
+        self._groups = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, group):
+        with self._lock:
+            return group in self._load()
+
+    def _load(self):
+        if self._groups is None:
+            self._groups = set(self.emcli.get_groups())
+        return self._groups
+
+    def ensure(self, group):
+        """ Creates group unless it already exists.
+
+            Inputs:
+                group - String, OEM group name
+
+            Returns:
+                (code, out, err) from create_group, or None if the group
+                already existed.
+        """
+
+        with self._lock:
+            if group in self._load():
+                return None
+            code, out, err = self.emcli.create_group(group)
+            if code == 0:
+                self._groups.add(group)
+            return code, out, err
+
+
+def chunk_targets(target_names, target_type, limit=EMCLI_ARG_LIMIT):
+    """ Splits target names into chunks whose emcli member list
+        (name:type;name:type...) stays under limit characters.
+
+        Inputs:
+            target_names - iterable of target names
+            target_type - String, OEM target type
+            limit - int, maximum member list length per chunk
+
+        Returns:
+            Generator of lists of target names
+    """
+
+    chunk = []
+    size = 0
+    for name in target_names:
+        length = len(name) + len(target_type) + 2
+        if chunk and size + length > limit:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(name)
+        size += length
+    if chunk:
+        yield chunk
+
+
+def add_targets_to_group(emcli, group, target_names,
+                         target_type='generic_service',
+                         limit=EMCLI_ARG_LIMIT, observe=None):
+    """ Adds many targets to group with one modify_group -add_targets
+        call per chunk.
+
+        Inputs:
+            emcli - logged in backend client with run()
+            group - String, OEM group name
+            target_names - iterable of target names
+            target_type - String, OEM target type
+            limit - int, maximum member list length per call
+            observe - callable, observe(chunk, seconds) after each call
+
+        Returns:
+            List of (chunk, code, out, err) tuples, one per emcli call.
+    """
+
+    responses = []
+    for chunk in chunk_targets(target_names, target_type, limit):
+        members = ';'.join('{}:{}'.format(name, target_type)
+                           for name in chunk)
+        start = default_timer()
+        code, out, err = emcli.run('modify_group', name=group,
+                                   add_targets=members)
+        if observe is not None:
+            observe(chunk, default_timer() - start)
+        responses.append((chunk, code, out, err))
+    return responses
+
+
+def remove_targets_from_group(emcli, group, target_names,
+                              target_type='generic_service',
+                              limit=EMCLI_ARG_LIMIT, observe=None):
+    """ Removes many targets from group with one modify_group
+        -delete_targets call per chunk.
+
+        Inputs:
+            emcli - logged in backend client with run()
+            group - String, OEM group name
+            target_names - iterable of target names
+            target_type - String, OEM target type
+            limit - int, maximum member list length per call
+            observe - callable, observe(chunk, seconds) after each call
+
+        Returns:
+            List of (chunk, code, out, err) tuples, one per emcli call.
+    """
+
+    responses = []
+    for chunk in chunk_targets(target_names, target_type, limit):
+        members = ';'.join('{}:{}'.format(name, target_type)
+                           for name in chunk)
+        start = default_timer()
+        code, out, err = emcli.run('modify_group', name=group,
+                                   delete_targets=members)
+        if observe is not None:
+            observe(chunk, default_timer() - start)
+        responses.append((chunk, code, out, err))
+    return responses
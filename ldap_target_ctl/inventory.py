@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+""" Local SQLite inventory of provisioned targets, so questions about what
+    has been provisioned are answered with an indexed lookup instead of
+    emcli queries.  Runs record what they change as they go; sync-inventory
+    refreshes the whole table from the OMS.
+"""
+
+import os
+import csv
+import time
+import sqlite3
+import threading
+import contextlib
+
+COLUMNS = ('name', 'host', 'port', 'pod', 'beacons', 'entity', 'lifecycle',
+           'target_group', 'template_hash', 'provisioned_at', 'synced_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    name TEXT PRIMARY KEY,
+    host TEXT,
+    port INTEGER,
+    pod TEXT,
+    beacons TEXT,
+    entity TEXT,
+    lifecycle TEXT,
+    target_group TEXT,
+    template_hash TEXT,
+    provisioned_at REAL,
+    synced_at REAL
+);
+CREATE INDEX IF NOT EXISTS targets_pod ON targets (pod);
+CREATE INDEX IF NOT EXISTS targets_group ON targets (target_group);
+"""
+
+# Beacon names are stored ';' separated
+BEACON_SEPARATOR = ';'
+
+# Target properties refreshed by sync-inventory, and their columns
+PROPERTY_COLUMNS = (('Pod', 'pod'),
+                    ('Department', 'entity'),
+                    ('Lifecycle Status', 'lifecycle'))
+
+
+def _row(values):
+    record = dict(zip(COLUMNS, values))
+    record['beacons'] = tuple(record['beacons'].split(BEACON_SEPARATOR)) \
+        if record['beacons'] else ()
+    return record
+
+
+class Inventory(object):
+    """ The targets table of one SQLite file.  Safe to share between
+        threads; each record() and remove() is committed as soon as it is
+        made, so a run that dies keeps what it recorded, unless it is made
+        in a transaction(), which is committed whole or not at all.
+
+        Inputs:
+            path - String, database file (created with its directory)
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        self.path = path
+        self._depth = 0
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ Runs the with block as one transaction. """
+
+        with self._lock:
+            self._depth += 1
+            try:
+                yield self
+            except Exception:
+                self._depth -= 1
+                self._db.rollback()
+                raise
+            self._depth -= 1
+            self._autocommit()
+
+    def _autocommit(self):
+        if not self._depth:
+            self._db.commit()
+
+    def _upsert(self, name, fields):
+        fields = dict(fields)
+        if fields.get('beacons') is not None:
+            fields['beacons'] = BEACON_SEPARATOR.join(fields['beacons'])
+        columns = sorted(fields)
+        self._db.execute('INSERT OR IGNORE INTO targets (name) VALUES (?)',
+                         (name,))
+        if columns:
+            self._db.execute(
+                'UPDATE targets SET {} WHERE name = ?'.format(
+                    ', '.join('{} = ?'.format(column)
+                              for column in columns)),
+                [fields[column] for column in columns] + [name])
+
+    def record(self, name, **fields):
+        """ Inserts or updates target name.  Fields left out, or None, keep
+            their stored value.
+
+            Inputs:
+                name - String, target name
+                fields - any of COLUMNS besides name
+        """
+
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError('unknown inventory columns: {}'.format(
+                ', '.join(sorted(unknown))))
+        with self._lock:
+            self._upsert(name, dict((column, value) for column, value in
+                                    fields.items() if value is not None))
+            self._autocommit()
+
+    def remove(self, name):
+        """ Drops target name from the inventory. """
+
+        with self._lock:
+            self._db.execute('DELETE FROM targets WHERE name = ?', (name,))
+            self._autocommit()
+
+    def get(self, name):
+        """ Returns target name's record as a dict, or None. """
+
+        with self._lock:
+            values = self._db.execute(
+                'SELECT {} FROM targets WHERE name = ?'.format(
+                    ', '.join(COLUMNS)), (name,)).fetchone()
+        return _row(values) if values else None
+
+    def targets(self, pod=None, group=None):
+        """ Returns the records of every target, or of one pod / group,
+            sorted by name.
+        """
+
+        where = []
+        values = []
+        if pod is not None:
+            where.append('pod = ?')
+            values.append(pod)
+        if group is not None:
+            where.append('target_group = ?')
+            values.append(group)
+        query = 'SELECT {} FROM targets{} ORDER BY name'.format(
+            ', '.join(COLUMNS),
+            ' WHERE {}'.format(' AND '.join(where)) if where else '')
+        with self._lock:
+            return [_row(row) for row in
+                    self._db.execute(query, values).fetchall()]
+
+    def replace(self, records, synced_at=None):
+        """ Makes the table match records (e.g. a fresh OMS listing) in one
+            transaction: records are upserted, stored targets missing from
+            them are removed.  Fields a record carries are overwritten, None
+            included; stored fields it leaves out, such as port, beacons
+            and provisioned_at, are kept.
+
+            Inputs:
+                records - dict, target name -> dict of fields
+                synced_at - float, time stamp stored on every record
+
+            Returns:
+                (updated, removed) - record counts
+        """
+
+        synced_at = synced_at or time.time()
+        with self.transaction():
+            stored = set(row[0] for row in
+                         self._db.execute('SELECT name FROM targets'))
+            for name, fields in records.items():
+                self._upsert(name, dict(fields, synced_at=synced_at))
+            removed = stored - set(records)
+            self._db.executemany('DELETE FROM targets WHERE name = ?',
+                                 [(name,) for name in removed])
+        return len(records), len(removed)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+class Query(object):
+    """ One emcli query of a sync-inventory refresh.
+
+        Attributes:
+            name - String, what the query fetches (for messages)
+            verb - String, emcli verb
+            options - dict, verb options
+            prop - String, the property a TargetProperties query fetches
+            group - String, the group a get_group_members query fetches
+    """
+
+    __slots__ = ('name', 'verb', 'options', 'prop', 'group')
+
+    def __init__(self, name, verb, options, prop=None, group=None):
+        self.name = name
+        self.verb = verb
+        self.options = options
+        self.prop = prop
+        self.group = group
+
+
+def sync_queries(target_type='generic_service', groups=(),
+                 hash_property=None):
+    """ Splits an OMS refresh into independent queries that can run in
+        parallel: the target list, one TargetProperties query per property
+        of interest and one member query per group.  emcli list has no
+        paging, so each property query is the page.
+
+        Inputs:
+            target_type - String, OEM target type
+            groups - iterable of group names
+            hash_property - String, property holding the template hash
+                            (see the update module), or None
+
+        Returns:
+            List of Query objects
+    """
+
+    search = "TARGET_TYPE='{}'".format(target_type)
+    queries = [Query('targets', 'list',
+                     {'resource': 'Targets', 'search': search,
+                      'columns': 'TARGET_NAME', 'format': 'name:csv',
+                      'noheader': True})]
+    props = [prop for prop, _ in PROPERTY_COLUMNS]
+    if hash_property:
+        props.append(hash_property)
+    for prop in props:
+        queries.append(Query(
+            'property {}'.format(prop), 'list',
+            {'resource': 'TargetProperties',
+             'search': [search, "PROPERTY_NAME='{}'".format(prop)],
+             'columns': 'TARGET_NAME,PROPERTY_VALUE', 'format': 'name:csv',
+             'noheader': True}, prop=prop))
+    for group in groups:
+        queries.append(Query('group {}'.format(group), 'get_group_members',
+                             {'name': group, 'script': True,
+                              'noheader': True}, group=group))
+    return queries
+
+
+class Listing(object):
+    """ Collects the output of sync_queries() into inventory records.
+
+        Inputs:
+            hash_property - String, property holding the template hash
+            hash_prefix - String, prefix of the hashes this tool stores;
+                          other values of hash_property are ignored
+    """
+
+    def __init__(self, hash_property=None, hash_prefix=''):
+        self.hash_property = hash_property
+        self.hash_prefix = hash_prefix
+        self.names = set()
+        self.properties = {}
+        self.members = {}
+
+    def add(self, query, out):
+        """ Adds the output of one successful query. """
+
+        if query.group is not None:
+            members = self.members.setdefault(query.group, set())
+            for line in out.splitlines():
+                if line.strip():
+                    members.add(line.split('\t')[0].strip())
+            return
+        for row in csv.reader(out.splitlines()):
+            if not row:
+                continue
+            if query.prop is None:
+                self.names.add(row[0])
+            elif len(row) >= 2:
+                self.properties.setdefault(row[0], {})[query.prop] = row[1]
+
+    def records(self):
+        """ Returns the inventory records of every listed target, as
+            Inventory.replace() takes them.
+        """
+
+        columns = dict(PROPERTY_COLUMNS)
+        records = {}
+        for name in self.names:
+            properties = self.properties.get(name, {})
+            record = dict((column, properties.get(prop))
+                          for prop, column in columns.items())
+            # Targets provisioned by add runs carry no hash property yet,
+            # so only a hash property that is set replaces the stored hash
+            if self.hash_property in properties:
+                stored_hash = properties[self.hash_property]
+                record['template_hash'] = (
+                    stored_hash if stored_hash.startswith(self.hash_prefix)
+                    else None)
+            member_of = sorted(group for group, members in
+                               self.members.items() if name in members)
+            record['target_group'] = member_of[0] if member_of else None
+            if name.endswith('_ldap'):
+                record['host'] = name[:-len('_ldap')]
+            records[name] = record
+        return records
+
+
+def open_inventory(settings):
+    """ Opens the inventory the config file points at.
+
+        Returns:
+            Inventory object, or None when the inventory is turned off
+            ([inventory] path left out or empty).
+    """
+
+    path = settings.inventory if settings is not None else None
+    if not path:
+        return None
+    return Inventory(path)
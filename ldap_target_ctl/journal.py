@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+""" Append-only journal of completed provisioning steps, used to resume an
+    interrupted batch run.
+"""
+
+import threading
+
+# Journal line format: <step>\t<target name>\n
+SEPARATOR = '\t'
+
+
+class Journal(object):
+    """ Appends one line per completed step.  Each record is a single
+        buffered write flushed to the OS (no fsync) under a short lock, so
+        concurrent workers can record steps without waiting on the disk.
+        A record survives the process dying; only a host crash can lose
+        the tail of the file, which a resumed run then simply redoes.
+
+        Inputs:
+            path - String, journal file
+            resume - bool, keep existing records (True) or start a new
+                     journal (False)
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = replay(path) if resume else {}
+        self._file = open(path, 'a+' if resume else 'w')
+        self._lock = threading.Lock()
+        if resume:
+            # Start on a fresh line after a torn final record
+            self._file.seek(0, 2)
+            if self._file.tell():
+                self._file.seek(-1, 2)
+                if self._file.read(1) != '\n':
+                    self._file.seek(0, 2)
+                    self._file.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def completed(self, name):
+        """ Returns the set of steps already journaled for target name. """
+
+        return self.done.get(name, frozenset())
+
+    def record(self, name, step):
+        """ Records that step finished for target name. """
+
+        line = '{}{}{}\n'.format(step, SEPARATOR, name)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def replay(path):
+    """ Reads a journal back.
+
+        Inputs:
+            path - String, journal file.  A missing file is an empty journal.
+
+        Returns:
+            dict, target name -> set of completed step names
+    """
+
+    done = {}
+    try:
+        journal = open(path, 'r')
+    except IOError:
+        return done
+    with journal:
+        for line in journal:
+            # A torn final line (no newline) was never fully recorded
+            if not line.endswith('\n'):
+                break
+            step, _, name = line.rstrip('\n').partition(SEPARATOR)
+            if name:
+                done.setdefault(name, set()).add(step)
+    return done
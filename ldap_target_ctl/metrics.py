@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+""" Step and emcli verb timings for a run, written as per-target JSON lines
+    and as a Prometheus textfile (for node_exporter's textfile collector).
+"""
+
+import os
+import json
+import math
+import time
+import tempfile
+import threading
+import contextlib
+import collections
+from timeit import default_timer
+
+PREFIX = 'ldap_target_ctl'
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def quantile(samples, q):
+    """ Nearest-rank quantile of a sorted, non-empty list. """
+
+    return samples[max(0, int(math.ceil(q * len(samples))) - 1)]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def write_atomic(path, text):
+    """ Replaces path with text so readers never see a partial file. """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=directory,
+                                prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        with os.fdopen(fd, 'w') as out:
+            out.write(text)
+        os.chmod(temp, 0644)
+        os.rename(temp, path)
+    except Exception:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+
+
+class Recorder(object):
+    """ Collects timings for one run.  Safe to use from every worker.
+
+        Attributes:
+            steps - dict, step name -> list of seconds
+            verbs - dict, emcli verb -> list of seconds
+            errors - dict, emcli verb -> failed call count
+            targets - OrderedDict, target name -> record dict, in the order
+                      targets were first timed
+    """
+
+    def __init__(self, clock=default_timer):
+        self.steps = collections.defaultdict(list)
+        self.verbs = collections.defaultdict(list)
+        self.errors = collections.defaultdict(int)
+        self.targets = collections.OrderedDict()
+        self.started = time.time()
+        self._clock = clock
+        self._start = clock()
+        self._lock = threading.Lock()
+
+    def target(self, name, **fields):
+        """ Returns the record for target name, creating it with fields. """
+
+        with self._lock:
+            record = self.targets.get(name)
+            if record is None:
+                record = collections.OrderedDict(target=name)
+                record.update(sorted(fields.items()))
+                record['code'] = 0
+                record['steps'] = collections.OrderedDict()
+                self.targets[name] = record
+            return record
+
+    def add(self, step, seconds, names=()):
+        """ Records one timed step, for each target in names if given. """
+
+        with self._lock:
+            self.steps[step].append(seconds)
+            for name in names:
+                record = self.targets.get(name)
+                if record is not None:
+                    record['steps'][step] = round(seconds, 6)
+
+    @contextlib.contextmanager
+    def timer(self, step, *names):
+        """ Times the with block as step (of the targets in names). """
+
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(step, self._clock() - start, names)
+
+    def observe(self, verb, seconds, kind=None):
+        """ MeteredEmcli observer: records one emcli call. """
+
+        with self._lock:
+            self.verbs[verb].append(seconds)
+            if kind is not None:
+                self.errors[verb] += 1
+
+    def finish(self, name, code):
+        """ Records target name's final error code. """
+
+        with self._lock:
+            record = self.targets.get(name)
+            if record is not None:
+                record['code'] += code
+
+    def json_lines(self):
+        """ Returns one JSON object per target, newline terminated. """
+
+        return ''.join('{}\n'.format(json.dumps(record))
+                       for record in self.targets.values())
+
+    def prometheus(self):
+        """ Returns the run's metrics in Prometheus text exposition format.
+        """
+
+        lines = []
+
+        def summary(metric, label, samples, help_text):
+            name = '{}_{}'.format(PREFIX, metric)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} summary'.format(name))
+            for key in sorted(samples):
+                values = sorted(samples[key])
+                if not values:
+                    continue
+                for q in QUANTILES:
+                    lines.append('{}{{{}="{}",quantile="{}"}} {!r}'.format(
+                        name, label, _label(key), q, quantile(values, q)))
+                lines.append('{}_sum{{{}="{}"}} {!r}'.format(
+                    name, label, _label(key), sum(values)))
+                lines.append('{}_count{{{}="{}"}} {}'.format(
+                    name, label, _label(key), len(values)))
+
+        def gauge(metric, help_text, samples, kind='gauge'):
+            name = '{}_{}'.format(PREFIX, metric)
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in samples:
+                lines.append('{}{} {!r}'.format(name, labels, value))
+
+        with self._lock:
+            summary('step_duration_seconds', 'step', self.steps,
+                    'Time spent in each provisioning step.')
+            summary('verb_duration_seconds', 'verb', self.verbs,
+                    'Latency of each emcli verb call.')
+            gauge('verb_errors_total', 'Failed emcli verb calls.',
+                  [('{{verb="{}"}}'.format(_label(verb)), count)
+                   for verb, count in sorted(self.errors.items())],
+                  'counter')
+            failed = sum(1 for record in self.targets.values()
+                         if record.get('code'))
+            gauge('targets', 'Targets handled by the run.',
+                  [('{result="ok"}', len(self.targets) - failed),
+                   ('{result="failed"}', failed)])
+            gauge('run_duration_seconds', 'Wall clock time of the run.',
+                  [('', self._clock() - self._start)])
+            gauge('last_run_timestamp_seconds',
+                  'Unix time the run started.', [('', self.started)])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, json_file=None, prom_file=None):
+        """ Writes the requested outputs, each atomically. """
+
+        if json_file:
+            write_atomic(json_file, self.json_lines())
+        if prom_file:
+            write_atomic(prom_file, self.prometheus())
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+""" Beacon placement.  By default every beacon of a pod runs the LDAP test
+    of every target in the pod, so a new beacon adds load instead of
+    sharing it.  With a replication factor each target gets only that many
+    of its pod's beacons, picked by consistent hashing of the target name:
+    every beacon owns many points (virtual nodes) on a hash ring, and a
+    target takes the first distinct beacons clockwise from its own point.
+    Adding or removing a beacon only moves the targets whose beacons the
+    change touches, about replicas / beacons of them.
+"""
+
+import bisect
+import hashlib
+import collections
+
+# Points each beacon owns on its pod's ring; more points spread targets
+# more evenly
+DEFAULT_VNODES = 100
+
+
+def _point(key):
+    """ Returns the ring position of key, a 64 bit int. """
+
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """ Consistent hash ring of nodes (beacon names).
+
+        Inputs:
+            nodes - iterable of node names
+            vnodes - int, ring points per node
+    """
+
+    def __init__(self, nodes, vnodes=DEFAULT_VNODES):
+        if vnodes < 1:
+            raise ValueError('vnodes must be at least 1')
+        self.nodes = tuple(sorted(set(nodes)))
+        points = sorted((_point('{}#{}'.format(node, index)), node)
+                        for node in self.nodes for index in xrange(vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def lookup(self, key, count=1):
+        """ Returns the first count distinct nodes clockwise from key's
+            point, or every node if there are no more than count.
+        """
+
+        count = min(count, len(self.nodes))
+        found = []
+        if not count:
+            return found
+        start = bisect.bisect(self._points, _point(key))
+        for offset in xrange(len(self._points)):
+            node = self._owners[(start + offset) % len(self._points)]
+            if node not in found:
+                found.append(node)
+                if len(found) == count:
+                    break
+        return found
+
+
+class BeaconPlacement(object):
+    """ Picks the beacons of each target from its pod's pool.
+
+        Inputs:
+            beacons - dict, pod name -> tuple of beacon names, as
+                      Settings.beacons
+            replicas - int, beacons per target, or None for every beacon
+                       of the pod
+            vnodes - int, ring points per beacon
+            budget - float, most LDAP tests per minute a beacon may run
+                     (see the planner module), or None for no limit
+            rebalance - bool, move targets that would put a beacon over
+                        budget to the next beacons on the ring instead of
+                        refusing the batch
+    """
+
+    def __init__(self, beacons, replicas=None, vnodes=DEFAULT_VNODES,
+                 budget=None, rebalance=False):
+        if replicas is not None and replicas < 1:
+            raise ValueError('replicas must be at least 1')
+        if budget is not None and budget <= 0:
+            raise ValueError('budget must be positive')
+        self.beacons = beacons
+        self.replicas = replicas
+        self.vnodes = vnodes
+        self.budget = budget
+        self.rebalance = rebalance
+        # Rings are built up front, so shards can share the placement
+        self._rings = {}
+        if replicas is not None:
+            self._rings = dict((pod, HashRing(pool, vnodes))
+                               for pod, pool in beacons.items())
+
+    def assign(self, pod, target_name):
+        """ Returns the beacons target_name's test should run from, in the
+            order the pod's pool lists them.
+        """
+
+        pool = self.beacons[pod]
+        if self.replicas is None or self.replicas >= len(pool):
+            return pool
+        chosen = set(self._rings[pod].lookup(target_name, self.replicas))
+        return tuple(beacon for beacon in pool if beacon in chosen)
+
+    def candidates(self, pod, target_name):
+        """ Returns every beacon of the pod in target_name's ring order:
+            the assigned beacons first, then the ones it would move to.
+            Without a replication factor there is nowhere to move, and
+            the pool is returned as is.
+        """
+
+        pool = self.beacons[pod]
+        if self.replicas is None:
+            return pool
+        return tuple(self._rings[pod].lookup(target_name, len(pool)))
+
+
+def from_settings(settings, replicas=None, budget=None, rebalance=None):
+    """ Returns the BeaconPlacement of the config's optional [placement]
+        section (replicas, vnodes, budget, rebalance).  Arguments that
+        aren't None override the section's values.
+    """
+
+    parser = settings.parser
+    vnodes = DEFAULT_VNODES
+
+    def option(name, read):
+        if parser.has_option('placement', name) and \
+                parser.get('placement', name).strip():
+            return read('placement', name)
+        return None
+
+    if parser.has_section('placement'):
+        if replicas is None:
+            replicas = option('replicas', parser.getint)
+        vnodes = option('vnodes', parser.getint) or vnodes
+        if budget is None:
+            budget = option('budget', parser.getfloat)
+        if rebalance is None:
+            rebalance = option('rebalance', parser.getboolean)
+    return BeaconPlacement(settings.beacons, replicas, vnodes, budget,
+                           bool(rebalance))
+
+
+def count_tests(targets, pools=()):
+    """ Counts the LDAP tests each beacon runs.
+
+        Inputs:
+            targets - iterable of objects with a beacons attribute, such as
+                      engine.BatchTarget
+            pools - iterable of beacon pools whose beacons are listed even
+                    when no target uses them
+
+        Returns:
+            OrderedDict, beacon name -> number of targets, by beacon name
+    """
+
+    counts = collections.Counter()
+    for pool in pools:
+        for beacon in pool:
+            counts[beacon] += 0
+    for target in targets:
+        counts.update(target.beacons)
+    return collections.OrderedDict(sorted(counts.items()))
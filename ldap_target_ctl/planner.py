@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+""" Beacon load planning.  Every target costs each of its beacons one LDAP
+    test per collection interval of its lifecycle's profile.  Before a
+    batch is provisioned, the load the inventory's targets already put on
+    each beacon is added up with the batch's, and a batch that would take
+    any beacon over its budget (tests per minute) is refused, or with a
+    replication factor rebalanced: a target whose beacons are full moves
+    to the next beacons on its hash ring that have room.
+
+    The load is the steady state of passing tests; retries of failing
+    tests come on top of it.
+"""
+
+import collections
+
+# Slack for float sums of fractional rates
+EPSILON = 1e-9
+
+
+class LoadPlan(object):
+    """ Beacon load before and after a batch.
+
+        Attributes:
+            budget - float, tests per minute per beacon, or None
+            before - dict, beacon name -> tests per minute of the targets
+                     already provisioned (batch targets left out)
+            after - OrderedDict, beacon name -> tests per minute with the
+                    batch, by beacon name
+            moved - dict, target name -> beacons it was rebalanced to
+            overloaded - list of the beacon names over budget after the
+                         batch
+    """
+
+    def __init__(self, budget, before, after, moved):
+        self.budget = budget
+        self.before = before
+        self.after = after
+        self.moved = moved
+        self.overloaded = [beacon for beacon, load in after.items()
+                           if budget is not None and
+                           load > budget + EPSILON]
+
+    @property
+    def ok(self):
+        return not self.overloaded
+
+    def report(self):
+        """ Returns the lines describing the plan. """
+
+        lines = ['Beacon load (tests per minute{}):'.format(
+            '' if self.budget is None
+            else ', budget {:g}'.format(self.budget))]
+        for beacon, load in self.after.items():
+            lines.append('  {}: {:.2f} -> {:.2f}{}'.format(
+                beacon, self.before.get(beacon, 0.0), load,
+                ' OVER BUDGET' if beacon in self.overloaded else ''))
+        if self.moved:
+            lines.append('Rebalanced {} target(s) to beacons with '
+                         'room'.format(len(self.moved)))
+        return lines
+
+
+def beacon_load(records, profiles, skip=()):
+    """ Adds up the tests per minute inventory records put on each beacon.
+
+        Inputs:
+            records - iterable of inventory record dicts (beacons and
+                      lifecycle are used)
+            profiles - profiles.Profiles object
+            skip - container of target names to leave out
+
+        Returns:
+            collections.Counter, beacon name -> tests per minute
+    """
+
+    load = collections.Counter()
+    for record in records:
+        if record['name'] in skip:
+            continue
+        rate = profiles.get(record['lifecycle']).tests_per_minute
+        for beacon in record['beacons']:
+            load[beacon] += rate
+    return load
+
+
+def plan_batch(targets, records, profiles, beacon_placement):
+    """ Works out each beacon's load with the batch added, rebalancing the
+        targets that would overload a beacon if beacon_placement allows.
+
+        Inputs:
+            targets - list of engine.BatchTarget objects, in batch order
+            records - iterable of inventory record dicts
+            profiles - profiles.Profiles object
+            beacon_placement - placement.BeaconPlacement (its budget,
+                               rebalance and candidates() are used)
+
+        Returns:
+            LoadPlan object
+    """
+
+    budget = beacon_placement.budget
+    names = set(target.name for target in targets)
+    before = beacon_load(records, profiles, skip=names)
+    load = collections.Counter(before)
+    moved = {}
+    for target in targets:
+        for beacon in beacon_placement.beacons.get(target.pod, ()):
+            load[beacon] += 0.0
+        rate = profiles.get(
+            target.properties.get('Lifecycle Status')).tests_per_minute
+        beacons = target.beacons
+        if budget is not None and beacon_placement.rebalance and any(
+                load[beacon] + rate > budget + EPSILON
+                for beacon in beacons):
+            roomy = [beacon for beacon in beacon_placement.candidates(
+                target.pod, target.name)
+                if load[beacon] + rate <= budget + EPSILON]
+            if len(roomy) >= len(beacons):
+                chosen = set(roomy[:len(beacons)])
+                beacons = tuple(beacon for beacon
+                                in beacon_placement.beacons[target.pod]
+                                if beacon in chosen)
+                moved[target.name] = beacons
+        for beacon in beacons:
+            load[beacon] += rate
+    return LoadPlan(budget, dict(before),
+                    collections.OrderedDict(sorted(load.items())), moved)
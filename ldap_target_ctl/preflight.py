@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+""" Pre-flight pass over a batch file, run before any OMS call.
+"""
+
+from . import batch
+
+
+class PreflightReport(object):
+    """ Everything wrong with a batch file, found in one pass.
+
+        Attributes:
+            rows - int, number of rows read
+            problems - list of Strings, one per problem found, in line
+                       order
+            duplicates - dict, line number of a repeated row -> line number
+                         of the row it repeats.  These rows are skipped.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.problems = []
+        self.duplicates = {}
+
+
+def host_problem(ldap_host):
+    """ Says why ldap_host can't be provisioned, if it can't.  emcli
+        separates a target name from its type with ':' (name:type member
+        lists, error messages), so the name of an IPv6 address host,
+        such as fe80::1_ldap, would be ambiguous.
+
+        Returns:
+            String, the problem, or None
+    """
+
+    if ':' in ldap_host:
+        return ('{} can\'t be provisioned, emcli target names can\'t '
+                'contain ":"; use its host name').format(ldap_host)
+    return None
+
+
+def check_batch(batch_file, beacons, entities, lifecycles,
+                entity_number=None, batch_format=None):
+    """ Validates every row of a batch file against the pod/beacon and
+        entity indexes and the lifecycle table, rejects hosts whose target
+        name emcli can't handle (see host_problem()), and finds rows that
+        would provision the same target twice.  Identical repeats are
+        coalesced into the first row; repeats that disagree are problems.
+
+        Inputs:
+            batch_file - String, path to the batch file
+            beacons - dict, pod -> beacons (Settings.beacons)
+            entities - dict, entity number -> name (Settings.entities)
+            lifecycles - dict, accepted lifecycle names (lifecycle_name())
+            entity_number - int, run-wide entity number rows fall back to
+            batch_format - String, one of batch.FORMATS or None to detect
+
+        Returns:
+            PreflightReport object
+    """
+
+    report = PreflightReport()
+    errors = []
+    found = []
+    # target name -> (line, everything else about the row)
+    seen = {}
+
+    def problem(line, message):
+        found.append((line, 'line {}: {}'.format(line, message)))
+
+    for row in batch.read_batch(batch_file, batch_format, errors=errors):
+        report.rows += 1
+
+        if row.pod not in beacons:
+            problem(row.line, 'unknown pod {}'.format(row.pod))
+        if not row.ldap_port.isdigit() or \
+                not 0 < int(row.ldap_port) < 65536:
+            problem(row.line, 'invalid port {}'.format(row.ldap_port))
+        if row.lifecycle and row.lifecycle.lower() not in lifecycles:
+            problem(row.line, '{} is not a valid lifecycle'.format(
+                row.lifecycle))
+        if row.entity_number:
+            if not row.entity_number.isdigit() or \
+                    int(row.entity_number) not in entities:
+                problem(row.line, '{} is not a valid OTES entity '
+                        'number'.format(row.entity_number))
+        elif entity_number not in entities:
+            problem(row.line, 'no valid entity number')
+
+        if host_problem(row.ldap_host):
+            problem(row.line, host_problem(row.ldap_host))
+
+        name = '{}_ldap'.format(row.ldap_host)
+        signature = tuple(getattr(row, field) for field in
+                          batch.REQUIRED + batch.OVERRIDES)
+        if name in seen:
+            first_line, first_signature = seen[name]
+            if signature == first_signature:
+                report.duplicates[row.line] = first_line
+            else:
+                problem(row.line, '{} conflicts with line {}'.format(
+                    name, first_line))
+        else:
+            seen[name] = (row.line, signature)
+
+    found.extend((error.line, str(error)) for error in errors)
+    report.problems = [message for line, message in sorted(found)]
+    return report
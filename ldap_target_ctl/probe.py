@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+""" Pre-flight reachability probe of the LDAP hosts in a batch.  Thousands
+    of connections are kept in flight by one thread: sockets are
+    non-blocking and a poll() loop drives each host's exchange, written as
+    a generator that yields the bytes to send and the responses to wait
+    for.  Host names are resolved ahead of the loop by a few resolver
+    threads, since getaddrinfo() blocks.
+"""
+
+import os
+import sys
+import Queue
+import errno
+import select
+import socket
+import timeit
+import threading
+
+from . import ber
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Exchange operations yielded by Conversation.steps()
+SEND = 'send'
+RECEIVE = 'receive'
+
+DEFAULT_CONCURRENCY = 1000
+DEFAULT_TIMEOUT = 5.0
+# File descriptors left for everything but probe sockets
+RESERVED_FILES = 64
+# Threads resolving host names, and how often the poll loop checks on them
+RESOLVER_THREADS = 8
+RESOLVER_POLL = 0.05
+
+
+class Conversation(object):
+    """ One host's exchange.  run() connects, then drives steps().
+
+        Attributes:
+            host - String, LDAP host
+            port - int, LDAP port
+            timeout - float, seconds the whole exchange may take
+            step - String, what the exchange is doing, for errors
+            error - String, why the exchange failed, or None
+            timings - dict, step name -> seconds (connect is set by run())
+    """
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.step = 'connect'
+        self.error = None
+        self.timings = {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def steps(self):
+        """ Generator of the exchange after connecting.  Yields (SEND,
+            data) to send data, and (RECEIVE,) to be sent the next complete
+            BER message the host answers.
+        """
+
+        return
+        yield
+
+
+class Reachability(Conversation):
+    """ Connects and, given a bind_dn, binds with a simple bind and
+        unbinds.
+
+        Attributes:
+            result_code - int, LDAP result code of the bind, or None
+    """
+
+    def __init__(self, host, port, bind_dn=None, password=None,
+                 timeout=DEFAULT_TIMEOUT, clock=timeit.default_timer):
+        Conversation.__init__(self, host, port, timeout)
+        self.bind_dn = bind_dn
+        self.password = password
+        self.result_code = None
+        self._clock = clock
+
+    def steps(self):
+        if self.bind_dn is None:
+            return
+        self.step = 'bind'
+        started = self._clock()
+        yield SEND, ber.bind_request(1, self.bind_dn, self.password)
+        response = yield RECEIVE,
+        self.timings['bind'] = self._clock() - started
+        message_id, operation, value = ber.parse_message(response)
+        if operation != ber.BIND_RESPONSE:
+            self.error = 'bind: unexpected response'
+            return
+        self.result_code, diagnostic = ber.parse_result(value)
+        if self.result_code != ber.SUCCESS:
+            self.error = 'bind failed with LDAP result code {}{}'.format(
+                self.result_code, ': {}'.format(diagnostic)
+                if diagnostic else '')
+            return
+        yield SEND, ber.unbind_request(2)
+
+
+class _Channel(object):
+    """ A Conversation's socket and its position in the exchange. """
+
+    def __init__(self, conversation, sock, now):
+        self.conversation = conversation
+        self.sock = sock
+        self.started = now
+        self.deadline = now + conversation.timeout
+        self.exchange = None
+        self.waiting = None
+        self.outgoing = ''
+        self.incoming = ''
+        self.events = select.POLLOUT
+
+
+def concurrency_limit(concurrency):
+    """ Caps concurrency to the open file limit. """
+
+    if resource is None:
+        return concurrency
+    soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft == resource.RLIM_INFINITY:
+        return concurrency
+    return max(1, min(concurrency, soft - RESERVED_FILES))
+
+
+class _Poller(object):
+    """ select.poll(), or select.select() where poll is missing. """
+
+    def __init__(self):
+        self._poll = select.poll() if hasattr(select, 'poll') else None
+        self._events = {}
+
+    def register(self, fd, events):
+        self._events[fd] = events
+        if self._poll is not None:
+            self._poll.register(fd, events)
+
+    def unregister(self, fd):
+        del self._events[fd]
+        if self._poll is not None:
+            self._poll.unregister(fd)
+
+    def poll(self, timeout):
+        if self._poll is not None:
+            return self._poll.poll(max(0, int(timeout * 1000)))
+        readers = [fd for fd, events in self._events.items()
+                   if events & select.POLLIN]
+        writers = [fd for fd, events in self._events.items()
+                   if events & select.POLLOUT]
+        readable, writable, _ = select.select(readers, writers, [],
+                                              max(0, timeout))
+        return ([(fd, select.POLLIN) for fd in readable] +
+                [(fd, select.POLLOUT) for fd in writable])
+
+
+class _Resolver(object):
+    """ Resolves the hosts of conversations on daemon threads, taking them
+        from the iterable as lookups finish, so a slow lookup only holds
+        up its own conversation.  At most backlog resolved conversations
+        wait to be started.
+    """
+
+    def __init__(self, conversations, threads=RESOLVER_THREADS, backlog=0):
+        self.done = False
+        self._waiting = iter(conversations)
+        self._lock = threading.Lock()
+        self._resolved = Queue.Queue(backlog)
+        self._threads = threads
+        self._finished = 0
+        self._failure = None
+        for _ in range(threads):
+            thread = threading.Thread(target=self._resolve)
+            thread.daemon = True
+            thread.start()
+
+    def _resolve(self):
+        try:
+            while True:
+                with self._lock:
+                    conversation = next(self._waiting, None)
+                if conversation is None:
+                    break
+                try:
+                    address = socket.getaddrinfo(conversation.host,
+                                                 conversation.port, 0,
+                                                 socket.SOCK_STREAM)[0]
+                except socket.error, error:
+                    conversation.error = 'cannot resolve {}: {}'.format(
+                        conversation.host, error.args[-1])
+                    address = None
+                self._resolved.put((conversation, address))
+        except Exception:
+            self._failure = sys.exc_info()
+        finally:
+            self._resolved.put(None)
+
+    def next(self, wait=0):
+        """ Returns the next resolved (conversation, address) pair, address
+            None when the lookup failed, or None if there is none within
+            wait seconds or no more to come.
+        """
+
+        while not self.done:
+            try:
+                item = self._resolved.get(bool(wait), wait or None)
+            except Queue.Empty:
+                return None
+            if item is not None:
+                return item
+            self._finished += 1
+            if self._failure is not None:
+                raise self._failure[0], self._failure[1], self._failure[2]
+            self.done = self._finished == self._threads
+        return None
+
+
+def run(conversations, concurrency=DEFAULT_CONCURRENCY,
+        clock=timeit.default_timer):
+    """ Runs conversations, up to concurrency of them at once, until each
+        has finished, failed or timed out.  Results are left on the
+        Conversation objects.
+
+        Inputs:
+            conversations - iterable of Conversation objects, consumed
+                            lazily
+            concurrency - int, most connections open at once (capped to
+                          the open file limit)
+            clock - callable returning seconds
+    """
+
+    concurrency = concurrency_limit(concurrency)
+    resolver = _Resolver(conversations, backlog=concurrency)
+    poller = _Poller()
+    channels = {}
+
+    def close(channel, error=None):
+        conversation = channel.conversation
+        if error is not None and conversation.error is None:
+            conversation.error = '{}: {}'.format(conversation.step, error)
+        fd = channel.sock.fileno()
+        poller.unregister(fd)
+        del channels[fd]
+        channel.sock.close()
+
+    def advance(channel):
+        """ Resumes the exchange until it waits on the socket. """
+
+        while True:
+            value = None
+            if channel.waiting == RECEIVE:
+                length = ber.message_length(channel.incoming)
+                if length is None:
+                    channel.events = select.POLLIN
+                    break
+                value = channel.incoming[:length]
+                channel.incoming = channel.incoming[length:]
+            try:
+                operation = channel.exchange.send(value)
+            except StopIteration:
+                close(channel)
+                return
+            except ber.BERError, error:
+                close(channel, 'bad response: {}'.format(error))
+                return
+            channel.waiting = operation[0]
+            if channel.waiting == SEND:
+                channel.outgoing += operation[1]
+                channel.events = select.POLLOUT
+                break
+        poller.unregister(channel.sock.fileno())
+        poller.register(channel.sock.fileno(), channel.events)
+
+    def start(conversation, address):
+        if address is None:
+            return
+        now = clock()
+        sock = socket.socket(address[0], address[1], address[2])
+        sock.setblocking(0)
+        code = sock.connect_ex(address[4])
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            conversation.error = 'connect: {}'.format(os.strerror(code))
+            return
+        channel = _Channel(conversation, sock, now)
+        channels[sock.fileno()] = channel
+        poller.register(sock.fileno(), channel.events)
+
+    def connected(channel):
+        code = channel.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code:
+            close(channel, os.strerror(code))
+            return
+        conversation = channel.conversation
+        conversation.timings['connect'] = clock() - channel.started
+        channel.exchange = conversation.steps()
+        advance(channel)
+
+    while True:
+        while len(channels) < concurrency:
+            # Only wait on the resolvers when no socket needs attention
+            resolved = resolver.next(0 if channels else RESOLVER_POLL)
+            if resolved is None:
+                break
+            start(*resolved)
+        if not channels:
+            if resolver.done:
+                break
+            continue
+
+        now = clock()
+        for channel in [channel for channel in channels.values()
+                        if channel.deadline <= now]:
+            close(channel, 'timed out after {:g}s'.format(
+                channel.conversation.timeout))
+        if not channels:
+            continue
+        timeout = min(channel.deadline for channel in channels.values())
+        if not resolver.done:
+            timeout = min(timeout, now + RESOLVER_POLL)
+        for fd, events in poller.poll(timeout - now):
+            channel = channels.get(fd)
+            if channel is None:
+                continue
+            try:
+                if channel.exchange is None:
+                    connected(channel)
+                elif channel.events & select.POLLOUT:
+                    sent = channel.sock.send(channel.outgoing)
+                    channel.outgoing = channel.outgoing[sent:]
+                    if not channel.outgoing:
+                        advance(channel)
+                else:
+                    data = channel.sock.recv(65536)
+                    if not data:
+                        close(channel, 'connection closed by host')
+                        continue
+                    channel.incoming += data
+                    if ber.message_length(channel.incoming) is not None:
+                        advance(channel)
+            except socket.error, error:
+                if error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    continue
+                close(channel, error.args[-1])
+            except ber.BERError, error:
+                close(channel, 'bad response: {}'.format(error))
+
+
+def probe_hosts(endpoints, bind_dn=None, password=None,
+                timeout=DEFAULT_TIMEOUT, concurrency=DEFAULT_CONCURRENCY):
+    """ Probes every (host, port) endpoint once.
+
+        Inputs:
+            endpoints - iterable of (host, port)
+            bind_dn - String, DN to bind as, or None to only connect
+            password - String, bind_dn's password
+            timeout - float, seconds per host
+            concurrency - int, most hosts probed at once
+
+        Returns:
+            List of Reachability objects, in endpoint order (duplicates
+            probed once)
+    """
+
+    probes = []
+    seen = set()
+    for host, port in endpoints:
+        if (host, str(port)) in seen:
+            continue
+        seen.add((host, str(port)))
+        probes.append(Reachability(host, port, bind_dn, password, timeout))
+    run(probes, concurrency)
+    return probes
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+""" Per-lifecycle collection profiles: how often the beacons run a target's
+    LDAP test and how long they wait on it.  A development directory
+    doesn't need polling as often as a Mission Critical one.
+
+    Profiles are read from the config file.  An optional [profile] section
+    changes the defaults for every lifecycle, and a [profile:<lifecycle>]
+    section (the OEM lifecycle name, or its lifecycle_name() key) changes
+    them for one.  Options left out keep the values templates had before
+    profiles, see PROPERTIES.
+"""
+
+import re
+
+# LDAP_test properties a profile sets: (property name, option, default).
+# Collection Interval and retryinterval are in minutes, ldap_timeout in
+# seconds.
+PROPERTIES = (('Collection Interval', 'collection_interval', 5.0),
+              ('ldap_timeout', 'ldap_timeout', 60.0),
+              ('numretries', 'numretries', 6.0),
+              ('retryinterval', 'retryinterval', 5.0))
+
+SECTION = 'profile'
+LIFECYCLE_SECTION = re.compile(r'^profile:(.+)$')
+
+
+class Profile(object):
+    """ Collection settings of the targets of one lifecycle.
+
+        Attributes:
+            lifecycle - String, OEM lifecycle name, or None for the
+                        defaults
+            collection_interval - float, minutes between test runs
+            ldap_timeout - float, seconds the test may take
+            numretries - float, retries of a failed test
+            retryinterval - float, minutes between retries
+    """
+
+    __slots__ = ('lifecycle',) + tuple(option for _, option, _
+                                       in PROPERTIES)
+
+    def __init__(self, lifecycle=None, **values):
+        unknown = set(values) - set(self.__slots__)
+        if unknown:
+            raise ValueError('unknown profile options: {}'.format(
+                ', '.join(sorted(unknown))))
+        self.lifecycle = lifecycle
+        for _, option, default in PROPERTIES:
+            setattr(self, option, float(values.get(option, default)))
+        if self.collection_interval <= 0:
+            raise ValueError('collection_interval must be positive')
+
+    @property
+    def tests_per_minute(self):
+        """ LDAP tests each of the target's beacons runs per minute. """
+
+        return 1.0 / self.collection_interval
+
+    def properties(self):
+        """ Returns the LDAP_test property name -> value overrides, as
+            make_xml_template takes them.
+        """
+
+        return dict((name, getattr(self, option))
+                    for name, option, _ in PROPERTIES)
+
+
+class Profiles(object):
+    """ The profile of each lifecycle, falling back to the default one.
+
+        Inputs:
+            profiles - dict, OEM lifecycle name -> Profile
+            default - Profile for lifecycles without their own
+    """
+
+    def __init__(self, profiles=None, default=None):
+        self.profiles = profiles or {}
+        self.default = default or Profile()
+
+    def get(self, lifecycle):
+        return self.profiles.get(lifecycle, self.default)
+
+    def collection(self, lifecycle):
+        """ Returns the template property overrides of lifecycle. """
+
+        return self.get(lifecycle).properties()
+
+
+def _section_values(parser, section):
+    values = {}
+    for option in parser.options(section):
+        value = parser.get(section, option).strip()
+        if value:
+            try:
+                values[option] = float(value)
+            except ValueError:
+                raise ValueError('[{}] {} is not a number: {}'.format(
+                    section, option, value))
+    return values
+
+
+def from_settings(settings, lifecycles):
+    """ Reads the [profile] and [profile:<lifecycle>] sections.
+
+        Inputs:
+            settings - Settings object
+            lifecycles - dict, lifecycle key -> OEM lifecycle name, as
+                         lifecycle_name() returns
+
+        Returns:
+            Profiles object
+
+        Raises:
+            ValueError for an unknown lifecycle, option or value
+    """
+
+    parser = settings.parser
+    names = dict((name.lower(), name) for name in lifecycles.values())
+    names.update((key.lower(), name) for key, name in lifecycles.items())
+    defaults = {}
+    if parser.has_section(SECTION):
+        defaults = _section_values(parser, SECTION)
+    profiles = {}
+    for section in parser.sections():
+        match = LIFECYCLE_SECTION.match(section)
+        if match is None:
+            continue
+        lifecycle = names.get(match.group(1).strip().lower())
+        if lifecycle is None:
+            raise ValueError('[{}] is not a known lifecycle; use one of '
+                             '{}'.format(section, ', '.join(sorted(
+                                 lifecycles.values()))))
+        values = dict(defaults)
+        values.update(_section_values(parser, section))
+        profiles[lifecycle] = Profile(lifecycle, **values)
+    return Profiles(profiles, Profile(**defaults))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+""" Bulk target property assignment.  Targets that share the exact same
+    property values are set with one set_target_property_value call per
+    chunk instead of one call per target.
+"""
+
+import collections
+from timeit import default_timer
+
+from .groups import EMCLI_ARG_LIMIT
+
+# emcli's default -property_records separators, and the ones used instead
+# when a value contains either of them
+SEPARATORS = (';', ':')
+ALT_SEPARATORS = ('#@#', '#~#')
+
+
+class PropertyBatcher(object):
+    """ Collects targets by identical property set and applies each set in
+        chunks.
+
+        Inputs:
+            target_type - String, OEM target type
+            limit - int, maximum -property_records length per call
+    """
+
+    def __init__(self, target_type='generic_service', limit=EMCLI_ARG_LIMIT):
+        self.target_type = target_type
+        self.limit = limit
+        self.sets = collections.OrderedDict()
+        self.extra = {}
+
+    def __len__(self):
+        return sum(len(names) for names in self.sets.values())
+
+    def add(self, name, properties, extra=None):
+        """ Queues properties to be set on target name, plus extra, a dict
+            of values of its own (such as its template hash) that are set
+            in the same call as the targets sharing its properties.
+        """
+
+        key = tuple(sorted(properties.items()))
+        self.sets.setdefault(key, []).append(name)
+        if extra:
+            self.extra[name] = tuple(sorted(extra.items()))
+
+    def records(self, names, properties):
+        """ Renders the -property_records value for names.
+
+            Returns:
+                (records, options) - String and dict of extra run() options
+        """
+
+        return property_records(
+            [(name, prop, value) for name in names
+             for prop, value in properties + self.extra.get(name, ())],
+            self.target_type)
+
+    def chunks(self, names, properties):
+        """ Splits names so each call's records stay under the limit. """
+
+        per_target = len(self.records(['x'], properties)[0]) + 3
+        chunk = []
+        size = 0
+        for name in names:
+            length = per_target + len(name) * len(properties)
+            if name in self.extra:
+                length += len(property_records(
+                    [(name, prop, value)
+                     for prop, value in self.extra[name]],
+                    self.target_type)[0]) + 3
+            if chunk and size + length > self.limit:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(name)
+            size += length
+        if chunk:
+            yield chunk
+
+    def apply(self, emcli, observe=None):
+        """ Sets every queued property set.  When a call fails, the targets
+            its error output names are marked failed and the rest of the
+            chunk is submitted again without them.
+
+            Inputs:
+                emcli - logged in backend client with run()
+                observe - callable, observe(names, seconds) after each call
+
+            Returns:
+                (responses, failed) - list of (names, code, out, err) per
+                emcli call, and dict of failed target name -> (code, error)
+        """
+
+        responses = []
+        failed = {}
+        for properties, names in self.sets.items():
+            pending = list(self.chunks(names, properties))
+            while pending:
+                chunk = pending.pop(0)
+                records, options = self.records(chunk, properties)
+                start = default_timer()
+                code, out, err = emcli.run('set_target_property_value',
+                                           property_records=records,
+                                           **options)
+                if observe is not None:
+                    observe(chunk, default_timer() - start)
+                responses.append((chunk, code, out, err))
+                if code == 0:
+                    continue
+                named = failed_targets(chunk, out + '\n' + err)
+                if not named or len(named) == len(chunk):
+                    named = named or dict((name, err.strip())
+                                          for name in chunk)
+                else:
+                    pending.insert(0, [name for name in chunk
+                                       if name not in named])
+                for name, message in named.items():
+                    failed[name] = (code, message)
+        return responses, failed
+
+
+def property_records(records, target_type):
+    """ Renders a -property_records value, switching to ALT_SEPARATORS
+        when a name or value contains one of the default separators.
+
+        Inputs:
+            records - list of (target name, property, value) tuples
+            target_type - String, OEM target type
+
+        Returns:
+            (records, options) - String and dict of extra run() options
+    """
+
+    text = ''.join(piece for name, prop, value in records
+                   for piece in (name, prop, str(value)))
+    if any(sep in text for sep in SEPARATORS):
+        separator, subseparator = ALT_SEPARATORS
+        options = {'separator': 'property_records={}'.format(separator),
+                   'subseparator': 'property_records={}'.format(
+                       subseparator)}
+    else:
+        separator, subseparator = SEPARATORS
+        options = {}
+    return separator.join(
+        subseparator.join((name, target_type, prop, str(value)))
+        for name, prop, value in records), options
+
+
+def failed_targets(names, output):
+    """ Finds which of names emcli's output reports an error for.
+
+        Returns:
+            dict, target name -> the output line naming it
+    """
+
+    wanted = set(names)
+    named = {}
+    for line in output.splitlines():
+        for token in line.replace('"', ' ').replace("'", ' ').split():
+            name = token.split(':')[0]
+            if name in wanted and name not in named:
+                named[name] = line.strip()
+    return named
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+""" Snapshot of what is already provisioned in OEM, and the diff between a
+    desired batch target and that snapshot.
+"""
+
+import csv
+
+# Steps of provisioning a target, in order
+STEPS = ('created', 'properties', 'grouped')
+
+
+def _csv_rows(out):
+    return [row for row in csv.reader(out.splitlines()) if row]
+
+
+class Snapshot(object):
+    """ Existing targets of one type, their properties and the members of
+        the groups of interest, fetched with one bulk query each.
+
+        Attributes:
+            targets - dict, target name -> dict of property name -> value
+            members - dict, group name -> set of member target names
+    """
+
+    def __init__(self, targets=None, members=None):
+        self.targets = targets or {}
+        self.members = members or {}
+
+    def plan(self, name, properties, group=None):
+        """ Works out which steps a target still needs.
+
+            Inputs:
+                name - String, target name
+                properties - dict, desired target properties
+                group - String, desired group or None
+
+            Returns:
+                List of step names from STEPS, in order
+        """
+
+        existing = self.targets.get(name)
+        if existing is None:
+            return list(STEPS) if group else list(STEPS[:2])
+        steps = []
+        for prop, value in properties.items():
+            if existing.get(prop) != str(value):
+                steps.append('properties')
+                break
+        if group and name not in self.members.get(group, ()):
+            steps.append('grouped')
+        return steps
+
+
+def take_snapshot(emcli, target_type='generic_service', groups=()):
+    """ Fetches every target of target_type with its properties, plus the
+        members of each group, in one emcli call per query.
+
+        Inputs:
+            emcli - logged in backend client with run()
+            target_type - String, OEM target type
+            groups - iterable of group names
+
+        Returns:
+            (snapshot, errors) - Snapshot object and a list of error
+                                 strings from queries that failed.
+    """
+
+    snapshot = Snapshot()
+    errors = []
+    search = "TARGET_TYPE='{}'".format(target_type)
+
+    code, out, err = emcli.run('list', resource='Targets', search=search,
+                               columns='TARGET_NAME', format='name:csv',
+                               noheader=True)
+    if code > 0:
+        errors.append(err.strip())
+    else:
+        for row in _csv_rows(out):
+            snapshot.targets.setdefault(row[0], {})
+
+    code, out, err = emcli.run(
+        'list', resource='TargetProperties', search=search,
+        columns='TARGET_NAME,PROPERTY_NAME,PROPERTY_VALUE',
+        format='name:csv', noheader=True)
+    if code > 0:
+        errors.append(err.strip())
+    else:
+        for row in _csv_rows(out):
+            if len(row) >= 3:
+                snapshot.targets.setdefault(row[0], {})[row[1]] = row[2]
+
+    for group in groups:
+        code, out, err = emcli.run('get_group_members', name=group,
+                                   script=True, noheader=True)
+        members = snapshot.members.setdefault(group, set())
+        if code > 0:
+            # A group that doesn't exist yet simply has no members
+            continue
+        for line in out.splitlines():
+            if line.strip():
+                members.add(line.split('\t')[0].strip())
+
+    return snapshot, errors
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+""" Precompiled rendering of the ElementTree built XML templates.  The
+    template is built once with marker values in the variable fields and
+    serialized; rendering then only escapes and splices in the real values.
+"""
+
+import functools
+import threading
+import xml.etree.ElementTree as ET
+
+SLOT_MARKER = '@@LTC_SLOT_{}@@'
+
+
+def escape_attribute(value):
+    """ Escapes an attribute value exactly like ElementTree.tostring()
+        does with its default us-ascii encoding.
+
+        Inputs:
+            value - String or unicode, the attribute value
+
+        Returns:
+            String, the escaped value
+    """
+
+    if not isinstance(value, basestring):
+        raise TypeError('cannot serialize {!r} (type {})'.format(
+            value, type(value).__name__))
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    return value.encode('us-ascii', 'xmlcharrefreplace')
+
+
+class TemplateRenderer(object):
+    """ Renders builder(*values) serialized with ET.tostring(), without
+        building the tree per call.
+
+        Inputs:
+            builder - callable returning an ElementTree Element.  Every
+                      positional argument must end up verbatim in an
+                      attribute value.
+            slots - sequence of names for builder's positional arguments
+    """
+
+    def __init__(self, builder, slots):
+        self.builder = builder
+        self.slots = tuple(slots)
+        self._format = None
+        self._lock = threading.Lock()
+
+    def compile(self):
+        """ Builds and serializes the template once with marker values and
+            turns the result into a format string with one field per slot.
+
+            Returns:
+                String, the compiled format string
+        """
+
+        markers = [SLOT_MARKER.format(slot) for slot in self.slots]
+        xmlstr = ET.tostring(self.builder(*markers))
+        xmlstr = xmlstr.replace('{', '{{').replace('}', '}}')
+        for slot, marker in zip(self.slots, markers):
+            if marker not in xmlstr:
+                raise ValueError('Template slot {} is not used'.format(slot))
+            xmlstr = xmlstr.replace(marker, '{{{}}}'.format(slot))
+        return xmlstr
+
+    def render(self, *values):
+        """ Renders the template for values (in slot order).
+
+            Returns:
+                String, identical to ET.tostring(builder(*values))
+        """
+
+        if self._format is None:
+            with self._lock:
+                if self._format is None:
+                    self._format = self.compile()
+        return self._format.format(**dict(
+            zip(self.slots, [escape_attribute(value) for value in values])))
+
+
+def freeze(value):
+    """ Returns a hashable equivalent of nested dicts, lists and tuples. """
+
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class RendererCache(object):
+    """ One TemplateRenderer per static key: keyword arguments of builder
+        that change the template's structure or fixed values but are
+        shared by many renders, such as calibrated thresholds.  Each
+        distinct set of them is compiled once.
+
+        Inputs:
+            builder - callable returning an ElementTree Element
+            slots - sequence of names for builder's positional arguments
+    """
+
+    def __init__(self, builder, slots):
+        self.builder = builder
+        self.slots = tuple(slots)
+        self._renderers = {}
+        self._lock = threading.Lock()
+
+    def renderer(self, **static):
+        """ Returns the TemplateRenderer of builder(..., **static). """
+
+        key = freeze(static)
+        renderer = self._renderers.get(key)
+        if renderer is None:
+            with self._lock:
+                renderer = self._renderers.get(key)
+                if renderer is None:
+                    renderer = TemplateRenderer(
+                        functools.partial(self.builder, **static),
+                        self.slots)
+                    self._renderers[key] = renderer
+        return renderer
+
+    def __len__(self):
+        return len(self._renderers)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+""" Retries for emcli verbs.  Failed responses are classified as transient
+    (timeouts, expired sessions, a busy or unreachable OMS) or permanent
+    (the target already exists, bad input).  Transient failures are retried
+    with jittered exponential backoff; a circuit breaker shared by every
+    worker pauses the whole batch when the OMS keeps failing.
+"""
+
+import time
+import random
+import threading
+
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+# Lower case emcli / OMS error messages, checked in order.  They are
+# whole messages rather than words such as "timeout", which also turn up in
+# ordinary errors (a bad ldap_timeout property, too many targets selected).
+TRANSIENT_ERRORS = (
+    # The OMS didn't answer in time (emcli, java.net.SocketTimeoutException)
+    'connection to the oms timed out', 'read timed out',
+    'connect timed out',
+    # The emcli session is gone
+    'session expired', 'session has expired', 'not logged in',
+    'run emcli login', 'emcli session ended',
+    # The OMS is overloaded or restarting (HTTP 503 and 429)
+    'oms is busy', 'service unavailable',
+    'service temporarily unavailable', 'too many requests',
+    # The connection to the OMS failed
+    'connection refused', 'connection reset', 'broken pipe',
+    'no route to host',
+    # The OMS was upgraded since emcli last synced
+    'out of sync', 'not synchronized', 'run emcli sync')
+RELOGIN_ERRORS = ('session expired', 'session has expired',
+                  'not logged in', 'run emcli login')
+# The OMS was upgraded since emcli last synced its verb definitions
+SYNC_ERRORS = ('out of sync', 'not synchronized', 'run emcli sync')
+# Seen when a retried call had already taken effect on the OMS
+ALREADY_DONE_ERRORS = ('already exists', 'already a member')
+
+# emclpy.Emclpy methods returning (code, out, err) that are safe to retry
+RETRIED_METHODS = ('run', 'sync', 'create_generic_service',
+                   'set_target_property_value', 'create_group',
+                   'add_to_group', 'delete_target')
+
+
+def classify(code, out, err):
+    """ Classifies an emcli response.
+
+        Returns:
+            None for success, otherwise TRANSIENT or PERMANENT.  Failures
+            that don't match a known transient error are permanent.
+    """
+
+    if code == 0:
+        return None
+    text = '{}\n{}'.format(out, err).lower()
+    if any(fragment in text for fragment in TRANSIENT_ERRORS):
+        return TRANSIENT
+    return PERMANENT
+
+
+def _matches(response, fragments):
+    text = '{}\n{}'.format(response[1], response[2]).lower()
+    return any(fragment in text for fragment in fragments)
+
+
+class RetryPolicy(object):
+    """ How often and how long to retry a transient failure.
+
+        Inputs:
+            retries - int, retries after the first attempt
+            base - float, seconds before the first retry
+            cap - float, maximum seconds between retries
+    """
+
+    def __init__(self, retries=3, base=1.0, cap=30.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def delay(self, attempt):
+        """ Seconds to wait before retry number attempt (0 based), with
+            full jitter so concurrent workers don't retry in lock step.
+        """
+
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+
+class CircuitOpen(Exception):
+    """ Raised by CircuitBreaker.wait() once the breaker has given up. """
+
+
+class CircuitBreaker(object):
+    """ Counts consecutive transient failures across every caller.  After
+        threshold of them the breaker opens and callers wait in wait()
+        for cooldown seconds; the next call is then let through as a probe.
+        A successful probe closes the breaker, a failed one opens it again
+        for twice as long.  After max_trips openings in a row the breaker
+        stays open and wait() raises CircuitOpen.
+
+        Inputs:
+            threshold - int, consecutive transient failures that open it
+            cooldown - float, seconds the first opening lasts
+            max_trips - int, openings in a row before giving up
+            notify - callable, notify(message) on state changes
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0, max_trips=4, notify=None,
+                 clock=time.time, sleep=time.sleep):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.notify = notify
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = None
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def _notify(self, message):
+        if self.notify is not None:
+            self.notify(message)
+
+    @property
+    def broken(self):
+        """ True once the breaker has given up on the OMS. """
+
+        return self.trips >= self.max_trips
+
+    def wait(self):
+        """ Blocks while the breaker is open. """
+
+        while True:
+            with self._lock:
+                if self.broken:
+                    raise CircuitOpen('OMS unavailable after {} pauses, '
+                                      'giving up'.format(self.trips))
+                if self.opened_until is None:
+                    return
+                remaining = self.opened_until - self._clock()
+                if remaining <= 0:
+                    # Half open: let callers through, the next failure
+                    # opens the breaker again
+                    self.opened_until = None
+                    self.failures = self.threshold - 1
+                    return
+            self._sleep(min(remaining, 1.0))
+
+    def success(self):
+        with self._lock:
+            if self.trips:
+                self._notify('OMS responding again, resuming')
+            self.failures = 0
+            self.trips = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.threshold or \
+                    self.opened_until is not None:
+                return
+            self.trips += 1
+            if self.broken:
+                self._notify('OMS still failing after {} pauses, giving '
+                             'up'.format(self.trips))
+                return
+            pause = self.cooldown * 2 ** (self.trips - 1)
+            self.opened_until = self._clock() + pause
+            self._notify('{} transient OMS errors in a row, pausing for '
+                         '{:.0f}s'.format(self.failures, pause))
+
+
+class RetryingEmcli(object):
+    """ Wraps an emclpy.Emclpy compatible client, retrying transient
+        failures of the RETRIED_METHODS.  Every other attribute is passed
+        through to the wrapped client.
+
+        Inputs:
+            emcli - backend client (see backends.make_emcli)
+            policy - RetryPolicy object
+            breaker - CircuitBreaker object or None
+    """
+
+    def __init__(self, emcli, policy=None, breaker=None, sleep=time.sleep):
+        self.emcli = emcli
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker
+        self.retried = 0
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.emcli, name)
+        if name not in RETRIED_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            return self.call(attribute, *args, **kwargs)
+        return call
+
+    def call(self, method, *args, **kwargs):
+        """ Calls method until it succeeds, fails permanently or runs out
+            of retries.
+
+            Returns:
+                (code, out, err) of the last attempt
+        """
+
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                try:
+                    self.breaker.wait()
+                except CircuitOpen, error:
+                    return 1, '', 'ERROR: {}'.format(error)
+            response = method(*args, **kwargs)
+            kind = classify(*response)
+            if kind != TRANSIENT:
+                if self.breaker is not None:
+                    self.breaker.success()
+                if kind == PERMANENT and attempt and \
+                        _matches(response, ALREADY_DONE_ERRORS):
+                    # An earlier attempt that timed out went through
+                    return 0, response[1] or response[2], ''
+                return response
+            if self.breaker is not None:
+                self.breaker.failure()
+            if attempt >= self.policy.retries:
+                return response
+            with self._lock:
+                self.retried += 1
+            self._sleep(self.policy.delay(attempt))
+            if _matches(response, RELOGIN_ERRORS):
+                self.emcli.login()
+            if _matches(response, SYNC_ERRORS):
+                self.emcli.sync()
+            attempt += 1
+
+    def login(self):
+        return self.call(self.emcli.login)
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+""" Parse-once, process-wide view of the ldap_target_ctl config file.
+"""
+
+import os
+import re
+import ast
+import threading
+import collections
+import ConfigParser
+
+CONFIG_FILE_NAME = 'ldap_target_ctl.conf'
+
+# Name of the OMS defined by the [oem] section
+DEFAULT_OMS = 'default'
+# Sections defining further OMS installations, [oem:<name>]
+OMS_SECTION = re.compile(r'^oem:(\S+)$')
+
+_lock = threading.Lock()
+_cache = {'settings': None}
+
+
+def find_config_file():
+    """ Searches for a config file.  Search order is:  Current working
+        directory -> User Home as .ldap_target_ctl.conf
+        -> /etc/ldap_target_ctl -> the module directory (defaults)
+
+        Inputs:
+            None
+
+        Returns:
+            config_file - String, path to the config file or None if no
+                          acceptable file was found.
+    """
+
+    candidates = [os.path.join(os.getcwd(), CONFIG_FILE_NAME),
+                  os.path.join(os.path.expanduser('~'),
+                               '.{}'.format(CONFIG_FILE_NAME)),
+                  os.path.join('/etc/ldap_target_ctl', CONFIG_FILE_NAME),
+                  os.path.join(os.path.dirname(__file__), CONFIG_FILE_NAME)]
+    for config_file in candidates:
+        if os.path.isfile(config_file):
+            return config_file
+    return None
+
+
+class OMS(object):
+    """ One OMS installation.
+
+        Attributes:
+            name - String, DEFAULT_OMS for [oem], otherwise <name> of its
+                   [oem:<name>] section
+            url - String, the OEM url
+            emcli - String, emcli command line for this OMS (defaults to
+                    [oem] emcli)
+            state_file - String, emcli login and sync state file (defaults
+                         to [oem] state_file; entries are kept per user
+                         and url)
+            jobs - int, most targets provisioned at once through this OMS,
+                   or None for the run's --jobs
+            pods - tuple of pod names served by this OMS (empty for the
+                   default OMS, which serves every other pod)
+    """
+
+    __slots__ = ('name', 'url', 'emcli', 'state_file', 'jobs', 'pods')
+
+    def __init__(self, name, url, emcli, state_file, jobs=None, pods=()):
+        self.name = name
+        self.url = url
+        self.emcli = emcli
+        self.state_file = state_file
+        self.jobs = jobs
+        self.pods = tuple(pods)
+
+    def __repr__(self):
+        return 'OMS({!r}, {!r})'.format(self.name, self.url)
+
+
+class Settings(object):
+    """ Typed configuration.  The beacons and entities blobs are evaluated
+        once when the file is loaded instead of on every lookup.
+
+        Attributes:
+            path - String, the config file this was loaded from
+            mtime - float, modification time of path when it was loaded
+            parser - ConfigParser object, for sections without a typed view
+            url - String, the OEM url
+            emcli - String, emcli command line ([oem] emcli, default emcli)
+            beacons - dict, pod name -> tuple of beacon names
+            entities - dict, int entity number -> business unit name
+            inventory - String, inventory database ([inventory] path,
+                        relative to the config file), or None when the
+                        option is left empty
+            state_file - String, where emcli login and sync state is kept
+                         between runs ([oem] state_file, relative to the
+                         config file), or None when the option is left
+                         empty
+            oms - OrderedDict, OMS name -> OMS object; the [oem] section
+                  first, then any [oem:<name>] sections
+            pod_oms - dict, pod name -> OMS name for the pods an
+                      [oem:<name>] section lists
+    """
+
+    __slots__ = ('path', 'mtime', 'parser', 'url', 'emcli', 'beacons',
+                 'entities', 'inventory', 'state_file', 'oms', 'pod_oms')
+
+    def __init__(self, path, mtime, parser):
+        self.path = path
+        self.mtime = mtime
+        self.parser = parser
+        self.url = parser.get('oem', 'url')
+        self.emcli = (parser.get('oem', 'emcli')
+                      if parser.has_option('oem', 'emcli') else 'emcli')
+        beacons = ast.literal_eval(parser.get('otes', 'beacons'))
+        self.beacons = dict((pod, tuple(names))
+                            for pod, names in beacons.items())
+        entities = ast.literal_eval(parser.get('otes', 'entities'))
+        self.entities = dict((int(number), name)
+                             for number, name in entities.items())
+        self.inventory = self._file(parser, 'inventory', 'path')
+        self.state_file = self._file(parser, 'oem', 'state_file')
+        self.oms = collections.OrderedDict()
+        self.oms[DEFAULT_OMS] = OMS(DEFAULT_OMS, self.url, self.emcli,
+                                    self.state_file)
+        self.pod_oms = {}
+        for section in parser.sections():
+            match = OMS_SECTION.match(section)
+            if match is None:
+                continue
+            name = match.group(1)
+            pods = (parser.get(section, 'pods')
+                    if parser.has_option(section, 'pods') else '')
+            pods = [pod for pod in re.split(r'[\s,]+', pods) if pod]
+            for pod in pods:
+                if pod in self.pod_oms:
+                    raise ValueError('pod {} is mapped to OMS {} and '
+                                     '{}'.format(pod, self.pod_oms[pod],
+                                                 name))
+                self.pod_oms[pod] = name
+            self.oms[name] = OMS(
+                name, parser.get(section, 'url'),
+                (parser.get(section, 'emcli')
+                 if parser.has_option(section, 'emcli') else self.emcli),
+                (self._file(parser, section, 'state_file')
+                 if parser.has_option(section, 'state_file')
+                 else self.state_file),
+                (parser.getint(section, 'jobs')
+                 if parser.has_option(section, 'jobs') else None),
+                pods)
+
+    def oms_for_pod(self, pod):
+        """ Returns the OMS object provisioning pod's targets. """
+
+        return self.oms[self.pod_oms.get(pod, DEFAULT_OMS)]
+
+    def _file(self, parser, section, option):
+        """ Resolves a file option against the config file's directory;
+            a missing or empty value is None.
+        """
+
+        value = (parser.get(section, option)
+                 if parser.has_option(section, option) else '')
+        if not value.strip():
+            return None
+        return os.path.join(os.path.dirname(self.path),
+                            os.path.expanduser(value.strip()))
+
+
+def load_settings(config_file):
+    """ Reads and parses config_file without touching the cache.
+
+        Inputs:
+            config_file - String, path to the config file
+
+        Returns:
+            Settings object
+    """
+
+    mtime = os.stat(config_file).st_mtime
+    parser = ConfigParser.ConfigParser()
+    parser.read(config_file)
+    return Settings(config_file, mtime, parser)
+
+
+def get_settings():
+    """ Returns the shared Settings object, loading it on first use.  The
+        cached copy is reused until its file's mtime changes (or the file
+        disappears, in which case the search is run again).
+
+        Inputs:
+            None
+
+        Returns:
+            Settings object, or None if no config file could be found.
+    """
+
+    settings = _cache['settings']
+    if settings is not None:
+        try:
+            if os.stat(settings.path).st_mtime == settings.mtime:
+                return settings
+        except OSError:
+            pass
+
+    with _lock:
+        settings = _cache['settings']
+        if settings is not None:
+            try:
+                if os.stat(settings.path).st_mtime == settings.mtime:
+                    return settings
+            except OSError:
+                settings = None
+        config_file = settings.path if settings else find_config_file()
+        if config_file is None:
+            return None
+        settings = load_settings(config_file)
+        _cache['settings'] = settings
+        return settings
+
+
+def clear_settings():
+    """ Drops the cached Settings so the next get_settings() call searches
+        for and reads the config file again.
+    """
+
+    with _lock:
+        _cache['settings'] = None
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+""" Run-scoped spool directory for rendered XML templates.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+# Preferred parent for the spool directory: memory backed on Linux
+SPOOL_BASES = ('/dev/shm',)
+
+
+def default_spool_base():
+    """ Returns the first writable tmpfs style directory in SPOOL_BASES, or
+        None to let tempfile pick its usual location.
+    """
+
+    for base in SPOOL_BASES:
+        if os.path.isdir(base) and os.access(base, os.W_OK | os.X_OK):
+            return base
+    return None
+
+
+class TemplateSpool(object):
+    """ Holds every template rendered during a run in one private directory.
+        Each worker thread gets one slot file that stays open for the whole
+        run and is rewritten in place for every target it handles, so a
+        run creates one file per worker instead of one per target.  Use as
+        a context manager (or call close()) to remove the directory.
+
+        emcli's create_service reads the template from a file, so the
+        emcli backends always go through a slot file.  Only the in-process
+        fake backend takes the content itself, which it says with an
+        inline_templates attribute of True.
+    """
+
+    def __init__(self, base=None):
+        self.path = tempfile.mkdtemp(prefix='ldap_target_ctl.',
+                                     dir=base or default_spool_base())
+        self._local = threading.local()
+        self._slots = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _slot(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            with self._lock:
+                path = os.path.join(self.path,
+                                    'template{}.xml'.format(len(self._slots)))
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0600)
+                slot = (fd, path)
+                self._slots.append(slot)
+            self._local.slot = slot
+        return slot
+
+    def write(self, xmlstr):
+        """ Writes xmlstr to the calling thread's slot file.
+
+            Returns:
+                String, path of the slot file.  Valid until the same thread
+                writes its next template.
+        """
+
+        fd, path = self._slot()
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        view = buffer(xmlstr)
+        while view:
+            view = view[os.write(fd, view):]
+        return path
+
+    def stage(self, xmlstr, emcli=None):
+        """ Returns what to pass as create_generic_service's template
+            argument: the content itself for a backend with
+            inline_templates, otherwise the path of a slot file holding it.
+        """
+
+        if getattr(emcli, 'inline_templates', False):
+            return xmlstr
+        return self.write(xmlstr)
+
+    def close(self):
+        """ Closes every slot file and removes the spool directory. """
+
+        with self._lock:
+            for fd, path in self._slots:
+                os.close(fd)
+            del self._slots[:]
+        self._local = threading.local()
+        shutil.rmtree(self.path, ignore_errors=True)
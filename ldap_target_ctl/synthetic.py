@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+""" Local run of the LDAP_test transaction the OEM beacons collect, so a
+    host's ldap_response metrics can be seen, and checked against the
+    template's thresholds, before it is provisioned.  Tests run on the
+    probe module's event loop, many hosts at once.
+
+    OEM doesn't document which searches its addressing and messaging
+    metrics time.  Here AddressingSearch is a subtree search under
+    ldap_base for the entry whose ldap_attrname is ldap_attrvalue, and
+    MessagingSearch a read of the root DSE, as directory clients do on
+    connecting.
+"""
+
+import operator
+import timeit
+
+from . import ber
+from . import probe
+
+# ldap_response metric columns, in the order they are reported
+COLUMNS = ('ConnectionTime', 'BaseSearch', 'AddressingSearch',
+           'MessagingSearch', 'CompareOp', 'status')
+
+# LDAP_test property defaults (see make_xml_template)
+DEFAULT_ATTRIBUTE_NAME = 'uid'
+DEFAULT_TIMEOUT = 60.0
+
+WARNING = 'warning'
+CRITICAL = 'critical'
+
+# OEM threshold operator codes
+OPERATORS = {'0': operator.gt,
+             '1': operator.eq,
+             '2': operator.lt,
+             '3': operator.le,
+             '4': operator.ge,
+             '6': operator.ne}
+OPERATOR_SYMBOLS = {'0': '>', '1': '=', '2': '<', '3': '<=', '4': '>=',
+                    '6': '!='}
+
+
+class LDAPTest(probe.Conversation):
+    """ The LDAP_test transaction against one host: connect and bind as
+        ldap_user, base search of ldap_base with ldap_filter, the
+        addressing and messaging searches, then a compare of
+        ldap_attrname against ldap_attrvalue on ldap_base.
+
+        Attributes:
+            metrics - dict, ldap_response column -> milliseconds for each
+                      operation that completed, and status (1 if every
+                      operation succeeded, otherwise 0)
+    """
+
+    def __init__(self, host, port, ldap_user, ldap_password, ldap_base,
+                 ldap_filter, ldap_attrvalue,
+                 ldap_attrname=DEFAULT_ATTRIBUTE_NAME,
+                 timeout=DEFAULT_TIMEOUT, clock=timeit.default_timer):
+        probe.Conversation.__init__(self, host, port, timeout)
+        self.ldap_user = ldap_user
+        self.ldap_password = ldap_password
+        self.ldap_base = ldap_base
+        self.ldap_filter = ldap_filter
+        self.ldap_attrname = ldap_attrname
+        self.ldap_attrvalue = ldap_attrvalue
+        self.metrics = {'status': 0}
+        self._clock = clock
+
+    def _failed(self, code, diagnostic):
+        self.error = '{} failed with LDAP result code {}{}'.format(
+            self.step, code, ': {}'.format(diagnostic) if diagnostic else '')
+
+    def searches(self):
+        """ Returns the (column, base, scope, filter) searches to time. """
+
+        return (('BaseSearch', self.ldap_base, ber.SCOPE_BASE,
+                 self.ldap_filter),
+                ('AddressingSearch', self.ldap_base, ber.SCOPE_SUBTREE,
+                 '({}={})'.format(self.ldap_attrname,
+                                  ber.escape_filter_value(
+                                      self.ldap_attrvalue))),
+                ('MessagingSearch', '', ber.SCOPE_BASE, '(objectClass=*)'))
+
+    def steps(self):
+        self.step = 'bind'
+        started = self._clock()
+        yield probe.SEND, ber.bind_request(1, self.ldap_user,
+                                           self.ldap_password)
+        response = yield probe.RECEIVE,
+        _, operation, value = ber.parse_message(response)
+        if operation != ber.BIND_RESPONSE:
+            self.error = 'bind: unexpected response'
+            return
+        code, diagnostic = ber.parse_result(value)
+        if code != ber.SUCCESS:
+            self._failed(code, diagnostic)
+            return
+        self.metrics['ConnectionTime'] = 1000 * (
+            self.timings['connect'] + self._clock() - started)
+
+        message_id = 1
+        for column, base, scope, search_filter in self.searches():
+            self.step = column
+            message_id += 1
+            started = self._clock()
+            yield probe.SEND, ber.search_request(message_id, base, scope,
+                                                 search_filter, ['1.1'])
+            while True:
+                response = yield probe.RECEIVE,
+                _, operation, value = ber.parse_message(response)
+                if operation not in (ber.SEARCH_RESULT_ENTRY,
+                                     ber.SEARCH_RESULT_REFERENCE):
+                    break
+            if operation != ber.SEARCH_RESULT_DONE:
+                self.error = '{}: unexpected response'.format(column)
+                return
+            code, diagnostic = ber.parse_result(value)
+            if code != ber.SUCCESS:
+                self._failed(code, diagnostic)
+                return
+            self.metrics[column] = 1000 * (self._clock() - started)
+
+        self.step = 'CompareOp'
+        started = self._clock()
+        yield probe.SEND, ber.compare_request(message_id + 1, self.ldap_base,
+                                              self.ldap_attrname,
+                                              self.ldap_attrvalue)
+        response = yield probe.RECEIVE,
+        _, operation, value = ber.parse_message(response)
+        if operation != ber.COMPARE_RESPONSE:
+            self.error = 'CompareOp: unexpected response'
+            return
+        code, diagnostic = ber.parse_result(value)
+        if code == ber.COMPARE_FALSE:
+            self.error = 'CompareOp: {} of {} is not {}'.format(
+                self.ldap_attrname, self.ldap_base, self.ldap_attrvalue)
+            return
+        if code != ber.COMPARE_TRUE:
+            self._failed(code, diagnostic)
+            return
+        self.metrics['CompareOp'] = 1000 * (self._clock() - started)
+        self.metrics['status'] = 1
+        yield probe.SEND, ber.unbind_request(message_id + 2)
+
+
+def template_thresholds(root):
+    """ Reads the ldap_response thresholds out of a transaction template.
+
+        Inputs:
+            root - xml.etree.ElementTree.Element, as make_xml_template
+                   returns
+
+        Returns:
+            dict, metric column -> mgmt_bcn_threshold attributes
+    """
+
+    thresholds = {}
+    for threshold in root.iter('mgmt_bcn_threshold'):
+        key = threshold.find('mgmt_bcn_threshold_key')
+        if key is not None:
+            thresholds[key.get('metric_column')] = dict(threshold.attrib)
+    return thresholds
+
+
+def evaluate(metrics, thresholds):
+    """ Finds the thresholds metrics cross.  Columns without a value (the
+        test failed before reaching them) are left out; a failed test
+        still crosses the status threshold.
+
+        Inputs:
+            metrics - dict, column -> value, as LDAPTest.metrics
+            thresholds - dict, as template_thresholds() returns
+
+        Returns:
+            List of (column, severity, value, operator symbol, threshold)
+            in COLUMNS order, critical rather than warning when both are
+            crossed
+    """
+
+    alerts = []
+    for column in COLUMNS:
+        value = metrics.get(column)
+        threshold = thresholds.get(column)
+        if value is None or threshold is None:
+            continue
+        for severity in (CRITICAL, WARNING):
+            code = threshold.get('{}_operator'.format(severity))
+            limit = threshold.get('{}_threshold'.format(severity))
+            if code not in OPERATORS or limit is None:
+                continue
+            if OPERATORS[code](value, float(limit)):
+                alerts.append((column, severity, value,
+                               OPERATOR_SYMBOLS[code], float(limit)))
+                break
+    return alerts
+
+
+def check_hosts(targets, ldap_user, ldap_password, ldap_attrvalue,
+                ldap_attrname=DEFAULT_ATTRIBUTE_NAME,
+                timeout=DEFAULT_TIMEOUT,
+                concurrency=probe.DEFAULT_CONCURRENCY):
+    """ Runs the LDAP_test transaction against every target once.
+
+        Inputs:
+            targets - iterable of (host, port, ldap_base, ldap_filter)
+            ldap_user - String, DN to bind as
+            ldap_password - String, ldap_user's password
+            ldap_attrvalue - String, value ldap_attrname is compared to
+            ldap_attrname - String, attribute searched for and compared
+            timeout - float, seconds each host's transaction may take
+            concurrency - int, most hosts tested at once
+
+        Returns:
+            List of LDAPTest objects, in target order (duplicates tested
+            once)
+    """
+
+    tests = []
+    seen = set()
+    for host, port, ldap_base, ldap_filter in targets:
+        key = (host, str(port), ldap_base, ldap_filter)
+        if key in seen:
+            continue
+        seen.add(key)
+        tests.append(LDAPTest(host, port, ldap_user, ldap_password,
+                              ldap_base, ldap_filter, ldap_attrvalue,
+                              ldap_attrname, timeout))
+    probe.run(tests, concurrency)
+    return tests
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+""" Adaptive concurrency for batch runs.  Every emcli call is timed; the
+    number of targets in flight grows by one per round of healthy calls
+    (additive increase) and is halved when a verb slows down well past its
+    recent best latency or fails transiently (multiplicative decrease),
+    within a hard ceiling and an optional per-pod cap.
+"""
+
+import time
+import threading
+import contextlib
+
+from . import retry
+
+
+class VerbStats(object):
+    """ Latency and error counts for one emcli verb.
+
+        Attributes:
+            calls, errors - int
+            total - float, seconds spent in the verb
+            smoothed - float, exponentially weighted latency
+            best - float, baseline latency: drops to smoothed whenever
+                   smoothed is lower and otherwise drifts up towards it at
+                   BEST_DRIFT, so a single fast early call doesn't leave
+                   steady latency looking congested for good
+    """
+
+    __slots__ = ('calls', 'errors', 'total', 'smoothed', 'best')
+
+    ALPHA = 0.2
+    BEST_DRIFT = 0.05
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.smoothed = None
+        self.best = None
+
+    def add(self, seconds, ok):
+        self.calls += 1
+        self.total += seconds
+        if not ok:
+            self.errors += 1
+            return
+        if self.smoothed is None:
+            self.smoothed = seconds
+        else:
+            self.smoothed += self.ALPHA * (seconds - self.smoothed)
+        if self.best is None or self.smoothed < self.best:
+            self.best = self.smoothed
+        else:
+            self.best += self.BEST_DRIFT * (self.smoothed - self.best)
+
+
+class AdaptiveLimiter(object):
+    """ AIMD limit on the number of targets in flight.
+
+        Inputs:
+            initial - int, starting limit
+            ceiling - int, the limit never grows past this
+            pod_cap - int or None, most targets in flight per pod
+            adaptive - bool, False keeps the limit fixed at initial
+            tolerance - float, a verb is congested when its smoothed
+                        latency exceeds tolerance times its best
+            cooldown - float, seconds between two decreases, so one burst
+                       of slow calls only halves the limit once
+    """
+
+    def __init__(self, initial=1, ceiling=16, pod_cap=None, adaptive=True,
+                 tolerance=2.0, cooldown=5.0, clock=time.time):
+        self.ceiling = max(1, ceiling)
+        self.limit = float(min(max(1, initial), self.ceiling))
+        self.pod_cap = pod_cap
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.cooldown = cooldown
+        self.low = self.high = int(self.limit)
+        self.verbs = {}
+        self.in_flight = 0
+        self.pods = {}
+        self._clock = clock
+        self._decreased = None
+        self._ready = threading.Condition()
+
+    def _admits(self, pod):
+        if self.in_flight >= int(self.limit):
+            return False
+        return self.pod_cap is None or \
+            self.pods.get(pod, 0) < self.pod_cap
+
+    def acquire(self, pod=None):
+        """ Blocks until a target of pod may start. """
+
+        with self._ready:
+            while not self._admits(pod):
+                self._ready.wait(1)
+            self.in_flight += 1
+            self.pods[pod] = self.pods.get(pod, 0) + 1
+
+    def release(self, pod=None):
+        with self._ready:
+            self.in_flight -= 1
+            self.pods[pod] -= 1
+            self._ready.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, pod=None):
+        """ Holds one in-flight slot for pod for the with block. """
+
+        self.acquire(pod)
+        try:
+            yield
+        finally:
+            self.release(pod)
+
+    def observe(self, verb, seconds, kind=None):
+        """ Feeds one emcli call's latency and outcome to the limit.
+
+            Inputs:
+                verb - String, emcli verb or method name
+                seconds - float, how long the call took
+                kind - None for success, else retry.TRANSIENT or
+                       retry.PERMANENT
+        """
+
+        with self._ready:
+            stats = self.verbs.setdefault(verb, VerbStats())
+            stats.add(seconds, kind is None)
+            if not self.adaptive or kind == retry.PERMANENT:
+                return
+            congested = kind == retry.TRANSIENT or \
+                stats.smoothed > stats.best * self.tolerance
+            if congested:
+                now = self._clock()
+                if self._decreased is None or \
+                        now - self._decreased >= self.cooldown:
+                    self._decreased = now
+                    self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.ceiling),
+                                 self.limit + 1.0 / self.limit)
+            self.low = min(self.low, int(self.limit))
+            self.high = max(self.high, int(self.limit))
+            self._ready.notify_all()
+
+    def summary(self):
+        """ Returns a one line description of how the limit moved. """
+
+        return ('Concurrency limit {} (ranged {}-{}, ceiling {})'.format(
+            int(self.limit), self.low, self.high, self.ceiling))
+
+
+class MeteredEmcli(object):
+    """ Wraps an emclpy.Emclpy compatible client and reports the latency
+        and outcome of every (code, out, err) returning call to each
+        observer's observe(verb, seconds, kind).  Every other attribute is
+        passed through.
+    """
+
+    def __init__(self, emcli, *observers, **kwargs):
+        self.emcli = emcli
+        self.observers = observers
+        self._clock = kwargs.get('clock', time.time)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.emcli, name)
+        if name not in retry.RETRIED_METHODS:
+            return attribute
+
+        def call(*args, **kwargs):
+            verb = args[0] if name == 'run' and args else name
+            start = self._clock()
+            response = attribute(*args, **kwargs)
+            seconds = self._clock() - start
+            kind = retry.classify(*response)
+            for observer in self.observers:
+                observer.observe(verb, seconds, kind)
+            return response
+        return call
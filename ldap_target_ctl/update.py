@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+""" Content hashes of rendered templates, used by update runs to push new
+    test definitions only to the targets whose deployed hash differs.
+
+    The hash is stored on each target in a target property of its own
+    (HASH_PROPERTY by default), set when the target is created and again
+    by every update.  The LDAP password never goes into it directly:
+    templates are hashed with the password replaced by a PBKDF2 digest of
+    it, salted with the OMS url, so a stored hash can't be used to guess
+    the password, yet still changes whenever the password does.
+"""
+
+import hashlib
+
+# Target property holding the hash
+HASH_PROPERTY = 'ldap_target_ctl_hash'
+# Prefix of the hashes this tool stores, so any other property value
+# simply reads as "differs"
+HASH_PREFIX = 'ltc-sha256:'
+PBKDF2_SALT = 'ldap_target_ctl template hash'
+PBKDF2_ROUNDS = 100000
+
+
+def password_digest(password, oms_url):
+    """ Returns the hex PBKDF2-SHA256 digest that stands in for password in
+        hashed templates.  The salt includes the OMS url, so the same
+        password gives different digests on different installs.  Computed
+        once per run and OMS.
+    """
+
+    if isinstance(password, unicode):
+        password = password.encode('utf-8')
+    salt = '{}@{}'.format(PBKDF2_SALT, oms_url)
+    if isinstance(salt, unicode):
+        salt = salt.encode('utf-8')
+    return hashlib.pbkdf2_hmac('sha256', password, salt,
+                               PBKDF2_ROUNDS).encode('hex')
+
+
+def template_hash(xmlstr):
+    """ Returns the value stored in the hash property for a template
+        rendered with password_digest() in place of the password.
+    """
+
+    return '{}{}'.format(HASH_PREFIX, hashlib.sha256(xmlstr).hexdigest())
+
+
+def define_hash_property(emcli, hash_property=HASH_PROPERTY,
+                         target_type='generic_service'):
+    """ Adds hash_property to the user-defined properties of target_type,
+        which OEM needs before a target can hold a value for it.
+
+        Returns:
+            (code, out, err) from add_target_property; a property that
+            already exists counts as success.
+    """
+
+    code, out, err = emcli.run('add_target_property',
+                               target_type=target_type,
+                               property=hash_property)
+    if code > 0 and 'already exists' in '{}\n{}'.format(out, err).lower():
+        return 0, out, ''
+    return code, out, err
+
+
+def differs(snapshot, name, desired, hash_property):
+    """ Checks a target's deployed hash against the desired one.
+
+        Returns:
+            True if the target exists and its hash_property isn't desired,
+            False if it matches, None if the target doesn't exist.
+    """
+
+    properties = snapshot.targets.get(name)
+    if properties is None:
+        return None
+    return properties.get(hash_property) != desired
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+clock
+----------------------------------
+
+Fake clock for tests of code that takes a clock (and sleep) callable.
+"""
+
+
+class FakeClock(object):
+    """ Clock standing still until it is moved on or slept on. """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
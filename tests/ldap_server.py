@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+""" Stand-in LDAP server for the probe and synthetic check tests.  Answers
+    simple binds on a local port; a bind whose password doesn't match is
+    refused with invalidCredentials.  Searches and compares are answered
+    from a dict of entries (equality, presence, substring and boolean
+    filters only).  Set delay to answer slowly.
+"""
+
+import time
+import fnmatch
+import threading
+import SocketServer
+
+from ldap_target_ctl import ber
+
+
+class Handler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        data = ''
+        while True:
+            length = ber.message_length(data)
+            if length is None:
+                chunk = self.request.recv(65536)
+                if not chunk:
+                    return
+                data += chunk
+                continue
+            message, data = data[:length], data[length:]
+            message_id, operation, value = ber.parse_message(message)
+            if operation == ber.UNBIND_REQUEST:
+                return
+            response = self.server.respond(message_id, operation, value)
+            if response is None:
+                return
+            time.sleep(self.server.delay)
+            self.request.sendall(response)
+
+
+def result(message_id, tag, code, diagnostic=''):
+    return ber.message(message_id, ber.sequence(
+        ber.integer(code, ber.ENUMERATED), ber.octet_string(''),
+        ber.octet_string(diagnostic), tag=tag))
+
+
+def matches(entry, search_filter):
+    """ Whether entry (attribute -> values) matches a BER search filter. """
+
+    tag, value, _ = ber.read_tlv(search_filter)
+    values = dict((name.lower(), [item.lower() for item in items])
+                  for name, items in entry.items())
+    if tag == ber.FILTER_PRESENT:
+        return value.lower() in values
+    if tag in (ber.FILTER_AND, ber.FILTER_OR):
+        children = [ber.tlv(child_tag, child) for child_tag, child
+                    in ber.elements(value)]
+        test = all if tag == ber.FILTER_AND else any
+        return test(matches(entry, child) for child in children)
+    if tag == ber.FILTER_NOT:
+        return not matches(entry, value)
+    items = ber.elements(value)
+    attribute = items[0][1].lower()
+    if tag == ber.FILTER_EQUALITY:
+        return items[1][1].lower() in values.get(attribute, [])
+    if tag == ber.FILTER_SUBSTRINGS:
+        pattern = ''
+        for piece_tag, piece in ber.elements(items[1][1]):
+            if piece_tag != ber.SUBSTRING_INITIAL:
+                pattern += '*'
+            pattern += piece.lower()
+        if ber.elements(items[1][1])[-1][0] != ber.SUBSTRING_FINAL:
+            pattern += '*'
+        return any(fnmatch.fnmatchcase(item, pattern)
+                   for item in values.get(attribute, []))
+    return False
+
+
+class LDAPServer(SocketServer.ThreadingTCPServer):
+    """ Listens on 127.0.0.1 (port picked by the OS) until stop().
+
+        Attributes:
+            port - int, the listening port
+            credentials - dict, bind DN -> password
+            entries - dict, DN -> {attribute: [values]}
+            delay - float, seconds to wait before each response
+            searches - int, searches answered
+            compares - int, compares answered
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, credentials=None, delay=0.0, entries=None):
+        SocketServer.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 Handler)
+        self.port = self.server_address[1]
+        self.credentials = credentials or {}
+        self.delay = delay
+        self.entries = entries or {}
+        self.binds = 0
+        self.searches = 0
+        self.compares = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def in_scope(self, dn, base, scope):
+        if scope == ber.SCOPE_BASE:
+            return dn == base
+        parent = dn.partition(',')[2]
+        if scope == ber.SCOPE_ONE:
+            return parent == base
+        return dn == base or dn.endswith(',' + base)
+
+    def search(self, message_id, value):
+        self.count('searches')
+        items = ber.elements(value)
+        base = items[0][1]
+        scope = ber.decode_integer(items[1][1])
+        search_filter = ber.tlv(*items[6])
+        if base == '' and scope == ber.SCOPE_BASE:
+            # The root DSE
+            entries = {'': {'objectClass': ['top'],
+                            'namingContexts': ['dc=example,dc=com']}}
+        elif base not in self.entries:
+            return result(message_id, ber.SEARCH_RESULT_DONE,
+                          ber.NO_SUCH_OBJECT, 'No such object')
+        else:
+            entries = self.entries
+        responses = [ber.message(message_id, ber.sequence(
+            ber.octet_string(dn), ber.sequence(),
+            tag=ber.SEARCH_RESULT_ENTRY))
+            for dn, entry in sorted(entries.items())
+            if self.in_scope(dn, base, scope) and matches(entry,
+                                                          search_filter)]
+        responses.append(result(message_id, ber.SEARCH_RESULT_DONE,
+                                ber.SUCCESS))
+        return ''.join(responses)
+
+    def compare(self, message_id, value):
+        self.count('compares')
+        items = ber.elements(value)
+        dn = items[0][1]
+        attribute, assertion = [item for _, item
+                                in ber.elements(items[1][1])]
+        if dn not in self.entries:
+            return result(message_id, ber.COMPARE_RESPONSE,
+                          ber.NO_SUCH_OBJECT, 'No such object')
+        code = (ber.COMPARE_TRUE
+                if matches(self.entries[dn], ber.sequence(
+                    ber.octet_string(attribute), ber.octet_string(assertion),
+                    tag=ber.FILTER_EQUALITY))
+                else ber.COMPARE_FALSE)
+        return result(message_id, ber.COMPARE_RESPONSE, code)
+
+    def respond(self, message_id, operation, value):
+        if operation == ber.BIND_REQUEST:
+            self.count('binds')
+            items = ber.elements(value)
+            dn, password = items[1][1], items[2][1]
+            code = (ber.SUCCESS if self.credentials.get(dn) == password
+                    else ber.INVALID_CREDENTIALS)
+            return result(message_id, ber.BIND_RESPONSE, code,
+                          '' if code == ber.SUCCESS
+                          else 'Invalid credentials')
+        if operation == ber.SEARCH_REQUEST:
+            return self.search(message_id, value)
+        if operation == ber.COMPARE_REQUEST:
+            return self.compare(message_id, value)
+        return None
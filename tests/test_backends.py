@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_backends
+----------------------------------
+
+Tests for `ldap_target_ctl.backends` module.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from ldap_target_ctl import backends
+
+# Minimal script-mode emcli: runs the driver with verbs that echo their
+# arguments, and fails the 'fail' verb.
+STAND_IN = """
+import sys
+
+
+class Response(object):
+    def __init__(self, out):
+        self._out = out
+
+    def out(self):
+        return self._out
+
+    def error(self):
+        return ''
+
+    def exit_code(self):
+        return 0
+
+
+class VerbExecutionError(Exception):
+    def exit_code(self):
+        return 3
+
+    def error(self):
+        return 'verb failed'
+
+
+def echo(*args, **options):
+    return Response(repr((args, sorted(options.items()))))
+
+
+def fail(**options):
+    raise VerbExecutionError()
+
+
+namespace = {'__name__': '__main__', 'fail': fail}
+for name in ('login', 'logout', 'set_client_property', 'echo',
+             'create_group'):
+    namespace[name] = echo
+sys.stdout.write('emcli banner\\n')
+execfile(sys.argv[1][1:], namespace)
+"""
+
+# Command line emcli: records its arguments, one call per line
+SPAWN_STAND_IN = """
+import sys
+with open(sys.argv[1], 'a') as calls:
+    calls.write(repr(sys.argv[2:]) + '\\n')
+sys.stdout.write('ok')
+"""
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        stand_in = os.path.join(self.tmpdir, 'emcli.py')
+        with open(stand_in, 'w') as script:
+            script.write(STAND_IN)
+        self.emcli = '{} {}'.format(sys.executable, stand_in)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_verb_arguments(self):
+        self.assertEqual(backends.verb_arguments('get_groups',
+                                                 {'noheader': True,
+                                                  'script': None,
+                                                  'name': 'OID'}),
+                         ['get_groups', '-name=OID', '-noheader'])
+        self.assertEqual(backends.verb_arguments('list',
+                                                 {'search': ["A='1'",
+                                                             "B='2'"]}),
+                         ['list', "-search=A='1'", "-search=B='2'"])
+
+    def test_session_round_trip(self):
+        session = backends.EmcliSession('https://localhost:7799/em',
+                                        'sysman', 'welcome1', self.emcli)
+        code, out, err = session.login()
+        self.assertEqual(code, 0)
+        code, out, err = session.run('echo', 'x', name='multi\nline')
+        self.assertEqual((code, err), (0, ''))
+        self.assertEqual(out, repr((('x',), [('name', 'multi\nline')])))
+        self.assertEqual(session.run('fail'), (3, '', 'verb failed'))
+        self.assertEqual(session.create_group('OID')[0], 0)
+        session.logout()
+
+    def test_session_restarts_after_exit(self):
+        session = backends.EmcliSession('https://localhost:7799/em',
+                                        'sysman', 'welcome1', self.emcli)
+        session.login()
+        session.close()
+        self.assertEqual(session.run('echo')[0], 0)
+        session.logout()
+
+    def test_pool_limits_sessions(self):
+        pool = backends.make_emcli('session', 'https://localhost:7799/em',
+                                   'sysman', 'welcome1', self.emcli,
+                                   sessions=2)
+        pool.login()
+        for _ in range(4):
+            self.assertEqual(pool.run('echo')[0], 0)
+        self.assertTrue(1 <= len(pool.sessions) <= 2)
+        pool.logout()
+
+    @unittest.skipIf(backends.emclpy is None, 'needs the emclpy package')
+    def test_spawn_uses_configured_emcli(self):
+        stand_in = os.path.join(self.tmpdir, 'spawn.py')
+        with open(stand_in, 'w') as script:
+            script.write(SPAWN_STAND_IN)
+        log = os.path.join(self.tmpdir, 'calls.log')
+        emcli = backends.make_emcli('spawn', 'https://localhost:7799/em',
+                                    'sysman', 'welcome1', '{} {} {}'.format(
+                                        sys.executable, stand_in, log))
+        # emclpy's own verbs are left to emclpy
+        for verb in ('login', 'sync', 'create_generic_service',
+                     'set_target_property_value', 'add_to_group'):
+            self.assertEqual(getattr(backends.SpawnEmcli, verb).im_func,
+                             getattr(backends.emclpy.Emclpy, verb).im_func)
+        self.assertEqual(emcli.run('modify_group', name='OID',
+                                   add_targets='ldap1_ldap:generic_service'),
+                         (0, 'ok', ''))
+        with open(log) as calls:
+            self.assertEqual([eval(line) for line in calls],
+                             [['modify_group',
+                               '-add_targets=ldap1_ldap:generic_service',
+                               '-name=OID']])
+        self.assertEqual(backends.make_emcli(
+            'spawn', 'https://localhost:7799/em', 'sysman', 'welcome1',
+            '/nonexistent/emcli').run('status')[0], 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_batch
+----------------------------------
+
+Tests for `ldap_target_ctl.batch` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ldap_target_ctl import batch
+
+
+class TestReadBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as batch_file:
+            batch_file.write(content)
+        return path
+
+    def test_colon_format(self):
+        path = self.write('ldap_batch.txt',
+                          '# comment\nfake_ldap1:3060:POD-E\n\n'
+                          '[fe80::1]:389:POD-A\n2001:db8::5:636:POD-B\n')
+        rows = list(batch.read_batch(path))
+        self.assertEqual([(row.ldap_host, row.ldap_port, row.pod, row.line)
+                          for row in rows],
+                         [('fake_ldap1', '3060', 'POD-E', 2),
+                          ('fe80::1', '389', 'POD-A', 4),
+                          ('2001:db8::5', '636', 'POD-B', 5)])
+        self.assertEqual(rows[0].group, None)
+        self.assertRaises(AttributeError, setattr, rows[0], 'extra', 1)
+
+    def test_csv_overrides(self):
+        path = self.write('ldap_batch.csv',
+                          'ldap_host,ldap_port,pod,lifecycle,group\n'
+                          'fake_ldap1,3060,POD-E,,\n'
+                          'fake_ldap2,3060,POD-E,test,"OID,Test"\n')
+        rows = list(batch.read_batch(path))
+        self.assertEqual(rows[0].lifecycle, None)
+        self.assertEqual((rows[1].lifecycle, rows[1].group),
+                         ('test', 'OID,Test'))
+
+    def test_jsonl_and_errors(self):
+        path = self.write('ldap_batch.jsonl',
+                          '{"ldap_host": "fake_ldap1", "ldap_port": 3060, '
+                          '"pod": "POD-E", "entity_number": 11}\n'
+                          '{"ldap_host": "fake_ldap2"}\n'
+                          'not json\n')
+        errors = []
+        rows = list(batch.read_batch(path, errors=errors))
+        self.assertEqual((rows[0].ldap_port, rows[0].entity_number),
+                         ('3060', '11'))
+        self.assertEqual([error.line for error in errors], [2, 3])
+        self.assertRaises(batch.BatchFileError, list,
+                          batch.read_batch(path))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
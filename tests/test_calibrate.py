@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_calibrate
+----------------------------------
+
+Tests for `ldap_target_ctl.calibrate` module, calibrate runs and
+calibrated templates.
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import xml.etree.ElementTree as ET
+
+import ldap_target_ctl
+from ldap_target_ctl import render
+from ldap_target_ctl import calibrate
+from ldap_target_ctl import synthetic
+
+from .ldap_server import LDAPServer
+from .test_synthetic import USER, BASE, ENTRIES
+
+EXPORT = """TARGET_NAME,METRIC_NAME,METRIC_COLUMN,KEY_VALUE,VALUE
+ldap1_ldap,ldap_response,BaseSearch,bcn_local,{local}
+ldap1_ldap,ldap_response,BaseSearch,bcn_remote,{remote}
+ldap1_ldap,ldap_response,status,bcn_local,1
+ldap1_ldap,Response,Status,bcn_local,1
+ldap1_ldap,ldap_response,BaseSearch,bcn_local,n/a
+"""
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_relative_accuracy(self):
+        values = [random.lognormvariate(3, 1) for _ in range(20000)]
+        sketch = calibrate.QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertTrue(abs(sketch.quantile(q) - exact) <=
+                            0.011 * exact, (q, sketch.quantile(q), exact))
+        self.assertEqual(sketch.quantile(1), values[-1])
+        self.assertEqual(calibrate.QuantileSketch().quantile(0.5), None)
+
+    def test_merge_and_round_trip(self):
+        first, second, both = [calibrate.QuantileSketch() for _ in range(3)]
+        for value in range(1, 1001):
+            (first if value % 2 else second).add(value)
+            both.add(value)
+        first.add(0)
+        both.add(0)
+        first.merge(second)
+        self.assertEqual(first.to_dict(), both.to_dict())
+        copy = calibrate.QuantileSketch.from_dict(first.to_dict())
+        self.assertEqual(copy.quantile(0.99), both.quantile(0.99))
+        self.assertEqual(copy.quantile(0), 0.0)
+        self.assertRaises(ValueError, first.merge,
+                          calibrate.QuantileSketch(0.05))
+
+    def test_bounded_buckets(self):
+        sketch = calibrate.QuantileSketch(max_buckets=50)
+        for value in range(1, 10001):
+            sketch.add(value)
+        self.assertEqual(len(sketch.buckets), 50)
+        self.assertEqual(sketch.count, 10000)
+        self.assertTrue(abs(sketch.quantile(0.99) - 9900) < 100)
+
+
+class TestCalibration(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_thresholds(self):
+        sketch = calibrate.QuantileSketch()
+        for _ in range(10):
+            sketch.add(10)
+        self.assertEqual(calibrate.thresholds(sketch), None)
+        for _ in range(10):
+            sketch.add(10)
+        self.assertEqual(calibrate.thresholds(sketch), (500, 600))
+        for _ in range(100):
+            sketch.add(1000)
+        self.assertEqual(calibrate.thresholds(sketch), (1500, 3000))
+
+    def test_metric_export_and_beacon_overrides(self):
+        export = os.path.join(self.tmpdir, 'export.csv')
+        with open(export, 'w') as rows:
+            rows.write(EXPORT.splitlines(True)[0])
+            for number in range(40):
+                rows.write(''.join(EXPORT.splitlines(True)[1:]).format(
+                    local=100 + number, remote=2000 + 10 * number))
+        store = calibrate.SketchStore(os.path.join(self.tmpdir,
+                                                   'sketches.json'))
+        self.assertEqual(calibrate.read_metric_export(store, export),
+                         (80, 120))
+        store.save()
+
+        store = calibrate.SketchStore(store.path)
+        self.assertEqual(store.beacons('ldap1_ldap'),
+                         ['bcn_local', 'bcn_remote'])
+        calibrated = calibrate.calibrate(store)
+        self.assertEqual(calibrated['ldap1_ldap'], {
+            'thresholds': {'BaseSearch': (3600.0, 7200.0)},
+            'beacon_thresholds': {'bcn_local': {'BaseSearch': (500, 600)}}})
+
+        path = os.path.join(self.tmpdir, 'thresholds.json')
+        calibrate.save_thresholds(path, calibrated, quantile=0.99)
+        self.assertEqual(calibrate.load_thresholds(path), calibrated)
+
+        bad = os.path.join(self.tmpdir, 'bad.csv')
+        with open(bad, 'w') as rows:
+            rows.write('TARGET_NAME,VALUE\n')
+        self.assertRaises(ValueError, calibrate.read_metric_export, store,
+                          bad)
+
+    def test_calibrated_template(self):
+        args = (USER, 'welcome1', 'ldap1', '389', BASE, 'cn=x', 'a')
+        options = {'thresholds': {'BaseSearch': (600, 1200)},
+                   'beacon_thresholds': {'bcn': {'CompareOp': (2500,
+                                                               5000)}}}
+        root = ldap_target_ctl.make_xml_template(*args, **options)
+        thresholds = synthetic.template_thresholds(root)
+        self.assertEqual(thresholds['BaseSearch']['warning_threshold'],
+                         '600.0')
+        self.assertEqual(thresholds['CompareOp']['warning_threshold'],
+                         '2000.0')
+        beacon = root.find('.//per_bcn_properties/mgmt_bcn_threshold')
+        self.assertEqual((beacon.get('beacon_name'),
+                          beacon.get('critical_threshold')), ('bcn', '5000.0'))
+        self.assertEqual(ldap_target_ctl.render_xml_template(*args,
+                                                             **options),
+                         ET.tostring(root))
+        plain = ldap_target_ctl.make_xml_template(*args)
+        self.assertEqual(plain.find('.//per_bcn_properties'), None)
+
+    def test_renderer_cache(self):
+        cache = render.RendererCache(ldap_target_ctl.make_xml_template,
+                                     ('u', 'p', 'h', 'port', 'b', 'f', 'a'))
+        first = cache.renderer(thresholds={'BaseSearch': (600, 1200)})
+        self.assertTrue(first is cache.renderer(
+            thresholds={'BaseSearch': [600, 1200]}))
+        cache.renderer(thresholds=None)
+        self.assertEqual(len(cache), 2)
+
+
+class TestCalibrateMode(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LDAPServer({USER: 'welcome1'},
+                                 entries=dict(ENTRIES)).start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            batch.write('127.0.0.1:{}:POD-E\n'.format(self.server.port))
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_calibrate_and_check(self):
+        output = os.path.join(self.tmpdir, 'thresholds.json')
+        state = os.path.join(self.tmpdir, 'sketches.json')
+        for _ in range(2):
+            self.assertEqual(ldap_target_ctl.calibrate_thresholds(
+                output, self.batch_file, ldap_user=USER,
+                ldap_password='welcome1', ldap_base=BASE,
+                ldap_filter='cn=oem_auth', ldap_search_attrib='Obiee_Auth',
+                samples=3, state_file=state, min_samples=5, timeout=2,
+                sleep=lambda seconds: None), 0)
+        calibrated = calibrate.load_thresholds(output)
+        # A local server answers in well under the floor
+        self.assertEqual(calibrated['127.0.0.1_ldap']['thresholds'],
+                         dict((column, (500.0, 600.0))
+                              for column in calibrate.COLUMNS))
+        self.assertTrue('Round 3/3: 1 of 1 host(s) answered' in
+                        sys.stdout.getvalue())
+        self.assertEqual(ldap_target_ctl.check_ldap_targets(
+            self.batch_file, USER, 'welcome1', BASE, 'cn=oem_auth',
+            'Obiee_Auth', timeout=2, thresholds_file=output), 0)
+
+    def test_arguments(self):
+        args = ldap_target_ctl.get_arguments(['calibrate', '-o', 'out.json',
+                                              '--metrics_csv', 'x.csv'])
+        self.assertEqual((args.mode, args.quantile, args.samples),
+                         ('calibrate', 0.99, 20))
+        sys.stderr, stderr = StringIO(), sys.stderr
+        try:
+            self.assertRaises(SystemExit, ldap_target_ctl.get_arguments,
+                              ['calibrate', '-o', 'out.json'])
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
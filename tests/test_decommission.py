@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_decommission
+----------------------------------
+
+Tests for `ldap_target_ctl.decommission` module and delete runs.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import settings
+from ldap_target_ctl import reconcile
+from ldap_target_ctl import decommission
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1'], 'POD-C': ['beacon_c1']}
+
+[fake]
+latency_scale = 0
+
+[inventory]
+path = inventory.db
+"""
+
+
+class TestResolveTargets(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = reconcile.Snapshot(
+            {'a_ldap': {'Pod': 'POD-E'}, 'b_ldap': {'Pod': 'POD-C'},
+             'c_web': {'Pod': 'POD-E'}},
+            {'OID': set(['a_ldap', 'b_ldap'])})
+
+    def test_pattern_and_pod(self):
+        targets, missing = decommission.resolve_targets(
+            self.snapshot, pattern='*_ldap', pod='POD-E')
+        self.assertEqual([target.name for target in targets], ['a_ldap'])
+        self.assertEqual(targets[0].groups, ('OID',))
+        self.assertEqual(missing, [])
+
+    def test_names(self):
+        targets, missing = decommission.resolve_targets(
+            self.snapshot, ['c_web', 'x_ldap', 'c_web', 'b_ldap'])
+        self.assertEqual([target.name for target in targets],
+                         ['c_web', 'b_ldap'])
+        self.assertEqual(targets[0].groups, ())
+        self.assertEqual(missing, ['x_ldap'])
+
+
+class TestDeleteRun(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for number in range(6):
+                batch.write('fake_ldap{}:3060:{}\n'.format(
+                    number, 'POD-E' if number % 2 else 'POD-C'))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users', 'cn=x',
+            'cn', 'Production', 11, 'OID', 'sysman', 'welcome1', jobs=4,
+            backend='fake'), 0)
+        self.oms = fake.shared_oms()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def test_delete_by_pattern(self):
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', pattern='*_ldap', pod='POD-E', jobs=4,
+            backend='fake', dry_run=True), 0)
+        self.assertEqual(len(self.oms.targets), 6)
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', pattern='*_ldap', pod='POD-E', jobs=4,
+            backend='fake', confirm=lambda count: count == 3), 0)
+        self.assertEqual(sorted(self.oms.targets),
+                         ['fake_ldap0_ldap', 'fake_ldap2_ldap',
+                          'fake_ldap4_ldap'])
+        self.assertEqual(self.oms.groups['OID'], set(self.oms.targets))
+        self.assertEqual(self.oms.calls['modify_group'], 2)
+        with open(os.path.join(self.tmpdir, 'delete_POD-E.journal')) as log:
+            self.assertEqual(len(log.readlines()), 6)
+
+    def test_delete_by_batch_file(self):
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', batch_file=self.batch_file, jobs=4,
+            backend='fake'), 0)
+        self.assertEqual(self.oms.targets, {})
+        self.assertEqual(self.oms.groups['OID'], set())
+        # A second run finds nothing left
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', batch_file=self.batch_file,
+            backend='fake'), 0)
+
+    def test_declined(self):
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', pattern='*', backend='fake',
+            confirm=lambda count: False), 1)
+        self.assertEqual(len(self.oms.targets), 6)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_emcli_state
+----------------------------------
+
+Tests for `ldap_target_ctl.emcli_state` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import emcli_state
+
+from .clock import FakeClock
+
+STATUS = """Oracle Enterprise Manager 13c Release 5.  Copyright (c) 2012, 2021
+EM CLI Home : /u01/app/emcli
+EM CLI Version : 13.5.0.0.0
+Log file : /u01/app/emcli/.emcli/.emcli.log
+EM URL : https://oms.example.com:7799/em
+EM user : sysman
+"""
+
+
+class TestStatus(unittest.TestCase):
+
+    def test_parse_and_fingerprint(self):
+        status = emcli_state.parse_status(STATUS)
+        self.assertEqual(status['EM user'], 'sysman')
+        self.assertEqual(status['EM URL'], 'https://oms.example.com:7799/em')
+        changed = dict(status, **{'Log file': '/tmp/emcli.log'})
+        self.assertEqual(emcli_state.fingerprint(changed),
+                         emcli_state.fingerprint(status))
+        changed['EM CLI Version'] = '13.5.0.0.1'
+        self.assertNotEqual(emcli_state.fingerprint(changed),
+                            emcli_state.fingerprint(status))
+
+
+class TestLoginState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state', 'emcli_state.json')
+        self.oms = fake.FakeOMS(latency_scale=0)
+        self.emcli = fake.FakeEmcli(self.oms, 'sysman', 'welcome1')
+        self.clock = FakeClock(1000.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_once(self, backend='fake', force_sync=False):
+        """ Starts and ends one run, returning (logged in, synced). """
+
+        self.oms.calls.clear()
+        state = emcli_state.LoginState(self.path, 'https://oms', 'sysman',
+                                       backend, clock=self.clock)
+        self.assertEqual(state.start(self.emcli, force_sync)[0], 0)
+        state.end(self.emcli)
+        self.assertEqual(state.logged_in, 'login' in self.oms.calls)
+        self.assertEqual(state.synced, 'sync' in self.oms.calls)
+        return state.logged_in, state.synced
+
+    def test_fresh_session_is_reused(self):
+        self.assertEqual(self.run_once(), (True, True))
+        self.assertEqual(self.oms.session, 'sysman')
+        self.clock.now += 60
+        self.assertEqual(self.run_once(), (False, False))
+        self.assertEqual(self.run_once(force_sync=True), (True, True))
+
+    def test_no_state_and_no_user(self):
+        # Single mode may run without an OEM user, and without a state
+        # file there is nothing saved to compare the status with
+        state = emcli_state.LoginState(None, 'https://oms', None, 'spawn',
+                                       clock=self.clock)
+        self.assertEqual(state.start(self.emcli)[0], 0)
+        self.assertEqual((state.logged_in, state.synced), (True, True))
+
+    def test_expired_session_logs_in(self):
+        self.run_once()
+        self.clock.now += emcli_state.SESSION_MAX_AGE + 1
+        self.assertEqual(self.run_once(), (True, False))
+        self.oms.session = None
+        self.assertEqual(self.run_once(), (True, False))
+
+    def test_upgraded_oms_syncs(self):
+        self.run_once()
+        self.oms.version = '13.5.0.0.1'
+        self.assertEqual(self.run_once(), (False, True))
+        self.clock.now += emcli_state.SYNC_MAX_AGE
+        self.assertEqual(self.run_once(), (True, True))
+
+    def test_session_backend_logs_out(self):
+        self.assertEqual(self.run_once('session'), (True, True))
+        self.assertEqual(self.oms.session, None)
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_engine
+----------------------------------
+
+Tests for `ldap_target_ctl.engine` module.
+"""
+
+import random
+import threading
+import time
+import unittest
+
+from ldap_target_ctl import engine
+
+
+def make_targets(count):
+    return [engine.BatchTarget('fake_ldap{}'.format(number), '3060',
+                               'POD-E', ('beacon',), {})
+            for number in range(count)]
+
+
+class TestRunBatch(unittest.TestCase):
+
+    def test_output_in_batch_order(self):
+        def worker(target):
+            time.sleep(random.random() / 100)
+            result = engine.TargetResult(target)
+            result.record(0, target.name, '')
+            return result
+
+        emitted = []
+        code = engine.run_batch(make_targets(40), worker, jobs=8,
+                                emit=lambda result: emitted.append(
+                                    result.output[0]))
+        self.assertEqual(code, 0)
+        self.assertEqual(emitted,
+                         [target.name for target in make_targets(40)])
+
+    def test_bounded_concurrency_and_code_total(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def worker(target):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.01)
+            with lock:
+                state['active'] -= 1
+            result = engine.TargetResult(target)
+            result.record(1, '', 'failed')
+            return result
+
+        code = engine.run_batch(make_targets(20), worker, jobs=4,
+                                emit=lambda result: None)
+        self.assertEqual(code, 20)
+        self.assertTrue(1 < state['peak'] <= 4)
+
+    def test_worker_exception_becomes_failed_result(self):
+        def worker(target):
+            raise RuntimeError('boom')
+
+        emitted = []
+        code = engine.run_batch(make_targets(3), worker, jobs=2,
+                                emit=emitted.append)
+        self.assertEqual(code, 3)
+        self.assertTrue('boom' in emitted[0].output[0])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
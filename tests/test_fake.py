@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_fake
+----------------------------------
+
+Tests for `ldap_target_ctl.fake` module, and batch runs against it.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import inventory
+from ldap_target_ctl import retry
+from ldap_target_ctl import settings
+from ldap_target_ctl import reconcile
+from ldap_target_ctl import update
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1', 'beacon_e2']}
+
+[fake]
+latency_scale = 0
+concurrency = 4
+seed = 1
+
+[inventory]
+path = inventory.db
+"""
+
+EMEA_URL = 'https://oms-emea.example.com:7799/em'
+
+PRODUCTION = {'Department': 'Entity Eleven', 'Function': 'LDAP Service',
+              'Lifecycle Status': 'Production', 'Pod': 'POD-E'}
+
+
+class TestFakeOMS(unittest.TestCase):
+
+    def setUp(self):
+        self.oms = fake.FakeOMS(latency_scale=0, seed=1)
+        self.emcli = fake.FakeEmcli(self.oms, 'sysman', 'welcome1')
+
+    def test_targets_properties_and_groups(self):
+        self.assertEqual(self.emcli.login()[0], 0)
+        code, out, err = self.emcli.create_generic_service(
+            'fake_ldap1_ldap', '<xml/>', ['beacon_e1'])
+        self.assertEqual(code, 0)
+        response = self.emcli.create_generic_service('fake_ldap1_ldap',
+                                                     '<xml/>', [])
+        self.assertEqual(retry.classify(*response), retry.PERMANENT)
+        self.assertEqual(self.emcli.set_target_property_value(
+            'fake_ldap1_ldap', 'generic_service', PRODUCTION)[0], 0)
+        self.assertEqual(self.emcli.create_group('OID')[0], 0)
+        self.assertEqual(self.emcli.add_to_group('OID', 'fake_ldap1_ldap',
+                                                 'generic_service')[0], 0)
+        self.assertEqual(self.emcli.get_groups(), ['OID'])
+        snapshot, errors = reconcile.take_snapshot(self.emcli,
+                                                   'generic_service',
+                                                   ['OID'])
+        self.assertEqual(errors, [])
+        self.assertEqual(snapshot.plan('fake_ldap1_ldap', PRODUCTION,
+                                       'OID'), [])
+        self.assertEqual(self.emcli.delete_target('fake_ldap1_ldap',
+                                                  'generic_service')[0], 0)
+        self.assertEqual(self.oms.groups['OID'], set())
+
+    def test_missing_target_is_named(self):
+        code, out, err = self.emcli.set_target_property_value(
+            'missing_ldap', 'generic_service', PRODUCTION)
+        self.assertEqual(code, 1)
+        self.assertTrue('missing_ldap' in err)
+
+    def test_error_injection(self):
+        self.oms.errors['create_service'] = 1.0
+        response = self.emcli.create_generic_service('fake_ldap1_ldap',
+                                                     '<xml/>', [])
+        self.assertEqual(retry.classify(*response), retry.TRANSIENT)
+        self.assertEqual(self.oms.targets, {})
+
+    def test_scripted_responses_and_history(self):
+        busy = (1, '', 'Error: The OMS is busy, try again later\n')
+        self.oms.script('sync', busy)
+        self.oms.history = []
+        self.assertEqual(self.emcli.sync(), busy)
+        self.assertEqual(self.emcli.sync()[0], 0)
+        self.assertEqual(self.oms.calls['sync'], 2)
+        self.assertEqual(self.oms.history, [('sync', {})] * 2)
+
+    def test_latency(self):
+        delays = []
+        oms = fake.FakeOMS(latency={'sync': (0.5, 0.0)}, sleep=delays.append)
+        fake.FakeEmcli(oms).sync()
+        self.assertAlmostEqual(delays[0], 0.5)
+
+    def test_busy_above_concurrency(self):
+        self.oms.concurrency = 1
+        self.oms.in_flight = 1
+        response = self.emcli.sync()
+        self.assertEqual(retry.classify(*response), retry.TRANSIENT)
+
+
+class TestFakeBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for number in range(20):
+                batch.write('fake_ldap{}:3060:POD-E\n'.format(number))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def add_batch(self, **options):
+        return ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='fake', **options)
+
+    def test_batch(self):
+        self.assertEqual(self.add_batch(jobs=8), 0)
+        oms = fake.shared_oms()
+        self.assertEqual(len(oms.targets), 20)
+        self.assertEqual(len(oms.groups['OID']), 20)
+        target_properties = dict(oms.targets['fake_ldap3_ldap']['properties'])
+        self.assertTrue(target_properties.pop(update.HASH_PROPERTY)
+                        .startswith(update.HASH_PREFIX))
+        self.assertEqual(target_properties, PRODUCTION)
+        self.assertEqual(oms.targets['fake_ldap3_ldap']['beacons'],
+                         ['beacon_e1', 'beacon_e2'])
+        self.assertTrue(oms.peak <= 4)
+        # Re-running with --reconcile finds nothing left to do
+        calls = oms.calls.get('create_service')
+        self.assertEqual(self.add_batch(jobs=8, reconcile_mode=True), 0)
+        self.assertEqual(oms.calls.get('create_service'), calls)
+
+    def test_group_not_created(self):
+        oms = fake.shared_oms()
+        oms.verb_create_group = lambda name, **options: (
+            1, '', 'Error: not authorized to create groups\n')
+        self.assertEqual(self.add_batch(jobs=8), 1)
+        self.assertEqual(len(oms.targets), 20)
+        self.assertEqual(oms.calls.get('modify_group'), None)
+
+
+class TestFakeShards(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG.replace(
+                "'POD-E': ['beacon_e1', 'beacon_e2']",
+                "'POD-E': ['beacon_e1'], 'POD-F': ['beacon_f1']"))
+            config.write('\n[oem:emea]\nurl = {}\njobs = 2\n'
+                         'pods = POD-F\n'.format(EMEA_URL))
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for number in range(10):
+                batch.write('fake_ldap{}:3060:POD-{}\n'.format(
+                    number, 'EF'[number % 2]))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def add_batch(self):
+        return ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='fake', jobs=8)
+
+    def test_batch_per_oms(self):
+        self.assertEqual(self.add_batch(), 0)
+        default, emea = fake.shared_oms(), fake.shared_oms(EMEA_URL)
+        self.assertEqual(sorted(default.targets), sorted(
+            'fake_ldap{}_ldap'.format(number) for number in range(0, 10, 2)))
+        self.assertEqual(sorted(emea.targets), sorted(
+            'fake_ldap{}_ldap'.format(number) for number in range(1, 10, 2)))
+        self.assertEqual(emea.targets['fake_ldap1_ldap']['beacons'],
+                         ['beacon_f1'])
+        self.assertTrue(emea.peak <= 2)
+        output = sys.stdout.getvalue()
+        self.assertTrue('OMS emea ({}): 5 target(s), 5 ok, 0 failed'.format(
+            EMEA_URL) in output)
+        self.assertTrue('Total: 10 target(s) on 2 OMS, 10 ok, 0 failed'
+                        in output)
+
+    def test_shard_errors(self):
+        # An OMS whose emcli can't be run fails on its own
+        def broken(*args, **options):
+            raise OSError(2, 'No such file or directory')
+
+        emea = fake.shared_oms(EMEA_URL)
+        emea.verb_set_target_property_value = broken
+        self.assertEqual(self.add_batch(), 1)
+        self.assertTrue(update.HASH_PROPERTY in fake.shared_oms().targets[
+            'fake_ldap0_ldap']['properties'])
+        self.assertTrue('ERROR: OMS emea failed: [Errno 2] No such file or '
+                        'directory' in sys.stdout.getvalue())
+
+        # Anything else is raised once both OMSes are done
+        def bug(*args, **options):
+            raise KeyError('Pod')
+
+        fake.set_shared_oms(None)
+        fake.shared_oms(EMEA_URL).verb_set_target_property_value = bug
+        self.assertRaises(KeyError, self.add_batch)
+        self.assertEqual(len(fake.shared_oms().targets), 5)
+
+    def test_modes_per_oms(self):
+        self.assertEqual(self.add_batch(), 0)
+        default, emea = fake.shared_oms(), fake.shared_oms(EMEA_URL)
+
+        # Hashes are salted with the url of the OMS that created the
+        # target, so the first update finds both OMSes current
+        for password, pushed in (('welcome1', 0), ('rotated1', 5)):
+            self.assertEqual(ldap_target_ctl.update_ldap_targets(
+                self.batch_file, 'cn=orcladmin', password, 'cn=Users',
+                'cn=x', 'cn', 'sysman', 'welcome1', jobs=4,
+                backend='fake'), 0)
+            for oms in default, emea:
+                self.assertEqual(oms.calls.get('apply_template_tests', 0),
+                                 pushed)
+
+        # A sync reads both OMSes
+        del emea.targets['fake_ldap9_ldap']
+        self.assertEqual(ldap_target_ctl.sync_inventory(
+            'sysman', 'welcome1', jobs=4, backend='fake'), 0)
+        with inventory.Inventory('inventory.db') as inventory_db:
+            self.assertEqual(len(inventory_db.targets(pod='POD-E')), 5)
+            self.assertEqual(len(inventory_db.targets(pod='POD-F')), 4)
+
+        # A pattern with a pod goes to its OMS, a batch file to each
+        # row's
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', pattern='*', pod='POD-F',
+            backend='fake'), 0)
+        self.assertEqual((len(default.targets), emea.targets), (5, {}))
+        self.assertEqual(ldap_target_ctl.delete_ldap_targets(
+            'sysman', 'welcome1', batch_file=self.batch_file,
+            backend='fake'), 0)
+        self.assertEqual(default.targets, {})
+        self.assertEqual(emea.calls['delete_target'], 4)
+
+    def test_check_shards(self):
+        oms = settings.get_settings().oms
+        shards = dict((name, ldap_target_ctl.OmsShard(oms[name], set(), 1))
+                      for name in oms)
+        self.assertEqual(ldap_target_ctl.check_shards(shards, 'fake'), None)
+        self.assertTrue('spawn backend' in
+                        ldap_target_ctl.check_shards(shards, 'spawn'))
+        self.assertTrue('share the emcli command emcli' in
+                        ldap_target_ctl.check_shards(shards, 'session'))
+        oms['emea'].emcli = '/opt/emcli_emea/emcli'
+        self.assertEqual(ldap_target_ctl.check_shards(shards, 'session'),
+                         None)
+        del shards['emea']
+        self.assertEqual(ldap_target_ctl.check_shards(shards, 'spawn'), None)
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='spawn'), 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
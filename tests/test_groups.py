@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_groups
+----------------------------------
+
+Tests for `ldap_target_ctl.groups` module.
+"""
+
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import groups
+
+NAMES = ['fake_ldap{}_ldap'.format(number) for number in range(10)]
+
+
+class TestGroups(unittest.TestCase):
+
+    def setUp(self):
+        self.oms = fake.FakeOMS(latency_scale=0)
+        self.emcli = fake.FakeEmcli(self.oms)
+
+    def add_targets(self):
+        """ Creates NAMES and the OID group, and starts the history. """
+
+        for name in NAMES:
+            self.emcli.run('create_service', name=name,
+                           type='generic_service')
+        self.emcli.create_group('OID')
+        self.oms.history = []
+
+    def member_lists(self, option):
+        """ Returns the option value of every modify_group call. """
+
+        lists = []
+        for verb, options in self.oms.history:
+            self.assertEqual((verb, options['name']), ('modify_group', 'OID'))
+            lists.append(options[option])
+        return lists
+
+    def test_group_created_once(self):
+        cache = groups.GroupCache(self.emcli)
+        self.assertEqual(cache.ensure('OID')[0], 0)
+        self.assertEqual(cache.ensure('OID'), None)
+        self.assertTrue('OID' in cache)
+        self.assertEqual(self.oms.calls, {'get_groups': 1, 'create_group': 1})
+
+    def test_bulk_add_is_chunked(self):
+        self.add_targets()
+        responses = groups.add_targets_to_group(self.emcli, 'OID', NAMES,
+                                                'generic_service', limit=100)
+        self.assertTrue(1 < len(responses) < len(NAMES))
+        self.assertEqual([code for _, code, _, _ in responses],
+                         [0] * len(responses))
+        members = []
+        for value in self.member_lists('add_targets'):
+            self.assertTrue(len(value) <= 100)
+            members.extend(value.split(';'))
+        self.assertEqual(members, ['{}:generic_service'.format(name)
+                                   for name in NAMES])
+        self.assertEqual(self.oms.groups['OID'], set(NAMES))
+
+    def test_bulk_remove_is_chunked(self):
+        self.add_targets()
+        groups.add_targets_to_group(self.emcli, 'OID', NAMES)
+        self.oms.history = []
+        responses = groups.remove_targets_from_group(self.emcli, 'OID', NAMES,
+                                                     'generic_service',
+                                                     limit=100)
+        self.assertEqual(sum(len(chunk) for chunk, _, _, _ in responses), 10)
+        members = []
+        for value in self.member_lists('delete_targets'):
+            self.assertTrue(len(value) <= 100)
+            members.extend(value.split(';'))
+        self.assertEqual(members, ['{}:generic_service'.format(name)
+                                   for name in NAMES])
+        self.assertEqual(self.oms.groups['OID'], set())
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
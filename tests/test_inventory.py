@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_inventory
+----------------------------------
+
+Tests for `ldap_target_ctl.inventory` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import update
+from ldap_target_ctl import settings
+from ldap_target_ctl import inventory
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1', 'beacon_e2']}
+
+[fake]
+latency_scale = 0
+
+[inventory]
+path = inventory.db
+"""
+
+
+class TestInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state', 'inventory.db')
+        self.inventory = inventory.Inventory(self.path)
+
+    def tearDown(self):
+        self.inventory.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_record_and_query(self):
+        self.inventory.record('a_ldap', host='a', port=3060, pod='POD-E',
+                              beacons=('beacon_e1', 'beacon_e2'))
+        self.inventory.record('a_ldap', target_group='OID', pod=None)
+        self.inventory.record('b_ldap', host='b', pod='POD-C')
+        record = self.inventory.get('a_ldap')
+        self.assertEqual(record['pod'], 'POD-E')
+        self.assertEqual(record['beacons'], ('beacon_e1', 'beacon_e2'))
+        self.assertEqual(record['target_group'], 'OID')
+        self.assertEqual(self.inventory.get('c_ldap'), None)
+        self.assertEqual([row['name'] for row in
+                          self.inventory.targets(pod='POD-C')], ['b_ldap'])
+        self.assertEqual([row['name'] for row in
+                          self.inventory.targets(group='OID')], ['a_ldap'])
+        self.assertRaises(ValueError, self.inventory.record, 'a_ldap',
+                          color='red')
+        self.inventory.remove('b_ldap')
+        self.inventory.close()
+        # Everything was committed
+        reopened = inventory.Inventory(self.path)
+        self.assertEqual([row['name'] for row in reopened.targets()],
+                         ['a_ldap'])
+        reopened.close()
+
+    def test_each_record_is_committed(self):
+        self.inventory.record('a_ldap', host='a')
+        self.inventory.record('b_ldap', host='b')
+        self.inventory.remove('b_ldap')
+        # A second connection sees every write before close
+        reader = inventory.Inventory(self.path)
+        self.assertEqual([row['name'] for row in reader.targets()],
+                         ['a_ldap'])
+        reader.close()
+
+    def test_failed_transaction_is_rolled_back(self):
+        self.inventory.record('a_ldap', host='a')
+        try:
+            with self.inventory.transaction():
+                self.inventory.record('b_ldap', host='b')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual([row['name'] for row in self.inventory.targets()],
+                         ['a_ldap'])
+
+    def test_replace(self):
+        self.inventory.record('a_ldap', host='a', port=3060, pod='POD-E',
+                              target_group='OID', provisioned_at=1.0)
+        self.inventory.record('gone_ldap', host='gone')
+        self.assertEqual(self.inventory.replace(
+            {'a_ldap': {'pod': 'POD-C', 'target_group': None}}, 5.0), (1, 1))
+        record = self.inventory.get('a_ldap')
+        self.assertEqual((record['pod'], record['target_group']),
+                         ('POD-C', None))
+        self.assertEqual((record['port'], record['provisioned_at'],
+                          record['synced_at']), (3060, 1.0, 5.0))
+        self.assertEqual(self.inventory.get('gone_ldap'), None)
+
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for number in range(5):
+                batch.write('fake_ldap{}:3060:POD-E\n'.format(number))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def inventory(self):
+        return inventory.Inventory(os.path.join(self.tmpdir, 'inventory.db'))
+
+    def test_runs_record_and_sync_refreshes(self):
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            jobs=4, backend='fake'), 0)
+        with self.inventory() as stored:
+            record = stored.get('fake_ldap1_ldap')
+            self.assertEqual(len(stored.targets(pod='POD-E')), 5)
+        self.assertEqual((record['host'], record['port'], record['entity'],
+                          record['lifecycle'], record['target_group']),
+                         ('fake_ldap1', 3060, 'Entity Eleven', 'Production',
+                          'OID'))
+        self.assertEqual(record['beacons'], ('beacon_e1', 'beacon_e2'))
+        self.assertTrue(record['template_hash'].startswith(
+            update.HASH_PREFIX))
+
+        # Changes made behind the tool's back are picked up by a sync
+        oms = fake.shared_oms()
+        del oms.targets['fake_ldap4_ldap']
+        oms.groups['OID'].discard('fake_ldap4_ldap')
+        oms.targets['fake_ldap0_ldap']['properties']['Pod'] = 'POD-C'
+        oms.groups['OID'].discard('fake_ldap3_ldap')
+        self.assertEqual(ldap_target_ctl.sync_inventory(
+            'sysman', 'welcome1', ['OID', 'MISSING'], jobs=4,
+            backend='fake'), 0)
+        with self.inventory() as stored:
+            self.assertEqual(stored.get('fake_ldap4_ldap'), None)
+            self.assertEqual(stored.get('fake_ldap0_ldap')['pod'], 'POD-C')
+            self.assertEqual(stored.get('fake_ldap3_ldap')['target_group'],
+                             None)
+            record = stored.get('fake_ldap1_ldap')
+        # The OMS has no port or beacons to list, and no hash property was
+        # set yet, so those are kept
+        self.assertEqual((record['port'], record['beacons']),
+                         (3060, ('beacon_e1', 'beacon_e2')))
+        self.assertTrue(record['template_hash'].startswith(
+            update.HASH_PREFIX))
+        self.assertTrue(record['synced_at'] > 0)
+
+    def test_failed_sync_leaves_inventory(self):
+        with self.inventory() as stored:
+            stored.record('kept_ldap', host='kept')
+        oms = fake.FakeOMS(latency_scale=0)
+        oms.verb_list = lambda resource, **options: (
+            1, '', 'Error: Invalid search criteria\n')
+        fake.set_shared_oms(oms)
+        self.assertEqual(ldap_target_ctl.sync_inventory(
+            'sysman', 'welcome1', jobs=2, backend='fake'), 1)
+        with self.inventory() as stored:
+            self.assertNotEqual(stored.get('kept_ldap'), None)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_journal
+----------------------------------
+
+Tests for `ldap_target_ctl.journal` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ldap_target_ctl import journal
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'batch.txt.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resume_replays_completed_steps(self):
+        with journal.Journal(self.path) as steps:
+            steps.record('a_ldap', 'created')
+            steps.record('a_ldap', 'properties')
+            steps.record('b_ldap', 'created')
+        # A record torn by a crash is ignored and not glued to the next one
+        with open(self.path, 'a') as torn:
+            torn.write('properties\tb_l')
+
+        with journal.Journal(self.path, resume=True) as steps:
+            self.assertEqual(steps.completed('a_ldap'),
+                             set(['created', 'properties']))
+            self.assertEqual(steps.completed('b_ldap'), set(['created']))
+            self.assertEqual(steps.completed('c_ldap'), frozenset())
+            steps.record('b_ldap', 'properties')
+        self.assertEqual(journal.replay(self.path)['b_ldap'],
+                         set(['created', 'properties']))
+
+    def test_new_run_starts_empty(self):
+        with journal.Journal(self.path) as steps:
+            steps.record('a_ldap', 'created')
+        with journal.Journal(self.path) as steps:
+            self.assertEqual(steps.completed('a_ldap'), frozenset())
+        self.assertEqual(journal.replay(self.path), {})
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_metrics
+----------------------------------
+
+Tests for `ldap_target_ctl.metrics` module.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ldap_target_ctl import retry
+from ldap_target_ctl import metrics
+
+
+class TestRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_quantile(self):
+        samples = range(1, 101)
+        self.assertEqual(metrics.quantile(samples, 0.5), 50)
+        self.assertEqual(metrics.quantile(samples, 0.95), 95)
+        self.assertEqual(metrics.quantile(samples, 0.99), 99)
+        self.assertEqual(metrics.quantile([7], 0.99), 7)
+
+    def test_target_records(self):
+        recorder = metrics.Recorder()
+        recorder.target('fake_ldap1_ldap', pod='POD-E')
+        recorder.target('fake_ldap2_ldap', pod='POD-E')
+        with recorder.timer('create', 'fake_ldap1_ldap'):
+            pass
+        recorder.add('grouped', 0.5, ['fake_ldap1_ldap', 'fake_ldap2_ldap'])
+        recorder.finish('fake_ldap2_ldap', 1)
+        records = [json.loads(line)
+                   for line in recorder.json_lines().splitlines()]
+        self.assertEqual([record['target'] for record in records],
+                         ['fake_ldap1_ldap', 'fake_ldap2_ldap'])
+        self.assertEqual(sorted(records[0]['steps']), ['create', 'grouped'])
+        self.assertEqual(records[1]['steps'], {'grouped': 0.5})
+        self.assertEqual([record['code'] for record in records], [0, 1])
+
+    def test_prometheus(self):
+        recorder = metrics.Recorder()
+        for seconds in range(1, 101):
+            recorder.observe('create_service', seconds / 100.0)
+        recorder.observe('modify_group', 2.0, retry.TRANSIENT)
+        recorder.target('fake_ldap1_ldap')
+        recorder.finish('fake_ldap1_ldap', 1)
+        text = recorder.prometheus()
+        lines = text.splitlines()
+        self.assertTrue('ldap_target_ctl_verb_duration_seconds{verb='
+                        '"create_service",quantile="0.95"} 0.95' in lines)
+        self.assertTrue('ldap_target_ctl_verb_duration_seconds_count{verb='
+                        '"create_service"} 100' in lines)
+        self.assertTrue('ldap_target_ctl_verb_errors_total{verb='
+                        '"modify_group"} 1' in lines)
+        self.assertTrue('ldap_target_ctl_targets{result="failed"} 1'
+                        in lines)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_write(self):
+        recorder = metrics.Recorder()
+        recorder.target('fake_ldap1_ldap')
+        json_file = os.path.join(self.directory, 'run.jsonl')
+        prom_file = os.path.join(self.directory, 'ldap_target_ctl.prom')
+        recorder.write(json_file, prom_file)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['ldap_target_ctl.prom', 'run.jsonl'])
+        with open(prom_file) as prom:
+            self.assertTrue('ldap_target_ctl_run_duration_seconds'
+                            in prom.read())
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
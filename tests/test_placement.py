@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_placement
+----------------------------------
+
+Tests for `ldap_target_ctl.placement` module and batch runs with a beacon
+replication factor.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import settings
+from ldap_target_ctl import placement
+
+from .test_fake import CONFIG
+
+BEACONS = ['beacon_e{}'.format(number) for number in range(1, 6)]
+NAMES = ['ldap{}.example.com_ldap'.format(number) for number in range(2000)]
+
+
+class _Target(object):
+
+    def __init__(self, beacons):
+        self.beacons = beacons
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_spread(self):
+        ring = placement.HashRing(BEACONS)
+        counts = placement.count_tests(_Target(ring.lookup(name, 2))
+                                       for name in NAMES)
+        self.assertEqual(sum(counts.values()), 2 * len(NAMES))
+        for count in counts.values():
+            # 800 each if perfectly even
+            self.assertTrue(600 < count < 1000, counts)
+        self.assertEqual(len(set(ring.lookup(NAMES[0], 3))), 3)
+        self.assertEqual(sorted(ring.lookup(NAMES[0], 10)), BEACONS)
+        self.assertEqual(placement.HashRing([]).lookup(NAMES[0]), [])
+
+    def test_minimal_movement(self):
+        before = placement.HashRing(BEACONS)
+        after = placement.HashRing(BEACONS + ['beacon_e6'])
+        moved = 0
+        for name in NAMES:
+            old, new = set(before.lookup(name, 2)), set(after.lookup(name, 2))
+            if old != new:
+                moved += 1
+                # Only the new beacon takes a place
+                self.assertEqual(new - old, set(['beacon_e6']))
+        # Ideally 2 of 6 beacons' worth of targets move
+        self.assertTrue(0.2 < float(moved) / len(NAMES) < 0.45, moved)
+
+        removed = placement.HashRing(BEACONS[1:])
+        for name in NAMES:
+            old = set(before.lookup(name, 2))
+            if 'beacon_e1' not in old:
+                self.assertEqual(set(removed.lookup(name, 2)), old)
+
+
+class TestBeaconPlacement(unittest.TestCase):
+
+    def test_assign(self):
+        pools = {'POD-E': tuple(BEACONS), 'POD-F': ('beacon_f1',)}
+        everything = placement.BeaconPlacement(pools)
+        self.assertEqual(everything.assign('POD-E', NAMES[0]), tuple(BEACONS))
+        paired = placement.BeaconPlacement(pools, 2)
+        beacons = paired.assign('POD-E', NAMES[0])
+        self.assertEqual(len(beacons), 2)
+        # Kept in pool order
+        self.assertEqual(list(beacons),
+                         [beacon for beacon in BEACONS if beacon in beacons])
+        self.assertEqual(paired.assign('POD-F', NAMES[0]), ('beacon_f1',))
+        self.assertRaises(ValueError, placement.BeaconPlacement, pools, 0)
+
+
+class TestPlacementBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.tmpdir,
+                                        settings.CONFIG_FILE_NAME)
+        with open(self.config_file, 'w') as config:
+            config.write(CONFIG.replace(
+                "['beacon_e1', 'beacon_e2']", repr(BEACONS[:3])))
+            config.write('\n[placement]\nreplicas = 1\n')
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for number in range(30):
+                batch.write('fake_ldap{}:3060:POD-E\n'.format(number))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def test_replicas(self):
+        config = settings.get_settings()
+        self.assertEqual(placement.from_settings(config).replicas, 1)
+        self.assertEqual(placement.from_settings(config, 2).replicas, 2)
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='fake', jobs=4), 0)
+        oms = fake.shared_oms()
+        counts = dict((beacon, 0) for beacon in BEACONS[:3])
+        for target in oms.targets.values():
+            self.assertEqual(len(target['beacons']), 1)
+            counts[target['beacons'][0]] += 1
+        self.assertEqual(sum(counts.values()), 30)
+        report = ''.join('  {}: {}\n'.format(beacon, count)
+                         for beacon, count in sorted(counts.items()))
+        self.assertTrue(sys.stdout.getvalue().endswith(
+            'Tests per beacon (1 per target):\n' + report))
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='fake', replicas=0), 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
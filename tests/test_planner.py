@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_planner
+----------------------------------
+
+Tests for `ldap_target_ctl.planner` module and batch runs with a beacon
+budget.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import engine
+from ldap_target_ctl import planner
+from ldap_target_ctl import profiles
+from ldap_target_ctl import settings
+from ldap_target_ctl import inventory
+from ldap_target_ctl import placement
+
+from .test_fake import CONFIG
+
+POOLS = {'POD-E': ('beacon_e1', 'beacon_e2', 'beacon_e3')}
+DEVELOPMENT = profiles.Profile('Developement', collection_interval=30)
+PROFILES = profiles.Profiles({'Developement': DEVELOPMENT})
+
+
+def hosts(beacon_placement, beacon, count, others):
+    """ Returns count fake_ldap host names whose target lands on beacon,
+        then others that don't.
+    """
+
+    on, off = [], []
+    number = 0
+    while len(on) < count or len(off) < others:
+        host = 'fake_ldap{}'.format(number)
+        number += 1
+        if beacon in beacon_placement.assign('POD-E', host + '_ldap'):
+            if len(on) < count:
+                on.append(host)
+        elif len(off) < others:
+            off.append(host)
+    return on + off
+
+
+def batch_target(host, beacon_placement, lifecycle='Production'):
+    target = engine.BatchTarget(host, '3060', 'POD-E', (),
+                                {'Lifecycle Status': lifecycle,
+                                 'Pod': 'POD-E'})
+    target.beacons = beacon_placement.assign('POD-E', target.name)
+    return target
+
+
+class TestPlanBatch(unittest.TestCase):
+
+    def setUp(self):
+        # Five Production targets (one test every 5 minutes) fill
+        # beacon_e1's budget of one test a minute
+        self.records = [{'name': 'full{}_ldap'.format(number),
+                         'beacons': ('beacon_e1',),
+                         'lifecycle': 'Production'}
+                        for number in range(5)]
+        self.records.append({'name': 'dev_ldap', 'lifecycle': 'Developement',
+                             'beacons': ('beacon_e1', 'beacon_e2')})
+
+    def test_load(self):
+        load = planner.beacon_load(self.records, PROFILES)
+        self.assertAlmostEqual(load['beacon_e1'], 1 + 1 / 30.0)
+        self.assertAlmostEqual(load['beacon_e2'], 1 / 30.0)
+        load = planner.beacon_load(self.records, PROFILES,
+                                   skip=('dev_ldap',))
+        self.assertAlmostEqual(load['beacon_e1'], 1.0)
+
+    def test_refuse_and_rebalance(self):
+        beacon_placement = placement.BeaconPlacement(POOLS, 1, budget=1.0)
+        targets = [batch_target(host, beacon_placement) for host
+                   in hosts(beacon_placement, 'beacon_e1', 2, 4)]
+        records = self.records[:5]
+        plan = planner.plan_batch(targets, records, PROFILES,
+                                  beacon_placement)
+        self.assertFalse(plan.ok)
+        self.assertEqual(plan.overloaded, ['beacon_e1'])
+        self.assertAlmostEqual(plan.after['beacon_e1'], 1.4)
+        self.assertEqual(plan.before['beacon_e1'], 1.0)
+        self.assertTrue('  beacon_e1: 1.00 -> 1.40 OVER BUDGET' in
+                        plan.report())
+
+        beacon_placement.rebalance = True
+        plan = planner.plan_batch(targets, records, PROFILES,
+                                  beacon_placement)
+        self.assertTrue(plan.ok, plan.report())
+        self.assertEqual(sorted(plan.moved), [target.name
+                                              for target in targets[:2]])
+        for beacons in plan.moved.values():
+            self.assertEqual(len(beacons), 1)
+            self.assertNotEqual(beacons, ('beacon_e1',))
+        self.assertAlmostEqual(sum(plan.after.values()), 2.2)
+
+        # Re-provisioning the inventory's own targets doesn't count them
+        # twice, and slower profiles cost less
+        targets = [batch_target('full{}'.format(number), beacon_placement,
+                                'Developement') for number in range(5)]
+        plan = planner.plan_batch(targets, records, PROFILES,
+                                  beacon_placement)
+        self.assertEqual(plan.before, {})
+        self.assertAlmostEqual(sum(plan.after.values()), 5 / 30.0)
+
+    def test_no_room(self):
+        # Without a replication factor every beacon is already in use
+        beacon_placement = placement.BeaconPlacement(POOLS, budget=0.5,
+                                                     rebalance=True)
+        targets = [batch_target('fake_ldap{}'.format(number),
+                                beacon_placement) for number in range(3)]
+        plan = planner.plan_batch(targets, [], PROFILES, beacon_placement)
+        self.assertEqual(plan.overloaded, list(POOLS['POD-E']))
+        self.assertEqual(plan.moved, {})
+
+
+class TestBudgetBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG.replace("['beacon_e1', 'beacon_e2']",
+                                        repr(list(POOLS['POD-E']))))
+            config.write('\n[placement]\nreplicas = 1\nbudget = 1\n')
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+        with inventory.Inventory('inventory.db') as inventory_db:
+            for number in range(5):
+                inventory_db.record('full{}_ldap'.format(number),
+                                    beacons=('beacon_e1',),
+                                    lifecycle='Production')
+        beacon_placement = placement.from_settings(settings.get_settings())
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            for host in hosts(beacon_placement, 'beacon_e1', 2, 4):
+                batch.write('{}:3060:POD-E\n'.format(host))
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def add_batch(self, **options):
+        return ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, 'cn=orcladmin', 'welcome1', 'cn=Users',
+            'cn=x', 'cn', 'Production', 11, 'OID', 'sysman', 'welcome1',
+            backend='fake', **options)
+
+    def test_budget(self):
+        self.assertEqual(self.add_batch(), 1)
+        self.assertEqual(fake.shared_oms().targets, {})
+        self.assertTrue('ERROR: 1 beacon(s) would run more than 1 tests per '
+                        'minute' in sys.stdout.getvalue())
+
+        self.assertEqual(self.add_batch(rebalance=True), 0)
+        oms = fake.shared_oms()
+        self.assertEqual(len(oms.targets), 6)
+        for target in oms.targets.values():
+            self.assertNotEqual(list(target['beacons']), ['beacon_e1'])
+        self.assertTrue('Rebalanced 2 target(s)' in sys.stdout.getvalue())
+        with inventory.Inventory('inventory.db') as inventory_db:
+            load = planner.beacon_load(inventory_db.targets(),
+                                       profiles.Profiles())
+        self.assertAlmostEqual(load['beacon_e1'], 1.0)
+        self.assertAlmostEqual(sum(load.values()), 2.2)
+
+        # A larger budget lets the batch through as hashed
+        fake.set_shared_oms(None)
+        self.assertEqual(self.add_batch(budget=10), 0)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_preflight
+----------------------------------
+
+Tests for `ldap_target_ctl.preflight` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ldap_target_ctl
+from ldap_target_ctl import preflight
+
+BEACONS = {'POD-E': ('beacon_e1',)}
+ENTITIES = {11: 'Entity Eleven'}
+
+
+class TestCheckBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check(self, content, name='ldap_batch.txt'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as batch_file:
+            batch_file.write(content)
+        return preflight.check_batch(path, BEACONS, ENTITIES,
+                                     ldap_target_ctl.lifecycle_name(), 11)
+
+    def test_clean_batch_with_duplicate(self):
+        report = self.check('fake_ldap1:3060:POD-E\nfake_ldap2:3060:POD-E\n'
+                            'fake_ldap1:3060:POD-E\n')
+        self.assertEqual(report.problems, [])
+        self.assertEqual(report.rows, 3)
+        self.assertEqual(report.duplicates, {3: 1})
+
+    def test_reports_every_problem(self):
+        report = self.check('ldap_host,ldap_port,pod,lifecycle,'
+                            'entity_number\n'
+                            'fake_ldap1,3060,POD-X,,\n'
+                            'fake_ldap2,99999,POD-E,prod,\n'
+                            'fake_ldap3,3060,POD-E,,42\n'
+                            'fake_ldap3,636,POD-E,,\n'
+                            'fake_ldap4,3060\n', name='ldap_batch.csv')
+        self.assertEqual(report.problems, [
+            'line 2: unknown pod POD-X',
+            'line 3: invalid port 99999',
+            'line 3: prod is not a valid lifecycle',
+            'line 4: 42 is not a valid OTES entity number',
+            'line 5: fake_ldap3_ldap conflicts with line 4',
+            'line 6: expected 5 columns, found 2'])
+
+    def test_rejects_ipv6_hosts(self):
+        report = self.check('[fe80::1]:389:POD-E\nfake_ldap1:3060:POD-E\n')
+        self.assertEqual(report.problems, [
+            'line 1: fe80::1 can\'t be provisioned, emcli target names '
+            'can\'t contain ":"; use its host name'])
+        self.assertEqual(preflight.host_problem('fake_ldap1'), None)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_probe
+----------------------------------
+
+Tests for `ldap_target_ctl.probe` and `ldap_target_ctl.ber` modules.
+"""
+
+import os
+import shutil
+import time
+import socket
+import tempfile
+import unittest
+
+import ldap_target_ctl
+from ldap_target_ctl import ber
+from ldap_target_ctl import fake
+from ldap_target_ctl import probe
+from ldap_target_ctl import settings
+
+from .ldap_server import LDAPServer
+
+BIND_DN = 'cn=orcladmin'
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1']}
+
+[fake]
+latency_scale = 0
+
+[inventory]
+path = inventory.db
+"""
+
+
+def closed_port():
+    """ Returns a local port nothing listens on. """
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestBER(unittest.TestCase):
+
+    def test_round_trip(self):
+        for value in (0, 3, 127, 128, 255, 256, -1, -129, 2 ** 31):
+            tag, octets, end = ber.read_tlv(ber.integer(value))
+            self.assertEqual(ber.decode_integer(octets), value)
+        long_value = 'x' * 300
+        element = ber.octet_string(long_value)
+        self.assertEqual(ber.message_length(element), len(element))
+        self.assertEqual(ber.message_length(element[:100]), None)
+        self.assertEqual(ber.read_tlv(element)[1], long_value)
+
+    def test_bind_request(self):
+        message_id, operation, value = ber.parse_message(
+            ber.bind_request(7, BIND_DN, 'welcome1'))
+        self.assertEqual((message_id, operation), (7, ber.BIND_REQUEST))
+        self.assertEqual(ber.elements(value),
+                         [(ber.INTEGER, '\x03'),
+                          (ber.OCTET_STRING, BIND_DN),
+                          (ber.SIMPLE_AUTH, 'welcome1')])
+
+
+class TestProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LDAPServer({BIND_DN: 'welcome1'}).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connect_and_bind(self):
+        down = closed_port()
+        results = probe.probe_hosts(
+            [('127.0.0.1', self.server.port), ('127.0.0.1', down),
+             ('127.0.0.1', str(self.server.port))],
+            timeout=2)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(results[0].ok)
+        self.assertTrue(results[0].timings['connect'] >= 0)
+        self.assertFalse(results[1].ok)
+        self.assertTrue(results[1].error.startswith('connect: '))
+        self.assertEqual(self.server.binds, 0)
+
+        good, bad = [probe.Reachability('127.0.0.1', self.server.port,
+                                        BIND_DN, password, timeout=2)
+                     for password in ('welcome1', 'wrong')]
+        probe.run([good, bad])
+        self.assertTrue(good.ok, good.error)
+        self.assertEqual(good.result_code, ber.SUCCESS)
+        self.assertEqual(bad.result_code, ber.INVALID_CREDENTIALS)
+        self.assertTrue('Invalid credentials' in bad.error)
+
+    def test_many_in_flight(self):
+        # Repeated endpoints are probed once
+        results = probe.probe_hosts([('127.0.0.1', self.server.port)] * 100,
+                                    BIND_DN, 'welcome1')
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].ok)
+        conversations = [probe.Reachability('127.0.0.1', self.server.port,
+                                            BIND_DN, 'welcome1', timeout=5)
+                         for _ in range(200)]
+        probe.run(conversations, concurrency=50)
+        self.assertTrue(all(result.ok for result in conversations))
+        self.assertEqual(self.server.binds, 201)
+
+    def test_timeout(self):
+        self.server.delay = 1.0
+        result = probe.Reachability('127.0.0.1', self.server.port, BIND_DN,
+                                    'welcome1', timeout=0.2)
+        probe.run([result])
+        self.assertEqual(result.error, 'bind: timed out after 0.2s')
+
+    def test_unresolvable_host(self):
+        result = probe.Reachability('no-such-host.invalid', 389)
+        probe.run([result])
+        self.assertTrue(result.error.startswith('cannot resolve'))
+
+    def test_slow_lookups_run_side_by_side(self):
+        getaddrinfo = socket.getaddrinfo
+
+        def slow_getaddrinfo(host, *args):
+            if host.startswith('slow'):
+                time.sleep(1)
+                raise socket.gaierror(-2, 'Name or service not known')
+            return getaddrinfo(host, *args)
+
+        conversations = [probe.Reachability(host, port, timeout=2)
+                         for host, port in (('slow1', 389),
+                                            ('127.0.0.1', self.server.port),
+                                            ('slow2', 389))]
+        socket.getaddrinfo = slow_getaddrinfo
+        try:
+            started = time.time()
+            probe.run(conversations)
+            elapsed = time.time() - started
+        finally:
+            socket.getaddrinfo = getaddrinfo
+        self.assertTrue(elapsed < 1.8, elapsed)
+        self.assertTrue(conversations[1].ok)
+        self.assertEqual(conversations[2].error, 'cannot resolve slow2: '
+                         'Name or service not known')
+
+
+class TestBatchProbe(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LDAPServer({BIND_DN: 'welcome1'}).start()
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        self.batch_file = os.path.join(self.tmpdir, 'batch.txt')
+        with open(self.batch_file, 'w') as batch:
+            batch.write('127.0.0.1:{}:POD-E\n'.format(self.server.port))
+            batch.write('localhost:{}:POD-E\n'.format(closed_port()))
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def tearDown(self):
+        self.server.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def add_batch(self, **options):
+        return ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, BIND_DN, 'welcome1', 'cn=Users', 'cn=x', 'cn',
+            'Production', 11, 'OID', 'sysman', 'welcome1', backend='fake',
+            probe_mode='bind', probe_timeout=2, **options)
+
+    def test_unreachable_hosts(self):
+        self.assertEqual(self.add_batch(), 1)
+        oms = fake.shared_oms()
+        self.assertEqual(oms.targets, {})
+        self.assertEqual(self.add_batch(skip_unreachable=True), 0)
+        self.assertEqual(sorted(oms.targets), ['127.0.0.1_ldap'])
+        self.assertEqual(self.server.binds, 2)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
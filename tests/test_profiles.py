@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_profiles
+----------------------------------
+
+Tests for `ldap_target_ctl.profiles` module and profiled templates.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+import ldap_target_ctl
+from ldap_target_ctl import settings
+from ldap_target_ctl import profiles
+
+from .test_settings import CONFIG
+
+PROFILES = """
+[profile]
+ldap_timeout = 30
+
+[profile:development]
+collection_interval = 30
+numretries = 2
+
+[profile:Mission Critical]
+collection_interval = 1
+"""
+
+ARGS = ('cn=orcladmin', 'welcome1', 'ldap1', '389', 'cn=Users', 'cn=x', 'a')
+
+
+def template_properties(root):
+    return dict((element.get('name'), element.get('num_value'))
+                for element in root.iter('property')
+                if element.get('num_value') is not None)
+
+
+class TestProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.tmpdir,
+                                        settings.CONFIG_FILE_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, text):
+        with open(self.config_file, 'w') as config:
+            config.write(CONFIG + text)
+        return profiles.from_settings(
+            settings.load_settings(self.config_file),
+            ldap_target_ctl.lifecycle_name())
+
+    def test_sections(self):
+        loaded = self.load(PROFILES)
+        development = loaded.get('Developement')
+        self.assertEqual((development.collection_interval,
+                          development.ldap_timeout, development.numretries,
+                          development.retryinterval), (30, 30, 2, 5))
+        self.assertEqual(loaded.get('Mission Critical').tests_per_minute, 1)
+        # Lifecycles without a section get [profile]
+        self.assertEqual(loaded.get('Production').ldap_timeout, 30)
+        self.assertEqual(loaded.get(None).tests_per_minute, 0.2)
+        self.assertEqual(self.load('').get('Test').properties(), {
+            'Collection Interval': 5.0, 'ldap_timeout': 60.0,
+            'numretries': 6.0, 'retryinterval': 5.0})
+
+        for text in ('\n[profile:nightly]\ncollection_interval = 1\n',
+                     '\n[profile:test]\ncollection_interval = 0\n',
+                     '\n[profile:test]\ncollection_interval = often\n',
+                     '\n[profile]\npolls = 3\n'):
+            self.assertRaises(ValueError, self.load, text)
+
+    def test_template(self):
+        # The default profile renders the template as it always was
+        plain = ldap_target_ctl.make_xml_template(*ARGS)
+        default = profiles.Profiles().collection('Production')
+        self.assertEqual(ET.tostring(plain), ET.tostring(
+            ldap_target_ctl.make_xml_template(*ARGS, collection=default)))
+
+        collection = self.load(PROFILES).collection('Developement')
+        root = ldap_target_ctl.make_xml_template(*ARGS,
+                                                 collection=collection)
+        properties = template_properties(root)
+        self.assertEqual((properties['Collection Interval'],
+                          properties['ldap_timeout'],
+                          properties['numretries'],
+                          properties['ldap_port']),
+                         ('30.0', '30.0', '2.0', '389'))
+        self.assertEqual(ldap_target_ctl.render_xml_template(
+            *ARGS, collection=collection), ET.tostring(root))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_properties
+----------------------------------
+
+Tests for `ldap_target_ctl.properties` module.
+"""
+
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import properties
+
+PRODUCTION = {'Department': 'Entity Eleven', 'Function': 'LDAP Service',
+              'Lifecycle Status': 'Production', 'Pod': 'POD-E'}
+TEST = dict(PRODUCTION, **{'Lifecycle Status': 'Test'})
+
+
+class TestPropertyBatcher(unittest.TestCase):
+
+    def apply(self, batcher, names):
+        """ Applies batcher through a FakeEmcli whose OMS has the targets
+            of names but the missing_* ones.
+
+            Returns:
+                (responses, failed, calls) - apply()'s result and the
+                options of each set_target_property_value call
+        """
+
+        oms = fake.FakeOMS(latency_scale=0)
+        emcli = fake.FakeEmcli(oms)
+        for name in names:
+            if not name.startswith('missing_'):
+                emcli.run('create_service', name=name, type='generic_service')
+        oms.history = []
+        responses, failed = batcher.apply(emcli)
+        return responses, failed, [options for _, options in oms.history]
+
+    def test_one_call_per_property_set(self):
+        batcher = properties.PropertyBatcher()
+        names = ['fake_ldap{}_ldap'.format(number) for number in range(6)]
+        for number, name in enumerate(names):
+            batcher.add(name, PRODUCTION if number % 2 else TEST)
+        responses, failed, calls = self.apply(batcher, names)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(failed, {})
+        self.assertEqual(sorted(len(chunk) for chunk, _, _, _ in responses),
+                         [3, 3])
+        self.assertTrue('fake_ldap1_ldap:generic_service:Lifecycle Status:'
+                        'Production' in calls[1]['property_records'])
+
+    def test_chunks_and_isolates_failures(self):
+        batcher = properties.PropertyBatcher(limit=400)
+        names = ['fake_ldap{}_ldap'.format(number) for number in range(8)]
+        names[2] = 'missing_ldap'
+        for name in names:
+            batcher.add(name, PRODUCTION)
+        responses, failed, calls = self.apply(batcher, names)
+        for options in calls:
+            self.assertTrue(len(options['property_records']) <= 400)
+        self.assertEqual(failed.keys(), ['missing_ldap'])
+        succeeded = [name for chunk, code, _, _ in responses if code == 0
+                     for name in chunk]
+        self.assertEqual(sorted(succeeded), sorted(set(names) -
+                                                   set(['missing_ldap'])))
+
+    def test_alternate_separators(self):
+        batcher = properties.PropertyBatcher()
+        batcher.add('fake_ldap1_ldap', dict(PRODUCTION, Department='A;B'))
+        responses, failed, calls = self.apply(batcher, ['fake_ldap1_ldap'])
+        self.assertEqual(calls[0]['separator'], 'property_records=#@#')
+        self.assertEqual(failed, {})
+
+    def test_extra_values_share_the_call(self):
+        batcher = properties.PropertyBatcher()
+        names = ['fake_ldap{}_ldap'.format(number) for number in range(3)]
+        for number, name in enumerate(names):
+            batcher.add(name, PRODUCTION,
+                        {'ldap_target_ctl_hash': 'ltc-sha256:{}'.format(
+                            number)})
+        responses, failed, calls = self.apply(batcher, names)
+        self.assertEqual((len(calls), failed), (1, {}))
+        records = calls[0]['property_records'].split('#@#')
+        self.assertEqual(len(records), 3 * (len(PRODUCTION) + 1))
+        self.assertTrue('fake_ldap2_ldap#~#generic_service#~#'
+                        'ldap_target_ctl_hash#~#ltc-sha256:2' in records)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
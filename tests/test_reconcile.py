@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_reconcile
+----------------------------------
+
+Tests for `ldap_target_ctl.reconcile` module.
+"""
+
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import reconcile
+
+PROPERTIES = {'Department': 'Entity Eleven', 'Function': 'LDAP Service',
+              'Lifecycle Status': 'Production', 'Pod': 'POD-E'}
+
+
+def snapshot_emcli():
+    """ Returns a FakeEmcli whose OMS has a_ldap and c_ldap on POD-E and
+        b_ldap on POD-F, with a_ldap and b_ldap in the OID group.
+    """
+
+    emcli = fake.FakeEmcli(fake.FakeOMS(latency_scale=0))
+    for name, pod in (('a_ldap', 'POD-E'), ('b_ldap', 'POD-F'),
+                      ('c_ldap', 'POD-E')):
+        emcli.run('create_service', name=name, type='generic_service')
+        emcli.set_target_property_value(name, 'generic_service',
+                                        dict(PROPERTIES, Pod=pod))
+    emcli.create_group('OID')
+    emcli.run('modify_group', name='OID',
+              add_targets='a_ldap:generic_service;b_ldap:generic_service')
+    return emcli
+
+
+class TestReconcile(unittest.TestCase):
+
+    def test_plan(self):
+        snapshot, errors = reconcile.take_snapshot(snapshot_emcli(),
+                                                   groups=['OID'])
+        self.assertEqual(errors, [])
+        self.assertEqual(snapshot.plan('a_ldap', PROPERTIES, 'OID'), [])
+        self.assertEqual(snapshot.plan('b_ldap', PROPERTIES, 'OID'),
+                         ['properties'])
+        self.assertEqual(snapshot.plan('c_ldap', PROPERTIES, 'OID'),
+                         ['grouped'])
+        self.assertEqual(snapshot.plan('d_ldap', PROPERTIES, 'OID'),
+                         list(reconcile.STEPS))
+        self.assertEqual(snapshot.plan('d_ldap', PROPERTIES),
+                         ['created', 'properties'])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
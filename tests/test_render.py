@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_render
+----------------------------------
+
+Tests for `ldap_target_ctl.render` module.  Needs neither emclpy nor an OMS.
+"""
+
+import unittest
+import xml.etree.ElementTree as ET
+
+from ldap_target_ctl import render
+from ldap_target_ctl import make_xml_template, render_xml_template
+
+SLOTS = ('ldap_user', 'ldap_password', 'ldap_host', 'ldap_port',
+         'ldap_base', 'ldap_filter', 'ldap_search_attrib')
+VALUES = [('cn=otes_oem_auth,cn=Users,dc=us,dc=oracle,dc=com', 'taleo123',
+           'dcppidb05011.techno.taleocloud.net', '3060',
+           'cn=otes_oem_auth,cn=Users,dc=us,dc=oracle,dc=com',
+           'cn=otes_oem_auth', 'Taleo_Obiee_Auth'),
+          ('cn=a&b,cn="q"', 'p<w>d{0}\n', u'h\xf6st', '389',
+           '', '(&(cn=x)(uid={name}))', u'\u2603')]
+
+
+def element(name, value):
+    root = ET.Element('root', {'name': name})
+    ET.SubElement(root, 'value', {'text': value, 'fixed': '{braces}'})
+    return root
+
+
+class TestRender(unittest.TestCase):
+
+    def test_escape_attribute(self):
+        for value in ('plain', 'a&b<c>"d"\ne', u'h\xf6st \u2603'):
+            self.assertEqual(ET.tostring(element(value, '')),
+                             '<root name="{}"><value fixed="{{braces}}" '
+                             'text="" /></root>'.format(
+                                 render.escape_attribute(value)))
+        self.assertRaises(TypeError, render.escape_attribute, 5)
+
+    def test_renderer(self):
+        renderer = render.TemplateRenderer(element, ('name', 'value'))
+        for name, value in (('a', 'b'), ('{0}', '&{x}'), (u'\xf6', '"')):
+            self.assertEqual(renderer.render(name, value),
+                             ET.tostring(element(name, value)))
+        unused = render.TemplateRenderer(
+            lambda name, value: element(name, ''), ('name', 'value'))
+        self.assertRaises(ValueError, unused.compile)
+
+    def test_renderer_cache(self):
+        cache = render.RendererCache(make_xml_template, SLOTS)
+        thresholds = {'BaseSearch': (3600.0, 7200.0)}
+        first = cache.renderer(thresholds=thresholds)
+        self.assertTrue(cache.renderer(thresholds=dict(thresholds)) is first)
+        self.assertFalse(cache.renderer() is first)
+        self.assertEqual(len(cache), 2)
+
+    def test_render_xml_template(self):
+        for args in VALUES:
+            self.assertEqual(render_xml_template(*args),
+                             ET.tostring(make_xml_template(*args)))
+            self.assertEqual(
+                render.TemplateRenderer(make_xml_template, SLOTS).render(
+                    *args), ET.tostring(make_xml_template(*args)))
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
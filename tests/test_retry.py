@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_retry
+----------------------------------
+
+Tests for `ldap_target_ctl.retry` module.
+"""
+
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import retry
+
+from .clock import FakeClock
+
+TIMEOUT = (1, '', 'Error: Connection to the OMS timed out\n')
+EXPIRED = (1, '', 'Error: Session expired. Run emcli login again.\n')
+OUT_OF_SYNC = (1, '', 'Error: The EM CLI client is out of sync with the '
+               'OMS. Run emcli sync.\n')
+EXISTS = (1, '', 'Target "fake_ldap1_ldap:generic_service" already '
+          'exists\n')
+CREATED = (0, 'Service "fake_ldap1_ldap" created successfully\n', '')
+
+
+class TestClassify(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(retry.classify(*CREATED), None)
+        self.assertEqual(retry.classify(*TIMEOUT), retry.TRANSIENT)
+        self.assertEqual(retry.classify(*EXPIRED), retry.TRANSIENT)
+        self.assertEqual(retry.classify(*EXISTS), retry.PERMANENT)
+        self.assertEqual(retry.classify(1, '', 'Syntax error'),
+                         retry.PERMANENT)
+        # Ordinary errors that merely mention a timeout or a count
+        for message in ('Error: Invalid value for property ldap_timeout',
+                        'Error: Too many targets selected'):
+            self.assertEqual(retry.classify(1, '', message), retry.PERMANENT)
+
+    def test_delay_is_capped(self):
+        policy = retry.RetryPolicy(retries=10, base=1.0, cap=5.0)
+        for attempt in range(10):
+            self.assertTrue(0 <= policy.delay(attempt) <= 5.0)
+
+
+class TestRetryingEmcli(unittest.TestCase):
+
+    def make(self, verb, *responses):
+        """ Returns a FakeOMS answering responses to verb, and a
+            RetryingEmcli of a client of it.
+        """
+
+        self.delays = []
+        oms = fake.FakeOMS(latency_scale=0)
+        oms.script(verb, *responses)
+        return oms, retry.RetryingEmcli(fake.FakeEmcli(oms),
+                                        retry.RetryPolicy(2),
+                                        sleep=self.delays.append)
+
+    def test_retries_transient(self):
+        oms, client = self.make('create_service', TIMEOUT, TIMEOUT, CREATED)
+        self.assertEqual(client.run('create_service'), CREATED)
+        self.assertEqual(oms.calls['create_service'], 3)
+        self.assertEqual(client.retried, 2)
+        self.assertTrue(client.inline_templates)
+
+    def test_gives_up_after_retries(self):
+        oms, client = self.make('create_service', TIMEOUT, TIMEOUT, TIMEOUT,
+                                CREATED)
+        self.assertEqual(client.run('create_service'), TIMEOUT)
+        self.assertEqual(oms.calls['create_service'], 3)
+
+    def test_permanent_not_retried(self):
+        oms, client = self.make('create_service', EXISTS, CREATED)
+        self.assertEqual(client.create_generic_service('x', 't', []),
+                         EXISTS)
+        self.assertEqual(oms.calls['create_service'], 1)
+
+    def test_exists_after_timeout_is_success(self):
+        oms, client = self.make('create_service', TIMEOUT, EXISTS)
+        code, out, err = client.run('create_service')
+        self.assertEqual(code, 0)
+
+    def test_expired_session_logs_in_again(self):
+        oms, client = self.make('sync', EXPIRED, CREATED)
+        self.assertEqual(client.run('sync'), CREATED)
+        self.assertEqual(oms.calls['login'], 1)
+
+    def test_out_of_sync_syncs_again(self):
+        oms, client = self.make('create_service', OUT_OF_SYNC, CREATED)
+        self.assertEqual(client.run('create_service'), CREATED)
+        self.assertEqual((oms.calls['sync'], oms.calls.get('login', 0)),
+                         (1, 0))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_pauses_and_gives_up(self):
+        clock = FakeClock()
+        notices = []
+        breaker = retry.CircuitBreaker(threshold=2, cooldown=10,
+                                       max_trips=2, notify=notices.append,
+                                       clock=clock, sleep=clock.sleep)
+        breaker.wait()
+        breaker.failure()
+        breaker.failure()
+        self.assertEqual(breaker.opened_until, 10)
+        breaker.wait()
+        self.assertEqual(clock.now, 10)
+        # The probe after the pause fails, so the breaker gives up
+        breaker.failure()
+        self.assertTrue(breaker.broken)
+        self.assertRaises(retry.CircuitOpen, breaker.wait)
+        self.assertEqual(len(notices), 2)
+
+    def test_success_closes(self):
+        clock = FakeClock()
+        breaker = retry.CircuitBreaker(threshold=1, cooldown=5,
+                                       clock=clock, sleep=clock.sleep)
+        breaker.failure()
+        breaker.wait()
+        breaker.success()
+        self.assertEqual((breaker.failures, breaker.trips), (0, 0))
+
+    def test_open_breaker_fails_calls(self):
+        clock = FakeClock()
+        breaker = retry.CircuitBreaker(threshold=1, max_trips=1,
+                                       clock=clock, sleep=clock.sleep)
+        oms = fake.FakeOMS(latency_scale=0)
+        oms.script('sync', TIMEOUT, CREATED)
+        client = retry.RetryingEmcli(fake.FakeEmcli(oms),
+                                     retry.RetryPolicy(3), breaker,
+                                     sleep=clock.sleep)
+        self.assertEqual(client.run('sync')[0], 1)
+        self.assertEqual(client.run('sync')[0], 1)
+        self.assertEqual(oms.calls['sync'], 1)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
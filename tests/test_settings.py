@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_settings
+----------------------------------
+
+Tests for `ldap_target_ctl.settings` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ldap_target_ctl import settings
+
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+
+[otes]
+entities = {
+    07: 'Entity Seven',
+    11: 'Entity Eleven'
+    }
+
+beacons = {
+    'POD-E': ['beacon_e1', 'beacon_e2'],
+    }
+"""
+
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_file = os.path.join(self.tmpdir,
+                                        settings.CONFIG_FILE_NAME)
+        with open(self.config_file, 'w') as config:
+            config.write(CONFIG)
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+
+    def test_typed_values(self):
+        config = settings.get_settings()
+        self.assertEqual(config.url, 'https://oms.example.com:7799/em')
+        self.assertEqual(config.beacons['POD-E'], ('beacon_e1', 'beacon_e2'))
+        self.assertEqual(config.entities[11], 'Entity Eleven')
+
+    def test_inventory_path(self):
+        # Nothing is written unless the config file asks for it
+        config = settings.get_settings()
+        self.assertEqual((config.inventory, config.state_file), (None, None))
+        with open(self.config_file, 'a') as config_file:
+            config_file.write('\n[inventory]\npath = inventory.db\n')
+        config = settings.load_settings(self.config_file)
+        self.assertEqual(config.inventory,
+                         os.path.join(self.tmpdir, 'inventory.db'))
+        with open(self.config_file, 'w') as config_file:
+            config_file.write(CONFIG + '\n[inventory]\npath =\n')
+        self.assertEqual(settings.load_settings(self.config_file).inventory,
+                         None)
+
+    def test_cached_until_mtime_changes(self):
+        first = settings.get_settings()
+        self.assertTrue(settings.get_settings() is first)
+        with open(self.config_file, 'a') as config:
+            config.write('\n[extra]\nkey = value\n')
+        os.utime(self.config_file, (first.mtime + 10, first.mtime + 10))
+        second = settings.get_settings()
+        self.assertFalse(second is first)
+        self.assertEqual(second.parser.get('extra', 'key'), 'value')
+
+    def test_oms_sections(self):
+        config = settings.get_settings()
+        self.assertEqual(list(config.oms), [settings.DEFAULT_OMS])
+        self.assertEqual(config.oms_for_pod('POD-E').url, config.url)
+        with open(self.config_file, 'a') as config_file:
+            config_file.write('\n[oem:emea]\n'
+                              'url = https://oms-emea.example.com/em\n'
+                              'jobs = 4\npods = POD-F, POD-G\n')
+        config = settings.load_settings(self.config_file)
+        self.assertEqual(list(config.oms), [settings.DEFAULT_OMS, 'emea'])
+        emea = config.oms_for_pod('POD-G')
+        self.assertEqual((emea.name, emea.url, emea.jobs, emea.pods),
+                         ('emea', 'https://oms-emea.example.com/em', 4,
+                          ('POD-F', 'POD-G')))
+        self.assertEqual(emea.state_file, config.state_file)
+        self.assertEqual(config.oms_for_pod('POD-E').name,
+                         settings.DEFAULT_OMS)
+        with open(self.config_file, 'a') as config_file:
+            config_file.write('\n[oem:apac]\nurl = https://oms-apac/em\n'
+                              'pods = POD-F\n')
+        self.assertRaises(ValueError, settings.load_settings,
+                          self.config_file)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
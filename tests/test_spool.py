@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_spool
+----------------------------------
+
+Tests for `ldap_target_ctl.spool` module.
+"""
+
+import os
+import threading
+import unittest
+
+from ldap_target_ctl import fake
+from ldap_target_ctl import spool
+
+
+class TestTemplateSpool(unittest.TestCase):
+
+    def test_slot_reused_per_thread(self):
+        with spool.TemplateSpool() as templates:
+            first = templates.write('<a>' * 10)
+            second = templates.write('<b/>')
+            self.assertEqual(first, second)
+            self.assertEqual(open(second).read(), '<b/>')
+            self.assertEqual(oct(os.stat(second).st_mode & 0777), '0600')
+
+            paths = []
+            thread = threading.Thread(
+                target=lambda: paths.append(templates.write('<c/>')))
+            thread.start()
+            thread.join()
+            self.assertNotEqual(paths[0], second)
+            self.assertEqual(len(os.listdir(templates.path)), 2)
+        self.assertFalse(os.path.exists(templates.path))
+
+    def test_inline_backend_skips_disk(self):
+        emcli = fake.FakeEmcli(fake.FakeOMS())
+        with spool.TemplateSpool() as templates:
+            self.assertEqual(templates.stage('<a/>', emcli), '<a/>')
+            self.assertEqual(os.listdir(templates.path), [])
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
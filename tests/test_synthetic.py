@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_synthetic
+----------------------------------
+
+Tests for `ldap_target_ctl.synthetic` module and the search, compare and
+filter encoding in `ldap_target_ctl.ber`.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import ldap_target_ctl
+from ldap_target_ctl import ber
+from ldap_target_ctl import probe
+from ldap_target_ctl import synthetic
+
+from .ldap_server import LDAPServer, matches
+from .test_probe import closed_port
+
+USER = 'cn=oem_monitor,cn=Users,dc=example,dc=com'
+BASE = 'cn=oem_auth,cn=Users,dc=example,dc=com'
+ENTRIES = {
+    'cn=Users,dc=example,dc=com': {'objectClass': ['container'],
+                                   'cn': ['Users']},
+    BASE: {'objectClass': ['person'], 'cn': ['oem_auth'],
+           'uid': ['Obiee_Auth']},
+    USER: {'objectClass': ['person'], 'cn': ['oem_monitor']}}
+
+
+class TestFilters(unittest.TestCase):
+
+    def test_encoding(self):
+        self.assertEqual(ber.search_filter('cn=x'),
+                         ber.search_filter('(cn=x)'))
+        entry = ENTRIES[BASE]
+        for text, expected in (('(objectClass=*)', True),
+                               ('(uid=obiee_auth)', True),
+                               ('(uid=Obiee*)', True),
+                               ('(uid=*_Au*)', True),
+                               ('(uid=*bee)', False),
+                               ('(&(cn=oem_auth)(!(uid=x)))', True),
+                               ('(|(cn=x)(cn=y))', False),
+                               ('(cn=oem\\5fauth)', True)):
+            self.assertEqual(matches(entry, ber.search_filter(text)),
+                             expected, text)
+        self.assertEqual(ber.escape_filter_value('a*(b)'), 'a\\2a\\28b\\29')
+        for text in ('(cn=x', '(cn=x))', '(!(a=1)(b=2))', '(nope)',
+                     '(cn=\\zz)'):
+            self.assertRaises(ber.BERError, ber.search_filter, text)
+
+
+class TestLDAPTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LDAPServer({USER: 'welcome1'},
+                                 entries=dict(ENTRIES)).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def check(self, **options):
+        values = dict(ldap_password='welcome1', ldap_base=BASE,
+                      ldap_filter='cn=oem_auth', ldap_attrvalue='Obiee_Auth',
+                      timeout=2)
+        values.update(options)
+        test = synthetic.LDAPTest('127.0.0.1', self.server.port, USER,
+                                  **values)
+        probe.run([test])
+        return test
+
+    def test_transaction(self):
+        test = self.check()
+        self.assertTrue(test.ok, test.error)
+        self.assertEqual(sorted(test.metrics), sorted(synthetic.COLUMNS))
+        self.assertEqual(test.metrics['status'], 1)
+        self.assertTrue(test.metrics['ConnectionTime'] >=
+                        1000 * test.timings['connect'])
+        self.assertEqual((self.server.binds, self.server.searches,
+                          self.server.compares), (1, 3, 1))
+
+    def test_failures(self):
+        test = self.check(ldap_password='wrong')
+        self.assertEqual(test.metrics, {'status': 0})
+        self.assertTrue(test.error.startswith(
+            'bind failed with LDAP result code 49'))
+
+        test = self.check(ldap_base='cn=gone,dc=example,dc=com')
+        self.assertEqual(test.error, 'BaseSearch failed with LDAP result '
+                         'code 32: No such object')
+        self.assertEqual(test.metrics['status'], 0)
+        self.assertTrue('ConnectionTime' in test.metrics)
+
+        test = self.check(ldap_attrvalue='Someone_Else')
+        self.assertEqual(test.error, 'CompareOp: uid of {} is not '
+                         'Someone_Else'.format(BASE))
+        self.assertTrue('MessagingSearch' in test.metrics)
+        self.assertFalse('CompareOp' in test.metrics)
+
+        self.server.delay = 1.0
+        test = self.check(timeout=0.2)
+        self.assertEqual(test.error, 'bind: timed out after 0.2s')
+
+    def test_many_hosts(self):
+        down = closed_port()
+        targets = [('127.0.0.1', self.server.port, BASE, 'cn=oem_auth')] * 3
+        targets += [('127.0.0.1', down, BASE, 'cn=oem_auth')]
+        tests = synthetic.check_hosts(targets * 50, USER, 'welcome1',
+                                      'Obiee_Auth', timeout=5)
+        self.assertEqual(len(tests), 2)
+        self.assertEqual([test.metrics['status'] for test in tests], [1, 0])
+        tests = [synthetic.LDAPTest('127.0.0.1', self.server.port, USER,
+                                    'welcome1', BASE, 'cn=oem_auth',
+                                    'Obiee_Auth', timeout=5)
+                 for _ in range(100)]
+        probe.run(tests, concurrency=25)
+        self.assertTrue(all(test.metrics['status'] == 1 for test in tests))
+
+
+class TestThresholds(unittest.TestCase):
+
+    def setUp(self):
+        self.thresholds = synthetic.template_thresholds(
+            ldap_target_ctl.make_xml_template(USER, 'welcome1', 'ldap1',
+                                              '389', BASE, 'cn=x', 'a'))
+
+    def test_template_thresholds(self):
+        self.assertEqual(sorted(self.thresholds), sorted(synthetic.COLUMNS))
+        self.assertEqual(self.thresholds['BaseSearch']['critical_threshold'],
+                         '4000.0')
+
+    def test_evaluate(self):
+        metrics = {'ConnectionTime': 12.0, 'BaseSearch': 2500.0,
+                   'AddressingSearch': 4000.5, 'status': 1}
+        self.assertEqual(
+            synthetic.evaluate(metrics, self.thresholds),
+            [('BaseSearch', synthetic.WARNING, 2500.0, '>', 2000.0),
+             ('AddressingSearch', synthetic.CRITICAL, 4000.5, '>', 4000.0)])
+        self.assertEqual(synthetic.evaluate({'status': 0}, self.thresholds),
+                         [('status', synthetic.CRITICAL, 0, '=', 0.0)])
+
+
+class TestCheckMode(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LDAPServer({USER: 'welcome1'},
+                                 entries=dict(ENTRIES)).start()
+        self.tmpdir = tempfile.mkdtemp()
+        self.batch_file = os.path.join(self.tmpdir, 'batch.csv')
+        with open(self.batch_file, 'w') as batch:
+            batch.write('ldap_host,ldap_port,pod,ldap_base\n')
+            batch.write('127.0.0.1,{},POD-E,\n'.format(self.server.port))
+            batch.write('127.0.0.1,{},POD-E,cn=gone\n'.format(
+                self.server.port))
+        self.stdout = sys.stdout
+        sys.stdout = StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_check(self):
+        code = ldap_target_ctl.check_ldap_targets(
+            self.batch_file, USER, 'welcome1', BASE, 'cn=oem_auth',
+            'Obiee_Auth', timeout=2)
+        output = sys.stdout.getvalue()
+        self.assertEqual(code, 1)
+        self.assertTrue('status=1' in output)
+        self.assertTrue('CRITICAL status 0 = 0' in output)
+        self.assertTrue(output.endswith(
+            '2 host(s) checked: 1 ok, 0 warning, 1 critical\n'))
+
+    def test_arguments(self):
+        args = ldap_target_ctl.get_arguments(['check', '-F', 'batch.txt',
+                                              '--timeout', '10'])
+        self.assertEqual((args.mode, args.timeout, args.concurrency),
+                         ('check', 10.0, probe.DEFAULT_CONCURRENCY))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
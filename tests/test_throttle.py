@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_throttle
+----------------------------------
+
+Tests for `ldap_target_ctl.throttle` module.
+"""
+
+import time
+import threading
+import unittest
+
+from ldap_target_ctl import retry
+from ldap_target_ctl import throttle
+
+from .clock import FakeClock
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_additive_increase_up_to_ceiling(self):
+        limiter = throttle.AdaptiveLimiter(2, ceiling=4)
+        for _ in range(100):
+            limiter.observe('create_service', 1.0)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.high, 4)
+
+    def test_slow_calls_halve_once_per_cooldown(self):
+        clock = FakeClock()
+        limiter = throttle.AdaptiveLimiter(8, ceiling=8, cooldown=5,
+                                           clock=clock)
+        limiter.observe('create_service', 1.0)
+        for _ in range(10):
+            limiter.observe('create_service', 20.0)
+        self.assertEqual(limiter.limit, 4)
+        clock.now = 6
+        limiter.observe('create_service', 20.0)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_fast_first_call_does_not_pin_the_limit(self):
+        limiter = throttle.AdaptiveLimiter(8, ceiling=8,
+                                           clock=FakeClock())
+        limiter.observe('create_service', 0.1)
+        for _ in range(200):
+            limiter.observe('create_service', 1.0)
+        self.assertEqual(limiter.low, 4)
+        self.assertEqual(limiter.limit, 8)
+        stats = limiter.verbs['create_service']
+        self.assertLess(stats.smoothed, stats.best * limiter.tolerance)
+
+    def test_transient_errors_decrease_permanent_do_not(self):
+        limiter = throttle.AdaptiveLimiter(8, ceiling=8)
+        limiter.observe('create_service', 1.0, retry.PERMANENT)
+        self.assertEqual(limiter.limit, 8)
+        limiter.observe('create_service', 1.0, retry.TRANSIENT)
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.verbs['create_service'].errors, 2)
+
+    def test_fixed_limit(self):
+        limiter = throttle.AdaptiveLimiter(3, ceiling=3, adaptive=False)
+        limiter.observe('sync', 1.0, retry.TRANSIENT)
+        self.assertEqual(limiter.limit, 3)
+
+    def test_pod_cap(self):
+        limiter = throttle.AdaptiveLimiter(4, ceiling=4, pod_cap=1)
+        peak = {'POD-A': 0}
+        running = {'POD-A': 0}
+        lock = threading.Lock()
+
+        def work():
+            with limiter.slot('POD-A'):
+                with lock:
+                    running['POD-A'] += 1
+                    peak['POD-A'] = max(peak['POD-A'], running['POD-A'])
+                time.sleep(0.01)
+                with lock:
+                    running['POD-A'] -= 1
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        with limiter.slot('POD-B'):
+            self.assertEqual(limiter.pods['POD-B'], 1)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak['POD-A'], 1)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestMeteredEmcli(unittest.TestCase):
+
+    def test_reports_verbs(self):
+        class Emcli(object):
+            inline_templates = True
+
+            def run(self, verb, **options):
+                return 1, '', 'Error: OMS is busy'
+
+        limiter = throttle.AdaptiveLimiter(4, ceiling=4)
+        emcli = throttle.MeteredEmcli(Emcli(), limiter)
+        emcli.run('create_service', name='x')
+        self.assertEqual(limiter.verbs['create_service'].errors, 1)
+        self.assertEqual(limiter.limit, 2)
+        self.assertTrue(emcli.inline_templates)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())
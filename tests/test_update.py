@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+test_update
+----------------------------------
+
+Tests for `ldap_target_ctl.update` module and update runs.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ldap_target_ctl
+from ldap_target_ctl import fake
+from ldap_target_ctl import update
+from ldap_target_ctl import settings
+from ldap_target_ctl import reconcile
+from ldap_target_ctl import calibrate
+
+CONFIG = """[oem]
+url = https://oms.example.com:7799/em
+state_file = emcli_state.json
+
+[otes]
+entities = {11: 'Entity Eleven'}
+beacons = {'POD-E': ['beacon_e1']}
+
+[fake]
+latency_scale = 0
+
+[inventory]
+path = inventory.db
+"""
+
+LDAP = ('cn=orcladmin', 'cn=Users', 'cn=x', 'cn')
+HASH = update.HASH_PROPERTY
+
+
+class TestTemplateHash(unittest.TestCase):
+
+    def test_digest_hides_password(self):
+        url = 'https://oms.example.com:7799/em'
+        digest = update.password_digest('welcome1', url)
+        self.assertEqual(len(digest), 64)
+        self.assertFalse('welcome1' in digest)
+        self.assertNotEqual(digest, update.password_digest('welcome2', url))
+        self.assertEqual(digest, update.password_digest(u'welcome1', url))
+        # Another install's digest of the same password differs
+        self.assertNotEqual(digest, update.password_digest(
+            'welcome1', 'https://oms2.example.com:7799/em'))
+
+    def test_differs(self):
+        desired = update.template_hash('<xml/>')
+        self.assertTrue(desired.startswith(update.HASH_PREFIX))
+        snapshot = reconcile.Snapshot({'a_ldap': {HASH: desired},
+                                       'b_ldap': {}})
+        self.assertFalse(update.differs(snapshot, 'a_ldap', desired, HASH))
+        self.assertTrue(update.differs(snapshot, 'b_ldap', desired, HASH))
+        self.assertEqual(update.differs(snapshot, 'c_ldap', desired, HASH),
+                         None)
+
+
+class TestUpdateRun(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, settings.CONFIG_FILE_NAME),
+                  'w') as config:
+            config.write(CONFIG)
+        self.batch_file = os.path.join(self.tmpdir, 'batch.csv')
+        self.write_batch()
+        os.chdir(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+        self.assertEqual(ldap_target_ctl.add_batch_ldap_targets(
+            self.batch_file, LDAP[0], 'welcome1', LDAP[1], LDAP[2],
+            LDAP[3], 'Production', 11, 'OID', 'sysman', 'welcome1', jobs=4,
+            backend='fake'), 0)
+        self.oms = fake.shared_oms()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        settings.clear_settings()
+        fake.set_shared_oms(None)
+
+    def write_batch(self, ldap_filter=''):
+        with open(self.batch_file, 'w') as batch:
+            batch.write('ldap_host,ldap_port,pod,ldap_filter\n')
+            for number in range(6):
+                batch.write('fake_ldap{},3060,POD-E,{}\n'.format(
+                    number, ldap_filter if number == 2 else ''))
+
+    def update(self, password, **options):
+        self.oms.calls.pop('apply_template_tests', None)
+        self.assertEqual(ldap_target_ctl.update_ldap_targets(
+            self.batch_file, LDAP[0], password, LDAP[1], LDAP[2], LDAP[3],
+            'sysman', 'welcome1', jobs=4, backend='fake', **options), 0)
+        return self.oms.calls.get('apply_template_tests', 0)
+
+    def test_only_changed_targets_are_pushed(self):
+        # The hashes set when the targets were created are current
+        self.assertEqual(self.oms.properties['generic_service'],
+                         set([HASH]))
+        self.assertEqual(self.update('welcome1'), 0)
+        # A target without a hash is pushed
+        del self.oms.targets['fake_ldap0_ldap']['properties'][HASH]
+        self.assertEqual(self.update('welcome1'), 1)
+        self.assertEqual(self.update('welcome1'), 0)
+        self.assertEqual(self.update('rotated1', dry_run=True), 0)
+        self.assertEqual(self.update('rotated1'), 6)
+        self.assertTrue('rotated1' in
+                        self.oms.targets['fake_ldap0_ldap']['template'])
+        self.write_batch('cn=y')
+        self.assertEqual(self.update('rotated1'), 1)
+        self.assertEqual(self.update('rotated1', force=True), 6)
+        for target in self.oms.targets.values():
+            self.assertFalse('rotated1' in target['properties'][HASH])
+            self.assertFalse('Comment' in target['properties'])
+
+    def test_calibrated_thresholds_are_pushed(self):
+        self.update('welcome1')
+        thresholds_file = os.path.join(self.tmpdir, 'thresholds.json')
+        calibrate.save_thresholds(thresholds_file, {
+            'fake_ldap1_ldap': {'thresholds': {'BaseSearch': (700, 1400)},
+                                'beacon_thresholds': {}}})
+        self.assertEqual(self.update('welcome1',
+                                     thresholds_file=thresholds_file), 1)
+        template = self.oms.targets['fake_ldap1_ldap']['template']
+        self.assertTrue('critical_threshold="1400.0"' in template)
+        self.assertEqual(self.update('welcome1',
+                                     thresholds_file=thresholds_file), 0)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(unittest.main())